@@ -0,0 +1,159 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+
+import totals
+
+
+# Year-end snapshots. Every snapshot is one `archive` row whose `data` column
+# holds the houses as ready-to-send JSON, plus one archive_houses row per house
+# for queries like diffs. Like totals.py, everything runs on the caller's
+# connection and transaction.
+
+def create_snapshot(connection):
+    """Snapshot the current standings and return (archive id, houses).
+
+    The houses are totals.house_standings(), as /api/housestandings shows them.
+    """
+    houses = totals.house_standings(connection)
+    archive_id = connection.execute(text("""
+        INSERT INTO archive (data, studentammount, timestamp)
+        SELECT :data, COUNT(*), CURRENT_TIMESTAMP FROM students
+    """), {'data': houses_data(houses)}).lastrowid
+    if houses:
+        connection.execute(text("""
+            INSERT INTO archive_houses (archive_id, house_id, house_name, total_points, student_count, house_rank)
+            VALUES (:archive_id, :house_id, :house_name, :total_points, :student_count, :rank)
+        """), [dict(house, archive_id=archive_id) for house in houses])
+    return archive_id, houses
+
+
+def houses_data(houses):
+    # archive_page() sends the stored text as is, so it must always be a JSON list
+    if not isinstance(houses, list):
+        raise ValueError(f"archive data must be a list of houses, not {type(houses).__name__}")
+    return json.dumps(houses)
+
+
+def snapshot_houses(connection, archive_id):
+    result = connection.execute(text("""
+        SELECT house_id, house_name, total_points, student_count, house_rank FROM archive_houses
+        WHERE archive_id = :archive_id ORDER BY house_rank, house_id
+    """), {'archive_id': archive_id})
+    return [{
+        'house_id': row[0],
+        'house_name': row[1],
+        'total_points': int(row[2]),
+        'student_count': int(row[3]) if row[3] is not None else None,
+        'rank': int(row[4]),
+    } for row in result]
+
+
+def backfill_archive_houses(connection):
+    """Fill archive_houses from the JSON of archives made before the table existed."""
+    rows = []
+    for archive_id, data in connection.execute(text("SELECT id, data FROM archive")):
+        try:
+            houses = json.loads(data) if data else []
+        except ValueError:
+            continue
+        houses = [house for house in houses if isinstance(house, dict) and house.get('house_id') is not None]
+        ordered = sorted(houses, key=lambda house: -float(house.get('total_points') or 0))
+        for idx, house in enumerate(ordered):
+            points = float(house.get('total_points') or 0)
+            rank = rows[-1]['house_rank'] if idx and float(ordered[idx - 1].get('total_points') or 0) == points else idx + 1
+            rows.append({
+                'archive_id': archive_id,
+                'house_id': house.get('house_id'),
+                'house_name': house.get('house_name'),
+                'total_points': int(points),
+                'student_count': None,
+                'house_rank': rank,
+            })
+    if rows:
+        connection.execute(text("""
+            INSERT INTO archive_houses (archive_id, house_id, house_name, total_points, student_count, house_rank)
+            VALUES (:archive_id, :house_id, :house_name, :total_points, :student_count, :house_rank)
+        """), rows)
+    return len(rows)
+
+
+def repair_archive_data(connection):
+    """Replace `data` that isn't a JSON list (legacy rows) with the archive's archive_houses rows; returns the repaired ids."""
+    repaired = []
+    for archive_id, data in connection.execute(text("SELECT id, data FROM archive")).fetchall():
+        try:
+            if isinstance(json.loads(data), list):
+                continue
+        except (TypeError, ValueError):
+            pass
+        connection.execute(text("UPDATE archive SET data = :data WHERE id = :archive_id"),
+                           {'data': houses_data(snapshot_houses(connection, archive_id)), 'archive_id': archive_id})
+        repaired.append(archive_id)
+    return repaired
+
+
+def _format_timestamp(value):
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    # SQLite hands back the stored text, already in this format
+    return str(value)[:19] if value else None
+
+
+def archive_page(connection, limit=None, cursor=None):
+    """Archives newest first as JSON text, and the cursor of the next page.
+
+    The stored `data` blob is spliced into the output as is, without parsing
+    it: create_snapshot() only writes JSON lists, and migration 7 repaired
+    the legacy rows that weren't.
+    """
+    query = "SELECT id, timestamp, data, studentammount FROM archive"
+    params = {}
+    if cursor is not None:
+        query += " WHERE id < :cursor"
+        params['cursor'] = cursor
+    query += " ORDER BY id DESC"
+    if limit is not None:
+        query += " LIMIT :limit"
+        params['limit'] = limit + 1
+    rows = connection.execute(text(query), params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0]
+    entries = [
+        '{"id": %d, "timestamp": %s, "houses": %s, "student_count": %s}'
+        % (row[0], json.dumps(_format_timestamp(row[1])), row[2], json.dumps(row[3]))
+        for row in rows
+    ]
+    return '[' + ', '.join(entries) + ']', next_cursor
+
+
+def archive_info(connection, archive_id):
+    row = connection.execute(text("SELECT id, timestamp, studentammount FROM archive WHERE id = :archive_id"), {'archive_id': archive_id}).fetchone()
+    if not row:
+        return None
+    return {'id': row[0], 'timestamp': _format_timestamp(row[1]), 'student_count': row[2]}
+
+
+def diff_houses(before, after):
+    """Per house change between two lists of snapshot houses (matched by house_id)."""
+    before_by_id = {house['house_id']: house for house in before}
+    after_by_id = {house['house_id']: house for house in after}
+    diff = []
+    for house_id in sorted(set(before_by_id) | set(after_by_id)):
+        old, new = before_by_id.get(house_id, {}), after_by_id.get(house_id, {})
+        points_before, points_after = old.get('total_points'), new.get('total_points')
+        diff.append({
+            'house_id': house_id,
+            'house_name': new.get('house_name', old.get('house_name')),
+            'points_before': points_before,
+            'points_after': points_after,
+            'delta': (points_after or 0) - (points_before or 0),
+            'rank_before': old.get('rank'),
+            'rank_after': new.get('rank'),
+            'students_before': old.get('student_count'),
+            'students_after': new.get('student_count'),
+        })
+    return sorted(diff, key=lambda house: (house['rank_after'] is None, house['rank_after'] or 0))
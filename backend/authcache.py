@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy import text
+
+
+AuthUser = namedtuple('AuthUser', ['id', 'name', 'email', 'admin'])
+
+
+class TokenCache:
+    """LRU cache of token -> AuthUser where every entry expires after `ttl` seconds.
+
+    Only valid tokens are cached. Entries have to be invalidated whenever a
+    user's token, name, email or admin flag changes. With an engine, that also
+    bumps data_version.auth_version, and every worker drops its whole cache
+    when it sees the version move (re-read at most every `poll_interval`
+    seconds), so a deleted or demoted user loses access everywhere within
+    about that time instead of `ttl`.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, engine=None, poll_interval=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._polled_at = None
+
+    def _adopt(self, version):
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._polled_at = time.monotonic()
+
+    def version(self):
+        """The shared auth version, re-read from the database at most every `poll_interval` seconds."""
+        if self.engine is not None and (self._polled_at is None or time.monotonic() - self._polled_at > self.poll_interval):
+            try:
+                with self.engine.connect() as connection:
+                    self._adopt(connection.execute(text("SELECT auth_version FROM data_version WHERE id = 1")).scalar())
+            except Exception as e:
+                # Without the column (init-db not run) only this worker's own invalidations are seen
+                print(f"Auth cache version poll failed: {e}")
+                self._polled_at = time.monotonic()
+        return self._version
+
+    def _bump(self):
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(text("UPDATE data_version SET auth_version = auth_version + 1 WHERE id = 1"))
+                self._adopt(connection.execute(text("SELECT auth_version FROM data_version WHERE id = 1")).scalar())
+        except Exception as e:
+            print(f"Auth cache version bump failed: {e}")
+
+    def get(self, token):
+        self.version()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def set(self, token, user, version=None):
+        """Cache a user read from the database; `version` is version() from before the read."""
+        with self._lock:
+            # Another worker changed a user while we were reading it; don't cache what may be the old row
+            if version != self._version:
+                return
+            self._entries[token] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def invalidate_user(self, user_id):
+        """Forget a user here and, through auth_version, in every other worker; call after the change is committed."""
+        with self._lock:
+            for token in [token for token, (_, user) in self._entries.items() if str(user.id) == str(user_id)]:
+                del self._entries[token]
+        if self.engine is not None:
+            self._bump()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'version': self._version}
@@ -0,0 +1,62 @@
+"""Requests per second and tail latency of /api/awardpoints and /api/getstudents per gunicorn mode.
+
+Each mode starts gunicorn with gunicorn.conf.py and the given worker class, then
+drives concurrent keep-alive HTTP clients against one endpoint at a time. Against
+the generated SQLite database writes serialise on the file lock, so point
+--database-url at a MariaDB copy (with the tables already created) for numbers
+that mean something for production.
+
+Run from backend/:  python -m benchmarks.bench_modes --modes sync,gevent --workers 2 --concurrency 32
+"""
+import argparse
+import json
+import random
+
+from benchmarks.http_load import GunicornServer, run_load
+from benchmarks.seed import create_database, teacher_token
+
+
+def scenarios(students, teachers):
+    def award_points(client, i):
+        teacher = client % teachers + 1
+        body = {'studentId': random.randint(1, students), 'points': 1, 'reason': 'load test'}
+        return 'POST', '/api/awardpoints', {'Authorization': f'Bearer {teacher_token(teacher)}'}, body
+
+    def get_students(client, i):
+        # A page of a class list, the read the teachers' screens make all day
+        return 'GET', f'/api/getstudents?limit=100&teacher={client % teachers + 1}', {'Authorization': f'Bearer {teacher_token(1)}'}, None
+
+    return {'awardpoints': award_points, 'getstudents': get_students}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='sync,gevent', help='comma separated gunicorn worker classes')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--database-url', help='benchmark this database instead of a generated SQLite file')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    database_url = args.database_url or create_database(students=args.students, teachers=args.teachers)
+    results = {}
+    for mode in args.modes.split(','):
+        env = {'DATABASE_URL': database_url, 'GUNICORN_WORKER_CLASS': mode, 'WEB_CONCURRENCY': str(args.workers)}
+        results[mode] = {}
+        with GunicornServer(args.port, env) as server:
+            for name, make_request in scenarios(args.students, args.teachers).items():
+                result = run_load(server.url, make_request, args.concurrency, args.seconds)
+                results[mode][name] = result
+                print(f"{mode:>8} {name:>12}: {result['requests_per_second']:>8} req/s  "
+                      f"p50 {result['p50_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'workers': args.workers, 'concurrency': args.concurrency, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
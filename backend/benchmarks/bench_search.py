@@ -0,0 +1,94 @@
+"""Student search latency: old LIKE '%q%' scan vs. the n-gram SearchIndex, by table size.
+
+Run from backend/:  python -m benchmarks.bench_search --sizes 1000,10000,50000
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+
+from search import SearchIndex
+from benchmarks.seed import FIRST_NAMES, LAST_NAMES, create_database
+
+
+LIKE_QUERY = text("SELECT id, first_name as name FROM students WHERE LOWER(first_name) LIKE :query OR LOWER(last_name) LIKE :query")
+
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+def _summary(samples):
+    return {
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p95_ms': round(_percentile(samples, 95) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+    }
+
+
+def run(size, queries, limit):
+    url = create_database(students=size)
+    engine = create_engine(url)
+
+    def load():
+        with engine.connect() as connection:
+            for row in connection.execute(text("SELECT id, first_name, last_name FROM students")):
+                yield row[0], {'id': row[0], 'name': f'{row[1]} {row[2]}'}
+
+    index = SearchIndex(load, ['name'], ttl=3600)
+    started = time.perf_counter()
+    index.reload()
+    build_seconds = time.perf_counter() - started
+
+    like, indexed = [], []
+    with engine.connect() as connection:
+        for query in queries:
+            started = time.perf_counter()
+            connection.execute(LIKE_QUERY, {'query': f'%{query}%'}).fetchall()
+            like.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            index.search(query, limit)
+            indexed.append(time.perf_counter() - started)
+    engine.dispose()
+    return {
+        'students': size,
+        'index_build_ms': round(build_seconds * 1000, 1),
+        'like_scan': _summary(like),
+        'ngram_index': _summary(indexed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    names = [name.lower() for name in FIRST_NAMES + LAST_NAMES]
+    # What a user types while searching: 1-5 characters from the start or middle of a name
+    queries = []
+    for _ in range(args.queries):
+        name = rng.choice(names)
+        start = rng.choice([0, 0, rng.randint(0, len(name) - 1)])
+        queries.append(name[start:start + rng.randint(1, 5)])
+
+    results = [run(int(size), queries, args.limit) for size in args.sizes.split(',')]
+    print(f"{'students':>9} {'build ms':>9} {'LIKE p50':>9} {'LIKE p95':>9} {'index p50':>10} {'index p95':>10}")
+    for result in results:
+        print(f"{result['students']:>9} {result['index_build_ms']:>9} {result['like_scan']['p50_ms']:>9} {result['like_scan']['p95_ms']:>9} "
+              f"{result['ngram_index']['p50_ms']:>10} {result['ngram_index']['p95_ms']:>10}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
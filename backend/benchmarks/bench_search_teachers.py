@@ -0,0 +1,62 @@
+"""Throughput of /search_teachers on one sync worker, with and without the old 300 ms delay.
+
+The "delayed" run turns on the dev latency simulation for search_teachers (what
+the endpoint used to do unconditionally), the "direct" run is what production
+serves now.
+
+Run from backend/:  python -m benchmarks.bench_search_teachers --seconds 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+from benchmarks.seed import LAST_NAMES, create_database, teacher_token
+
+
+def measure(client, queries, seconds):
+    latencies = []
+    headers = {'Authorization': f'Bearer {teacher_token(1)}'}
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = client.get('/search_teachers', query_string={'query': random.choice(queries)}, headers=headers)
+        assert response.status_code == 200, response.status_code
+        latencies.append(time.perf_counter() - started)
+    elapsed = sum(latencies)
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--teachers', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = create_database(students=100, teachers=args.teachers)
+    os.environ['SIMULATE_LATENCY'] = 'search_teachers=300'
+    import main as backend
+
+    client = backend.app.test_client()
+    queries = [name.lower()[:n] for name in LAST_NAMES for n in (1, 2, 3)]
+    results = {}
+    for mode, debug in (('delayed', True), ('direct', False)):
+        backend.app.debug = debug
+        results[mode] = measure(client, queries, args.seconds)
+        print(f"{mode:>8}: {results[mode]['requests_per_second']:>8} req/s  p50 {results[mode]['p50_ms']} ms")
+    backend.log_sink.close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Per-request overhead of Sentry tracing and profiling at each setting.
+
+Every setting runs in its own process (the SDK is process global) against the
+same generated SQLite database, through the Flask test client. Settings with a
+DSN use a fake one and a transport that only counts envelopes, so nothing
+leaves the machine.
+
+Run from backend/:  python -m benchmarks.bench_sentry --requests 2000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.http_load import summarize
+from benchmarks.seed import create_database, teacher_token
+
+
+FAKE_DSN = 'https://public@sentry.invalid/1'
+
+SETTINGS = {
+    'off': {},
+    'sampled': {'SENTRY_DSN': FAKE_DSN},
+    'trace_all': {'SENTRY_DSN': FAKE_DSN, 'SENTRY_TRACES_READ_RATE': '1', 'SENTRY_TRACES_WRITE_RATE': '1'},
+    'trace_all_profiled': {'SENTRY_DSN': FAKE_DSN, 'SENTRY_TRACES_READ_RATE': '1', 'SENTRY_TRACES_WRITE_RATE': '1',
+                           'SENTRY_PROFILING': 'continuous'},
+}
+SENTRY_VARIABLES = ('SENTRY_DSN', 'SENTRY_TRACES_RATES', 'SENTRY_TRACES_READ_RATE', 'SENTRY_TRACES_WRITE_RATE',
+                    'SENTRY_PROFILING', 'SENTRY_PROFILE_SESSION_SAMPLE_RATE')
+
+
+def run_setting(setting, requests, students):
+    import sentry_sdk
+    from sentry_sdk.transport import Transport
+
+    import main as backend
+    from schema import init_db
+    from tracing import sentry_options, start_profiler_if_continuous
+
+    class CountingTransport(Transport):
+        envelopes = 0
+
+        def capture_envelope(self, envelope):
+            CountingTransport.envelopes += 1
+
+    if os.getenv('SENTRY_DSN'):
+        sentry_sdk.init(transport=CountingTransport(), **sentry_options(
+            backend.app, always=backend.ADMIN_MUTATIONS, never=backend.UNTRACED_ENDPOINTS))
+        start_profiler_if_continuous()
+    init_db(backend.engine)
+
+    rng = random.Random(1)
+    client = backend.app.test_client()
+    headers = {'Authorization': f'Bearer {teacher_token(2)}'}
+
+    def one_request(i):
+        kind = i % 4
+        if kind == 0:
+            return client.post('/api/awardpoints', headers=headers,
+                               json={'studentId': rng.randint(1, students), 'points': 1, 'reason': 'bench'})
+        if kind == 1:
+            response = client.get('/api/getstudents?limit=50', headers=headers)
+            response.get_data()
+            return response
+        if kind == 2:
+            return client.get('/api/search_users?query=' + rng.choice(['an', 'el', 'mei', 'k']), headers=headers)
+        return client.get('/api/housestandings')
+
+    for i in range(200):
+        one_request(i)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(requests):
+        request_started = time.perf_counter()
+        response = one_request(i)
+        if response.status_code < 400:
+            latencies.append(time.perf_counter() - request_started)
+        else:
+            errors += 1
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    result['mean_us'] = round(sum(latencies) / len(latencies) * 1e6, 1) if latencies else None
+    sentry_sdk.flush()
+    result['envelopes'] = CountingTransport.envelopes
+    backend.log_sink.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--settings', default=','.join(SETTINGS))
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_setting(args.child, args.requests, args.students)))
+        return
+
+    database_url = create_database(students=args.students)
+    results = {}
+    for setting in args.settings.split(','):
+        env = {key: value for key, value in os.environ.items() if key not in SENTRY_VARIABLES}
+        env.update(SETTINGS[setting], DATABASE_URL=database_url)
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_sentry', '--child', setting,
+             '--requests', str(args.requests), '--students', str(args.students)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        results[setting] = json.loads(output.strip().splitlines()[-1])
+    baseline = results.get('off', {}).get('mean_us')
+    for setting, result in results.items():
+        if baseline:
+            result['overhead_us'] = round(result['mean_us'] - baseline, 1)
+        print(f"{setting:>20}: mean {result['mean_us']} us  p99 {result['p99_ms']} ms  "
+              f"overhead {result.get('overhead_us')} us/request  envelopes {result['envelopes']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
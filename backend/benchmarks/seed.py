@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+
+from sqlalchemy import create_engine, text
+from werkzeug.security import generate_password_hash
+
+
+# SQLite stand-in for the MariaDB tables the app expects
+BASE_SCHEMA = [
+    """CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255), password VARCHAR(255), email VARCHAR(255),
+        admin INTEGER DEFAULT 0, token VARCHAR(36), google_sub VARCHAR(255))""",
+    "CREATE TABLE houses (id INTEGER PRIMARY KEY AUTOINCREMENT, name VARCHAR(255))",
+    """CREATE TABLE students (id INTEGER PRIMARY KEY AUTOINCREMENT, first_name VARCHAR(255), last_name VARCHAR(255),
+        grad_year INTEGER, points INTEGER DEFAULT 0, teacher INTEGER, house INTEGER)""",
+    """CREATE TABLE transaction_log (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, ammount INTEGER, reason VARCHAR(255),
+        teacher_id INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)""",
+    """CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME, log_level VARCHAR(20), message TEXT, module VARCHAR(255),
+        user_id INTEGER, username VARCHAR(255), method VARCHAR(10), url TEXT, status_code INTEGER, stack_trace TEXT,
+        ip_address VARCHAR(45), device VARCHAR(255))""",
+    "CREATE TABLE archive (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT, studentammount INTEGER, timestamp DATETIME)",
+]
+
+FIRST_NAMES = ['Anna', 'Ben', 'Clara', 'David', 'Elena', 'Felix', 'Greta', 'Hugo', 'Ida', 'Jonas', 'Klara', 'Luca',
+               'Mia', 'Noah', 'Olivia', 'Paul', 'Quinn', 'Rosa', 'Simon', 'Tara', 'Umar', 'Vera', 'William', 'Yara', 'Zoe']
+LAST_NAMES = ['Keller', 'Meier', 'Schmid', 'Weber', 'Huber', 'Fischer', 'Brunner', 'Baumann', 'Frei', 'Zimmermann',
+              'Moser', 'Widmer', 'Wyss', 'Graf', 'Roth', 'Suter', 'Bachmann', 'Steiner', 'Koch', 'Marti']
+
+ADMIN_TOKEN = '00000000-0000-0000-0000-000000000001'
+
+
+def teacher_token(teacher_id):
+    return f'00000000-0000-0000-0000-{teacher_id:012d}'
+
+
+def create_database(path=None, students=1000, teachers=20, houses=4, transactions=0, seed=1):
+    """Create and fill a SQLite database, returning its SQLAlchemy URL.
+
+    Teacher 1 is an admin. Teacher n logs in with teacher_token(n).
+    """
+    if path is None:
+        handle, path = tempfile.mkstemp(suffix='.sqlite3', prefix='hs-bench-')
+        os.close(handle)
+    if os.path.exists(path):
+        os.remove(path)
+    url = f'sqlite:///{path}'
+    rng = random.Random(seed)
+    engine = create_engine(url)
+    password = generate_password_hash('bench')
+    with engine.begin() as connection:
+        for statement in BASE_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO houses (name) VALUES (:name)"), [{'name': f'House {i + 1}'} for i in range(houses)])
+        connection.execute(text("""
+            INSERT INTO users (name, password, email, admin, token) VALUES (:name, :password, :email, :admin, :token)
+        """), [{
+            'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            'password': password,
+            'email': f'teacher{i}@school.test',
+            'admin': 1 if i == 1 else 0,
+            'token': teacher_token(i),
+        } for i in range(1, teachers + 1)])
+        connection.execute(text("""
+            INSERT INTO students (first_name, last_name, grad_year, points, teacher, house)
+            VALUES (:first_name, :last_name, :grad_year, :points, :teacher, :house)
+        """), [{
+            'first_name': rng.choice(FIRST_NAMES) + ('' if i % 3 else str(i)),
+            'last_name': rng.choice(LAST_NAMES),
+            'grad_year': 2025 + i % 4,
+            'points': 0,
+            'teacher': rng.randint(1, teachers),
+            'house': rng.randint(1, houses),
+        } for i in range(students)])
+        if transactions:
+            rows = [{
+                'student_id': rng.randint(1, students),
+                'ammount': rng.choice([1, 1, 2, 5, -1]),
+                'reason': 'seed',
+                'teacher_id': rng.randint(1, teachers),
+            } for _ in range(transactions)]
+            connection.execute(text("""
+                INSERT INTO transaction_log (student_id, ammount, reason, teacher_id) VALUES (:student_id, :ammount, :reason, :teacher_id)
+            """), rows)
+            connection.execute(text("""
+                UPDATE students SET points = (SELECT COALESCE(SUM(ammount), 0) FROM transaction_log WHERE transaction_log.student_id = students.id)
+            """))
+    engine.dispose()
+    return url
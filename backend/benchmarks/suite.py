@@ -0,0 +1,189 @@
+"""Backend benchmark suite: throughput, latency percentiles and queries per request of the hot endpoints.
+
+Seeds a SQLite database, then runs every scenario twice: sequentially through the
+Flask test client (the cost of the code itself) and through a threaded HTTP
+server in this process under concurrent keep-alive clients. Statements executed
+while handling requests are counted with an engine event; the log sink, the
+standings feed and the job runner run on their own threads, and their statements
+are reported separately as background queries.
+
+Results are written as JSON; pass --compare with an earlier file to print the
+change per scenario.
+
+Run from backend/:  python -m benchmarks.suite --students 5000 --transactions 20000 --output bench.json
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+from benchmarks.http_load import run_load, summarize
+from benchmarks.seed import FIRST_NAMES, LAST_NAMES, create_database, teacher_token
+
+
+BACKGROUND_THREADS = ('log-sink', 'standings-feed', 'job-runner')
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self._lock = threading.Lock()
+        self.request = 0
+        self.background = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        background = threading.current_thread().name in BACKGROUND_THREADS
+        with self._lock:
+            if background:
+                self.background += 1
+            else:
+                self.request += 1
+
+    def take(self):
+        with self._lock:
+            counts = self.request, self.background
+            self.request = self.background = 0
+        return counts
+
+
+def scenarios(args):
+    rng = random.Random(args.seed)
+    teacher = {'Authorization': f'Bearer {teacher_token(2)}'}
+    admin = {'Authorization': f'Bearer {teacher_token(1)}'}
+    prefixes = [name.lower()[:n] for name in FIRST_NAMES + LAST_NAMES for n in (1, 2, 3)]
+
+    return {
+        'award_points': lambda client, i: ('POST', '/api/awardpoints', teacher, {
+            'studentId': rng.randint(1, args.students), 'points': rng.choice([1, 2, 5]), 'reason': 'bench'}),
+        'award_points_bulk': lambda client, i: ('POST', '/api/awardpoints/bulk', teacher, {
+            'entries': [{'studentId': rng.randint(1, args.students), 'points': 1, 'reason': 'bench'} for _ in range(25)]}),
+        'get_students_page': lambda client, i: ('GET', f'/api/getstudents?limit=100&house={rng.randint(1, args.houses)}', admin, None),
+        'get_students_all': lambda client, i: ('GET', '/api/getstudents', admin, None),
+        'search_users': lambda client, i: ('GET', f'/api/search_users?query={rng.choice(prefixes)}', teacher, None),
+        'house_standings': lambda client, i: ('GET', '/api/housestandings', None, None),
+        'top_students': lambda client, i: ('GET', '/api/topstudents', None, None),
+    }
+
+
+def run_client(app, counter, make_request, requests):
+    client = app.test_client()
+    latencies, errors = [], 0
+    counter.take()
+    started = time.perf_counter()
+    for i in range(requests):
+        method, path, headers, body = make_request(0, i)
+        request_started = time.perf_counter()
+        response = client.open(path, method=method, headers=headers, json=body)
+        # Streamed responses (getstudents) do their work while the body is read
+        response.get_data()
+        response.close()
+        elapsed = time.perf_counter() - request_started
+        if 200 <= response.status_code < 300:
+            latencies.append(elapsed)
+        else:
+            errors += 1
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    return result, counter.take()
+
+
+def run_http(url, counter, make_request, concurrency, seconds):
+    counter.take()
+    result = run_load(url, make_request, concurrency, seconds)
+    return result, counter.take()
+
+
+def with_queries(result, counts):
+    queries, background = counts
+    handled = result['requests'] + result['errors']
+    result['queries_per_request'] = round(queries / handled, 2) if handled else None
+    result['background_queries'] = background
+    return result
+
+
+def compare(previous, current):
+    for mode, runs in current.items():
+        for name, result in runs.items():
+            before = previous.get(mode, {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('requests_per_second', 'p50_ms', 'p99_ms', 'queries_per_request'):
+                if before.get(key) and result.get(key) is not None:
+                    changes.append(f"{key} {before[key]} -> {result[key]} ({(result[key] - before[key]) / before[key] * 100:+.1f}%)")
+            print(f"{mode:>6} {name:>18}: " + ', '.join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--houses', type=int, default=4)
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--scenarios', help='comma separated subset of the scenarios to run')
+    parser.add_argument('--modes', default='client,http', help='client and/or http (comma separated)')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario through the test client')
+    parser.add_argument('--concurrency', type=int, default=16, help='HTTP clients per scenario')
+    parser.add_argument('--seconds', type=float, default=5, help='duration of each HTTP scenario')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = create_database(students=args.students, teachers=args.teachers, houses=args.houses,
+                                                 transactions=args.transactions, seed=args.seed)
+    import main as backend
+    from schema import init_db
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    init_db(backend.engine)
+    counter = QueryCounter(backend.engine)
+    selected = scenarios(args)
+    if args.scenarios:
+        selected = {name: selected[name] for name in args.scenarios.split(',')}
+    modes = args.modes.split(',')
+
+    results = {mode: {} for mode in modes}
+    if 'client' in modes:
+        for name, make_request in selected.items():
+            result = with_queries(*run_client(backend.app, counter, make_request, args.requests))
+            results['client'][name] = result
+            print(f"client {name:>18}: {result['requests_per_second']:>8} req/s  p50 {result['p50_ms']} ms  "
+                  f"p99 {result['p99_ms']} ms  {result['queries_per_request']} queries/request")
+    if 'http' in modes:
+        server = make_server('127.0.0.1', 0, backend.app, threaded=True, request_handler=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        url = f'http://127.0.0.1:{server.server_port}'
+        try:
+            for name, make_request in selected.items():
+                result = with_queries(*run_http(url, counter, make_request, args.concurrency, args.seconds))
+                results['http'][name] = result
+                print(f"  http {name:>18}: {result['requests_per_second']:>8} req/s  p50 {result['p50_ms']} ms  "
+                      f"p99 {result['p99_ms']} ms  {result['queries_per_request']} queries/request  errors {result['errors']}")
+        finally:
+            server.shutdown()
+    backend.log_sink.close()
+
+    report = {
+        'dataset': {'students': args.students, 'teachers': args.teachers, 'houses': args.houses, 'transactions': args.transactions},
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f)['results'], results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
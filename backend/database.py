@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+
+DEFAULT_DATABASE_URL = 'mysql+pymysql://app:app123@db:3306/hs-counter'
+
+# The database can't serve the request right now (endpoints answer 503): the server
+# went away / refused us, or the pool had no free connection in time. connect()
+# only retries the first; waiting again on an exhausted pool just adds waiters.
+RETRYABLE_ERRORS = (OperationalError, PoolTimeoutError)
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# MariaDB allows 151 connections by default; leave some for the console, cron and the migrations
+DEFAULT_MAX_CONNECTIONS = 140
+
+
+def pool_options():
+    """Pool settings from the environment, sized for one gunicorn worker.
+
+    DB_MAX_CONNECTIONS is the connection budget of the whole deployment,
+    shared evenly by the WEB_CONCURRENCY workers. DB_POOL_SIZE / DB_MAX_OVERFLOW
+    are used as given when they fit in a worker's share and scaled down to it
+    otherwise.
+    """
+    pool_size = int(os.getenv('DB_POOL_SIZE', 5))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    per_worker = max_connections_per_worker()
+    if pool_size + max_overflow > per_worker:
+        pool_size = min(pool_size, max(1, per_worker // 2))
+        max_overflow = max(0, per_worker - pool_size)
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }
+
+
+def max_connections_per_worker():
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    return max(1, int(os.getenv('DB_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)) // workers)
+
+
+class PoolMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.connect_errors = 0
+        self.retries = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _fresh(self):
+        # Counters inherited through fork belong to the parent process
+        if self.pid != os.getpid():
+            self.reset()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._fresh()
+            setattr(self, name, getattr(self, name) + amount)
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self._fresh()
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self, engine):
+        with self._lock:
+            self._fresh()
+            stats = {
+                'pid': self.pid,
+                'connects': self.connects,
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'invalidations': self.invalidations,
+                'connect_errors': self.connect_errors,
+                'retries': self.retries,
+                'wait_total_ms': round(self.wait_total * 1000, 3),
+                'wait_avg_ms': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_max_ms': round(self.wait_max * 1000, 3),
+            }
+        pool = engine.pool
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+def build_engine(url=None):
+    url = make_url(url or os.getenv('DATABASE_URL', DEFAULT_DATABASE_URL))
+    options = {} if url.get_backend_name() == 'sqlite' else pool_options()
+    if url.get_backend_name() == 'mysql':
+        # CURRENT_TIMESTAMP and DATE() in UTC, like the timestamps written from Python (SQLite always uses UTC)
+        options['connect_args'] = {'init_command': "SET time_zone = '+00:00'"}
+    engine = create_engine(url, **options)
+
+    @event.listens_for(engine.pool, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        pool_metrics.incr('connects')
+
+    @event.listens_for(engine.pool, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.incr('checkouts')
+
+    @event.listens_for(engine.pool, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        pool_metrics.incr('checkins')
+
+    @event.listens_for(engine.pool, 'invalidate')
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.incr('invalidations')
+
+    return engine
+
+
+def connect(engine, retries=None, backoff=None, deadline=None):
+    """Check a connection out of the pool, retrying with exponential backoff when the server can't be reached.
+
+    A pool timeout is raised at once. No retry starts after `deadline` seconds
+    (DB_CONNECT_DEADLINE, default 10), which keeps a request well inside
+    gunicorn's worker timeout so it can still answer 503.
+    """
+    retries = int(os.getenv('DB_CONNECT_RETRIES', 3)) if retries is None else retries
+    backoff = float(os.getenv('DB_CONNECT_BACKOFF', 0.1)) if backoff is None else backoff
+    deadline = float(os.getenv('DB_CONNECT_DEADLINE', 10)) if deadline is None else deadline
+    first_started = time.perf_counter()
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            connection = engine.connect()
+            pool_metrics.record_wait(time.perf_counter() - started)
+            return connection
+        except PoolTimeoutError:
+            pool_metrics.incr('connect_errors')
+            raise
+        except OperationalError:
+            pool_metrics.incr('connect_errors')
+            delay = backoff * (2 ** attempt)
+            if attempt >= retries or time.perf_counter() - first_started + delay > deadline:
+                raise
+            pool_metrics.incr('retries')
+            time.sleep(delay)
+            attempt += 1
+
+
+@contextmanager
+def db_connection(engine, retries=None, backoff=None, deadline=None):
+    connection = connect(engine, retries=retries, backoff=backoff, deadline=deadline)
+    try:
+        yield connection
+    finally:
+        connection.close()
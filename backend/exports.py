@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+
+# Full-table exports (/api/export/<dataset>). Rows come from a server-side
+# cursor and are written out in small chunks, so a worker holds one chunk in
+# memory however many rows the export has.
+
+DATASETS = {
+    'students': {
+        'query': """
+            SELECT students.id, students.first_name, students.last_name, students.grad_year, students.points,
+                   students.house, houses.name AS house_name, students.teacher, users.name AS teacher_name
+            FROM students
+            LEFT JOIN houses ON houses.id = students.house
+            LEFT JOIN users ON users.id = students.teacher
+        """,
+        'date_column': None,
+        'order': "students.id",
+    },
+    'transactions': {
+        'query': """
+            SELECT transaction_log.id, transaction_log.timestamp, transaction_log.student_id, students.first_name, students.last_name,
+                   transaction_log.ammount AS points, transaction_log.reason, transaction_log.teacher_id, users.name AS teacher_name
+            FROM transaction_log
+            LEFT JOIN students ON students.id = transaction_log.student_id
+            LEFT JOIN users ON users.id = transaction_log.teacher_id
+        """,
+        'date_column': "transaction_log.timestamp",
+        'order': "transaction_log.id",
+    },
+    'logs': {
+        'query': """
+            SELECT id, timestamp, log_level AS level, message, module, user_id, username, method, url, status_code,
+                   stack_trace, ip_address, device
+            FROM logs
+        """,
+        'date_column': "timestamp",
+        'order': "id",
+    },
+    'archive': {
+        'query': """
+            SELECT archive.id AS archive_id, archive.timestamp, archive_houses.house_id, archive_houses.house_name,
+                   archive_houses.total_points, archive_houses.student_count, archive_houses.house_rank
+            FROM archive
+            JOIN archive_houses ON archive_houses.archive_id = archive.id
+        """,
+        'date_column': "archive.timestamp",
+        'order': "archive.id, archive_houses.house_rank, archive_houses.house_id",
+    },
+}
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+ROWS_PER_CHUNK = 500
+
+
+def parse_date_bound(value, end=False):
+    """A from/to query value as a datetime; a plain date as `to` covers that whole day."""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        return parsed + timedelta(days=1)
+    return parsed
+
+
+def build_query(dataset, start=None, end=None):
+    """SQL text and parameters of an export; `end` is exclusive."""
+    spec = DATASETS[dataset]
+    query, conditions, params = spec['query'], [], {}
+    if start is not None:
+        conditions.append(f"{spec['date_column']} >= :start")
+        params['start'] = start
+    if end is not None:
+        conditions.append(f"{spec['date_column']} < :end")
+        params['end'] = end
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return text(query + " ORDER BY " + spec['order']), params
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def encode_rows(result, fmt):
+    """Yield the rows of a result as CSV (with header) or NDJSON text, ROWS_PER_CHUNK rows at a time."""
+    columns = list(result.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    count = 0
+    for row in result:
+        values = [_plain(value) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            buffer.write(json.dumps(dict(zip(columns, values)), default=str) + '\n')
+        count += 1
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,71 @@
+# gunicorn picks this file up automatically from the working directory.
+import multiprocessing
+import os
+import sys
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+
+# "gevent" (default) runs many requests per worker: pymysql is pure Python, so once
+# gevent has patched the socket module every query yields to the other requests of
+# the worker instead of blocking it. "sync" handles one request per worker at a time.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+threads = int(os.getenv('GUNICORN_THREADS', 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# database.pool_options() splits DB_MAX_CONNECTIONS (default 140) across WEB_CONCURRENCY workers
+os.environ.setdefault('WEB_CONCURRENCY', str(workers))
+
+
+def worker_exit(server, worker):
+    # Write out any log rows still buffered in this worker before it exits
+    main = sys.modules.get('main')
+    if main is not None:
+        main.job_runner.close()
+        main.log_sink.close()
+        main.metrics.dump(force=True)
+
+
+def on_starting(server):
+    # Runs once in the master, before any worker imports the app
+    metrics_dir = os.getenv('METRICS_DIR')
+    if metrics_dir:
+        # Numbers of a previous run would otherwise be added to this one
+        os.makedirs(metrics_dir, exist_ok=True)
+        for filename in os.listdir(metrics_dir):
+            if filename.endswith(('.json', '.tmp')):
+                os.remove(os.path.join(metrics_dir, filename))
+
+    from database import DEFAULT_MAX_CONNECTIONS, build_engine, pool_options
+
+    budget = int(os.getenv('DB_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS))
+    options = pool_options()
+    server.log.info("Database pool per worker: %d + %d overflow (budget %d for %d workers)",
+                    options['pool_size'], options['max_overflow'], budget, workers)
+    if workers > budget:
+        server.log.warning("%d workers need at least one connection each, more than DB_MAX_CONNECTIONS=%d", workers, budget)
+    from migrations import check_schema
+    from schema import init_db
+
+    engine = build_engine()
+    try:
+        created = init_db(engine)
+        if created:
+            server.log.info("Created tables: %s", ", ".join(created))
+        with engine.connect() as connection:
+            for warning in check_schema(connection):
+                server.log.warning("Schema: %s", warning)
+    except Exception as e:
+        server.log.warning("Could not prepare the database schema: %s", e)
+    try:
+        # Keep PARTITIONS_AHEAD future partitions on partitioned tables, see partitions.py
+        from partitions import extend_all
+        for table, names in extend_all(engine).items():
+            server.log.info("Added partitions to %s: %s", table, ", ".join(names))
+    except Exception as e:
+        server.log.warning("Could not add partitions: %s", e)
+    finally:
+        engine.dispose()
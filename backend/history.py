@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+
+# Points over time. The award endpoints add every award to per-day rollups
+# (student_daily_points, house_daily_points) in the same transaction, so a
+# year of history is at most 366 rows per student or house, whatever the size
+# of transaction_log. Days are UTC dates, the same as the transaction_log
+# timestamps (and on MariaDB every session runs in UTC, see database.py).
+# Like totals.py, everything runs on the caller's connection.
+
+BUCKETS = ('day', 'week', 'month')
+
+
+def _upsert(connection, table, key_column):
+    # Concurrent awards race to create the first row of a day, so let the database merge them
+    columns = f"INSERT INTO {table} ({key_column}, day, points, awards) VALUES (:key, :day, :points, :awards)"
+    if connection.dialect.name == 'mysql':
+        return text(columns + " ON DUPLICATE KEY UPDATE points = points + VALUES(points), awards = awards + VALUES(awards)")
+    return text(columns + f" ON CONFLICT ({key_column}, day) DO UPDATE SET points = {table}.points + excluded.points, awards = {table}.awards + excluded.awards")
+
+
+def points_awarded(connection, awards, awarded_at):
+    """Add awards to the daily rollups; `awards` holds (student_id, house_id, points) per award.
+
+    `awarded_at` is the UTC timestamp written to their transaction_log rows, so
+    the day matches DATE(timestamp) as backfill() computes it.
+    """
+    day = awarded_at.date()
+    students, houses = {}, {}
+    for student_id, house_id, points in awards:
+        for sums, key in ((students, student_id), (houses, house_id)):
+            if key is not None:
+                previous = sums.get(key, (0, 0))
+                sums[key] = (previous[0] + int(points), previous[1] + 1)
+    for table, key_column, sums in (('student_daily_points', 'student_id', students), ('house_daily_points', 'house_id', houses)):
+        if sums:
+            connection.execute(_upsert(connection, table, key_column), [
+                {'key': key, 'day': day, 'points': points, 'awards': count} for key, (points, count) in sums.items()
+            ])
+
+
+def backfill(connection):
+    """Fill both rollups from transaction_log (houses by the students' current house)."""
+    connection.execute(text("""
+        INSERT INTO student_daily_points (student_id, day, points, awards)
+        SELECT student_id, DATE(timestamp), SUM(ammount), COUNT(*) FROM transaction_log
+        WHERE student_id IS NOT NULL AND timestamp IS NOT NULL
+        GROUP BY student_id, DATE(timestamp)
+    """))
+    connection.execute(text("""
+        INSERT INTO house_daily_points (house_id, day, points, awards)
+        SELECT students.house, DATE(transaction_log.timestamp), SUM(transaction_log.ammount), COUNT(*)
+        FROM transaction_log JOIN students ON students.id = transaction_log.student_id
+        WHERE students.house IS NOT NULL AND transaction_log.timestamp IS NOT NULL
+        GROUP BY students.house, DATE(transaction_log.timestamp)
+    """))
+
+
+def _as_date(value):
+    return date.fromisoformat(str(value)[:10]) if not isinstance(value, date) else value
+
+
+def _bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+def timeline(connection, table, key_column, key, start, end, bucket='day'):
+    """Points per bucket between start and end (both dates, inclusive), every bucket present.
+
+    Returns (points before start, [{'period', 'points', 'awards', 'cumulative'}]),
+    where cumulative counts from the first award ever.
+    """
+    params = {'key': key, 'start': start, 'end': end}
+    before = connection.execute(text(
+        f"SELECT COALESCE(SUM(points), 0) FROM {table} WHERE {key_column} = :key AND day < :start"
+    ), params).scalar()
+    days = connection.execute(text(
+        f"SELECT day, points, awards FROM {table} WHERE {key_column} = :key AND day >= :start AND day <= :end ORDER BY day"
+    ), params).fetchall()
+    sums = {}
+    for day, points, awards in days:
+        period = _bucket_start(_as_date(day), bucket)
+        previous = sums.get(period, (0, 0))
+        sums[period] = (previous[0] + int(points), previous[1] + int(awards))
+    periods, cumulative = [], int(before)
+    period = _bucket_start(start, bucket)
+    while period <= end:
+        points, awards = sums.get(period, (0, 0))
+        cumulative += points
+        periods.append({'period': period.isoformat(), 'points': points, 'awards': awards, 'cumulative': cumulative})
+        period = _next_bucket(period, bucket)
+    return int(before), periods
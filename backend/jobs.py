@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from sentry_sdk import capture_exception
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+
+JOB_COLUMNS = """id, kind, status, params, processed, total, steps, run_seconds, error, created_by,
+    created_at, started_at, heartbeat_at, finished_at, cancel_requested"""
+JOB_DURATION_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600)
+
+
+class JobConflict(Exception):
+    """A job of the same kind is already queued or running."""
+
+    def __init__(self, kind, job_id):
+        super().__init__(f'A {kind} job is already queued or running (job {job_id})')
+        self.kind = kind
+        self.job_id = job_id
+
+
+def _seconds_between(start, end):
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start)
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end)
+    return round((end - start).total_seconds(), 3) if start and end else None
+
+
+class JobRunner:
+    """Runs long admin operations from the `jobs` table in small transactions.
+
+    A job type is an object with start(connection, params) -> (state, total) and
+    step(connection, state, chunk_size) -> (state, processed, done). Every step
+    commits together with the job row (its new state and progress), so a job
+    that stops half way - worker restart, crash - continues from its last
+    committed step: the runner threads of any worker pick up queued jobs and
+    running jobs whose heartbeat is older than `stale_after` seconds.
+
+    Only one job per kind can be queued or running at a time: the jobs table
+    has a unique `active_kind` column that holds the kind until the job
+    finishes, so two workers can't both start the same operation. Cancelling
+    a running job stops it after its current step; finished steps stay done.
+
+    on_change(kind) is called after every committed step so caches can be
+    invalidated while the job is still going.
+    """
+
+    def __init__(self, engine, job_types, threads=2, chunk_size=1000, pause=0.05, poll_interval=2.0, stale_after=60.0,
+                 on_change=None, metrics=None):
+        self.engine = engine
+        self.job_types = job_types
+        self.threads = threads
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.on_change = on_change
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self.owner = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._run, name='job-runner', daemon=True) for _ in range(self.threads)]
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, kind, params=None, user_id=None):
+        """Queue a job and return its id.
+
+        Raises KeyError for an unknown kind and JobConflict when a job of the
+        kind is already queued or running.
+        """
+        if kind not in self.job_types:
+            raise KeyError(kind)
+        try:
+            with self.engine.begin() as connection:
+                job_id = connection.execute(text("""
+                    INSERT INTO jobs (kind, active_kind, status, params, processed, steps, run_seconds, cancel_requested, created_by, created_at)
+                    VALUES (:kind, :kind, 'queued', :params, 0, 0, 0, 0, :user_id, :now)
+                """), {'kind': kind, 'params': json.dumps(params or {}), 'user_id': user_id, 'now': datetime.utcnow()}).lastrowid
+        except IntegrityError:
+            with self.engine.connect() as connection:
+                existing = connection.execute(text("SELECT id FROM jobs WHERE active_kind = :kind"), {'kind': kind}).scalar()
+            raise JobConflict(kind, existing)
+        self.ensure_started()
+        self._wake.set()
+        return job_id
+
+    def _job(self, row):
+        job = dict(row._mapping)
+        job['params'] = json.loads(job['params'] or '{}')
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        job['progress'] = round(min(1.0, job['processed'] / job['total']), 4) if job['total'] else (1.0 if job['status'] == 'done' else 0.0)
+        job['duration_seconds'] = _seconds_between(job['started_at'], job['finished_at'] or (job['heartbeat_at'] if job['status'] == 'running' else None))
+        job['rows_per_second'] = round(job['processed'] / job['run_seconds'], 1) if job['run_seconds'] else None
+        return job
+
+    def get(self, connection, job_id):
+        row = connection.execute(text(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = :job_id"), {'job_id': job_id}).fetchone()
+        return self._job(row) if row else None
+
+    def list(self, connection, limit=50, kind=None, status=None):
+        query, params, conditions = f"SELECT {JOB_COLUMNS} FROM jobs", {'limit': limit}, []
+        if kind:
+            conditions.append("kind = :kind")
+            params['kind'] = kind
+        if status:
+            conditions.append("status = :status")
+            params['status'] = status
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT :limit"
+        return [self._job(row) for row in connection.execute(text(query), params)]
+
+    def cancel(self, connection, job_id):
+        """Cancel a queued job right away or ask a running one to stop after its current step."""
+        connection.execute(text("""
+            UPDATE jobs SET status = 'cancelled', active_kind = NULL, finished_at = :now WHERE id = :job_id AND status = 'queued'
+        """), {'job_id': job_id, 'now': datetime.utcnow()})
+        connection.execute(text("UPDATE jobs SET cancel_requested = 1 WHERE id = :job_id AND status = 'running'"), {'job_id': job_id})
+
+    def _claim(self):
+        now = datetime.utcnow()
+        stale = datetime.utcfromtimestamp(time.time() - self.stale_after)
+        with self.engine.begin() as connection:
+            candidates = connection.execute(text("""
+                SELECT id FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < :stale) ORDER BY id LIMIT 5
+            """), {'stale': stale}).fetchall()
+            for (job_id,) in candidates:
+                claimed = connection.execute(text("""
+                    UPDATE jobs SET status = 'running', owner = :owner, heartbeat_at = :now, started_at = COALESCE(started_at, :now)
+                    WHERE id = :job_id AND (status = 'queued' OR (status = 'running' AND heartbeat_at < :stale))
+                """), {'owner': self.owner, 'now': now, 'stale': stale, 'job_id': job_id}).rowcount
+                if claimed:
+                    return connection.execute(text("SELECT id, kind, params, state FROM jobs WHERE id = :job_id"), {'job_id': job_id}).fetchone()
+        return None
+
+    def _save(self, connection, job_id, processed=0, seconds=0.0, **fields):
+        assignments = ''.join(f'{name} = :{name}, ' for name in fields)
+        updated = connection.execute(text(f"""
+            UPDATE jobs SET {assignments}processed = processed + :processed, steps = steps + 1, run_seconds = run_seconds + :seconds,
+                heartbeat_at = :heartbeat_at
+            WHERE id = :job_id AND owner = :owner
+        """), {**fields, 'processed': processed, 'seconds': seconds, 'heartbeat_at': datetime.utcnow(), 'job_id': job_id, 'owner': self.owner}).rowcount
+        if not updated:
+            # Another runner took the job over (we were too slow to heartbeat); drop this step
+            raise RuntimeError(f'Lost ownership of job {job_id}')
+
+    def _finish(self, job_id, kind, status, error=None):
+        now = datetime.utcnow()
+        with self.engine.begin() as connection:
+            connection.execute(text("""
+                UPDATE jobs SET status = :status, active_kind = NULL, error = :error, finished_at = :now WHERE id = :job_id AND owner = :owner
+            """), {'status': status, 'error': error, 'now': now, 'job_id': job_id, 'owner': self.owner})
+            started_at = connection.execute(text("SELECT started_at FROM jobs WHERE id = :job_id"), {'job_id': job_id}).scalar()
+        if self.metrics is not None:
+            self.metrics.inc('housepoints_jobs_total', (('kind', kind), ('status', status)))
+            duration = _seconds_between(started_at, now)
+            if duration is not None:
+                self.metrics.observe('housepoints_job_duration_seconds', duration, (('kind', kind),), JOB_DURATION_BUCKETS)
+
+    def _execute(self, job_id, kind, params, state):
+        job_type = self.job_types[kind]
+        if state is None:
+            started = time.perf_counter()
+            with self.engine.begin() as connection:
+                state, total = job_type.start(connection, json.loads(params or '{}'))
+                self._save(connection, job_id, seconds=time.perf_counter() - started, state=json.dumps(state), total=total)
+        else:
+            state = json.loads(state)
+        done = False
+        while not done:
+            if self._stop.is_set():
+                return
+            with self.engine.connect() as connection:
+                cancel_requested = connection.execute(text("SELECT cancel_requested FROM jobs WHERE id = :job_id"), {'job_id': job_id}).scalar()
+            if cancel_requested:
+                self._finish(job_id, kind, 'cancelled')
+                return
+            started = time.perf_counter()
+            with self.engine.begin() as connection:
+                state, processed, done = job_type.step(connection, state, self.chunk_size)
+                self._save(connection, job_id, processed, time.perf_counter() - started, state=json.dumps(state))
+            if self.metrics is not None:
+                self.metrics.observe('housepoints_job_step_seconds', time.perf_counter() - started, (('kind', kind),))
+            if self.on_change is not None:
+                self.on_change(kind)
+            if not done and self.pause:
+                time.sleep(self.pause)
+        self._finish(job_id, kind, 'done')
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except Exception as e:
+                # No jobs table yet, or the database is away; try again later
+                print(f"Job runner could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._execute(job[0], job[1], job[2], job[3])
+            except Exception as e:
+                capture_exception(e)
+                print(f"Job {job[0]} ({job[1]}) failed: {e}")
+                try:
+                    self._finish(job[0], job[1], 'failed', str(e)[:2000])
+                except Exception as finish_error:
+                    print(f"Could not mark job {job[0]} as failed: {finish_error}")
+
+    def close(self, timeout=10.0):
+        """Stop after the current steps and hand running jobs back to the queue."""
+        if self._pid != os.getpid() or not self._threads:
+            return
+        self._stop.set()
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(text("UPDATE jobs SET status = 'queued', owner = NULL WHERE status = 'running' AND owner = :owner"), {'owner': self.owner})
+        except Exception as e:
+            print(f"Could not release jobs: {e}")
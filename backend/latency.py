@@ -0,0 +1,35 @@
+import time
+
+from flask import current_app, request
+
+
+def parse_latency_config(value):
+    """Parse 'search_teachers=300,get_students=50' into {endpoint: seconds}.
+
+    The key '*' applies to every endpoint without an entry of its own.
+    """
+    delays = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        endpoint, milliseconds = item.split('=', 1)
+        delays[endpoint.strip()] = float(milliseconds) / 1000
+    return delays
+
+
+def install_latency_simulation(app, delays):
+    """Delay matching requests to mimic a slow network while developing the frontend.
+
+    Only active while the app runs in debug mode (flask run --debug or
+    `python main.py`), so a stray setting can't slow down gunicorn in production.
+    """
+    if not delays:
+        return
+
+    @app.before_request
+    def _simulate_latency():
+        if not current_app.debug or request.method == 'OPTIONS':
+            return
+        delay = delays.get(request.endpoint, delays.get('*'))
+        if delay:
+            time.sleep(delay)
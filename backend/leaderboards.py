@@ -0,0 +1,246 @@
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from partitions import period_start
+
+
+RANKINGS = ('competition', 'dense', 'ordinal')
+WINDOWS = ('all', 'week', 'term')
+STUDENT_SCOPES = ('overall', 'house', 'grad_year', 'teacher')
+
+
+def assign_ranks(values, ranking='competition'):
+    """Ranks for values sorted high to low: competition 1,1,3 - dense 1,1,2 - ordinal 1,2,3."""
+    ranks, previous, rank, dense = [], object(), 0, 0
+    for position, value in enumerate(values, start=1):
+        if value != previous:
+            previous, rank, dense = value, position, dense + 1
+        ranks.append(position if ranking == 'ordinal' else rank if ranking == 'competition' else dense)
+    return ranks
+
+
+class _Ranking:
+    """Members of one scope ordered by value (highest first, then by id)."""
+
+    def __init__(self, items=()):
+        self._values = dict(items)
+        self._order = sorted((-value, key) for key, value in self._values.items())
+
+    def set(self, key, value):
+        if key in self._values:
+            del self._order[bisect.bisect_left(self._order, (-self._values[key], key))]
+        self._values[key] = value
+        bisect.insort(self._order, (-value, key))
+
+    def __len__(self):
+        return len(self._order)
+
+    def top(self, n):
+        return [(key, -value) for value, key in self._order[:n]]
+
+
+class Leaderboards:
+    """Top-N student and teacher leaderboards served from memory.
+
+    Students are ranked overall and per house, grad year and teacher; teachers
+    by the points of their students. Each board exists for all-time points and
+    for the points awarded this week and this term (from transaction_log).
+
+    Every worker builds the boards from the database once and then follows
+    transaction_log: awards are applied one by one as they show up (checked at
+    most every `poll_interval` seconds, or on the next read after changed()).
+    Anything else - students or teachers added, edited or deleted, points
+    reset - bumps data_version.roster_version, and every worker rebuilds when
+    it sees that move. Ids below the newest seen one are re-read for a while
+    (`overlap`) so an award that commits after a later one isn't missed, and
+    the boards are rebuilt every `rebuild_seconds` regardless.
+    """
+
+    def __init__(self, engine, version=None, term_start=None, poll_interval=1.0, rebuild_seconds=300.0, overlap=200):
+        self.engine = engine
+        self.version = version
+        self.term_start = term_start
+        self.poll_interval = poll_interval
+        self.rebuild_seconds = rebuild_seconds
+        self.overlap = overlap
+        self.rebuilds = 0
+        self.applied_awards = 0
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        self._state = None
+        self._stale = True
+        self._polled_at = None
+        self._seen_version = None
+
+    def window_starts(self, today=None):
+        today = today or datetime.utcnow().date()
+        term = self.term_start if self.term_start and self.term_start <= today else period_start(today, 'academic_year')
+        return {
+            'week': datetime.combine(today - timedelta(days=today.weekday()), datetime.min.time()),
+            'term': datetime.combine(term, datetime.min.time()),
+        }
+
+    def _load(self):
+        starts = self.window_starts()
+        # One transaction, so the students' points and the last transaction id agree (on MariaDB)
+        with self.engine.begin() as connection:
+            roster_version = connection.execute(text("SELECT roster_version FROM data_version WHERE id = 1")).scalar()
+            last = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM transaction_log")).scalar()
+            students = {row[0]: list(row[1:]) for row in connection.execute(text(
+                "SELECT id, first_name, last_name, grad_year, house, teacher, points FROM students"
+            ))}
+            teachers = dict(connection.execute(text("SELECT id, name FROM users")).fetchall())
+            scores = {'all': {student_id: int(student[5] or 0) for student_id, student in students.items()}}
+            for window, start in starts.items():
+                scores[window] = {row[0]: int(row[1] or 0) for row in connection.execute(text("""
+                    SELECT student_id, SUM(ammount) FROM transaction_log WHERE timestamp >= :start AND id <= :last GROUP BY student_id
+                """), {'start': start, 'last': last}) if row[0] in students}
+            applied = {row[0] for row in connection.execute(text(
+                "SELECT id FROM transaction_log WHERE id > :low AND id <= :last"
+            ), {'low': last - self.overlap, 'last': last})}
+
+        boards, teacher_scores = {}, {}
+        for window, window_scores in scores.items():
+            members, teacher_sum = {}, {}
+            for student_id, value in window_scores.items():
+                for scope in self._scopes(students[student_id]):
+                    members.setdefault(scope, []).append((student_id, value))
+                teacher = students[student_id][4]
+                if teacher is not None:
+                    teacher_sum[teacher] = teacher_sum.get(teacher, 0) + value
+            members[('teachers', 'overall', None)] = list(teacher_sum.items())
+            boards[window] = {scope: _Ranking(items) for scope, items in members.items()}
+            teacher_scores[window] = teacher_sum
+        return {
+            'students': students, 'teachers': teachers, 'scores': scores, 'teacher_scores': teacher_scores, 'boards': boards,
+            'starts': starts, 'last': last, 'applied': applied, 'roster_version': roster_version, 'built_at': time.monotonic(),
+        }
+
+    @staticmethod
+    def _scopes(student):
+        _, _, grad_year, house, teacher, _ = student
+        scopes = [('students', 'overall', None)]
+        for name, value in (('house', house), ('grad_year', grad_year), ('teacher', teacher)):
+            if value is not None:
+                scopes.append(('students', name, value))
+        return scopes
+
+    def _rebuild(self):
+        if not self._rebuild_lock.acquire(blocking=self._state is None):
+            return  # another thread is rebuilding; keep serving the current boards
+        try:
+            state = self._load()
+            with self._lock:
+                self._state = state
+                self._stale = False
+                self._polled_at = time.monotonic()
+                self.rebuilds += 1
+        finally:
+            self._rebuild_lock.release()
+
+    def _add(self, state, window, student_id, amount):
+        student = state['students'][student_id]
+        scores = state['scores'][window]
+        scores[student_id] = scores.get(student_id, 0) + amount
+        boards = state['boards'][window]
+        for scope in self._scopes(student):
+            boards.setdefault(scope, _Ranking()).set(student_id, scores[student_id])
+        teacher = student[4]
+        if teacher is not None:
+            teacher_scores = state['teacher_scores'][window]
+            teacher_scores[teacher] = teacher_scores.get(teacher, 0) + amount
+            boards.setdefault(('teachers', 'overall', None), _Ranking()).set(teacher, teacher_scores[teacher])
+
+    def _apply(self, rows):
+        with self._lock:
+            state = self._state
+            for transaction_id, student_id, amount, timestamp in rows:
+                if transaction_id in state['applied']:
+                    continue
+                state['applied'].add(transaction_id)
+                state['last'] = max(state['last'], transaction_id)
+                if student_id not in state['students'] or not amount:
+                    continue
+                if isinstance(timestamp, str):
+                    timestamp = datetime.fromisoformat(timestamp)
+                for window in WINDOWS:
+                    if window == 'all' or (timestamp is not None and timestamp >= state['starts'][window]):
+                        self._add(state, window, student_id, amount)
+                self.applied_awards += 1
+            low = state['last'] - self.overlap
+            state['applied'] = {transaction_id for transaction_id in state['applied'] if transaction_id > low}
+
+    def _sync(self):
+        state = self._state
+        if (self._stale or state is None or time.monotonic() - state['built_at'] > self.rebuild_seconds
+                or state['starts'] != self.window_starts()):
+            self._rebuild()
+            return
+        if self._polled_at is not None and time.monotonic() - self._polled_at < self.poll_interval:
+            return
+        self._polled_at = time.monotonic()
+        version = self.version() if self.version else None
+        if version is not None and version == self._seen_version:
+            return
+        with self.engine.connect() as connection:
+            roster_version = connection.execute(text("SELECT roster_version FROM data_version WHERE id = 1")).scalar()
+            if roster_version != state['roster_version']:
+                rows = None
+            else:
+                rows = connection.execute(text("""
+                    SELECT id, student_id, ammount, timestamp FROM transaction_log WHERE id > :since ORDER BY id
+                """), {'since': max(0, state['last'] - self.overlap)}).fetchall()
+        if rows is None:
+            self._rebuild()
+        else:
+            self._apply(rows)
+        self._seen_version = version
+
+    def changed(self, roster=False):
+        """Called after a write: follow transaction_log on the next read, or rebuild everywhere when roster=True."""
+        if roster:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(text("UPDATE data_version SET roster_version = roster_version + 1 WHERE id = 1"))
+            except Exception as e:
+                print(f"Leaderboard roster version bump failed: {e}")
+            self._stale = True
+        self._polled_at = None
+        self._seen_version = None
+
+    def top(self, board='students', scope='overall', scope_id=None, window='all', limit=10, ranking='competition'):
+        """The first `limit` entries of a board as dicts with rank, id, name and value."""
+        try:
+            self._sync()
+        except Exception as e:
+            if self._state is None:
+                raise
+            print(f"Leaderboard refresh failed, serving the previous boards: {e}")
+        with self._lock:
+            state = self._state
+            key = (board, 'overall', None) if board == 'teachers' else (board, scope, None if scope == 'overall' else scope_id)
+            entries = state['boards'][window].get(key, _Ranking()).top(limit)
+            ranks = assign_ranks([value for _, value in entries], ranking)
+            if board == 'teachers':
+                return [{'rank': rank, 'id': teacher_id, 'name': state['teachers'].get(teacher_id), 'value': value}
+                        for rank, (teacher_id, value) in zip(ranks, entries)]
+            result = []
+            for rank, (student_id, value) in zip(ranks, entries):
+                first_name, last_name, grad_year, house, _, _ = state['students'][student_id]
+                result.append({'rank': rank, 'id': student_id, 'name': f"{first_name} {last_name}", 'value': value,
+                               'house': house, 'grad_year': grad_year})
+            return result
+
+    def stats(self):
+        state = self._state
+        return {
+            'rebuilds': self.rebuilds,
+            'applied_awards': self.applied_awards,
+            'students': len(state['students']) if state else 0,
+            'last_transaction': state['last'] if state else None,
+            'age_seconds': round(time.monotonic() - state['built_at'], 1) if state else None,
+        }
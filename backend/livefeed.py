@@ -0,0 +1,125 @@
+import json
+import os
+import queue
+import threading
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def standings_delta(before, after):
+    """What changed between two snapshots: houses whose row changed, and any leaderboard that changed."""
+    delta = {}
+    previous = {house['house_id']: house for house in before.get('houses', [])}
+    houses = [house for house in after['houses'] if previous.get(house['house_id']) != house]
+    removed = set(previous) - {house['house_id'] for house in after['houses']}
+    if houses:
+        delta['houses'] = houses
+    if removed:
+        delta['removed_houses'] = sorted(removed)
+    for board in ('top_students', 'top_teachers'):
+        if before.get(board) != after[board]:
+            delta[board] = after[board]
+    return delta
+
+
+class StandingsFeed:
+    """Pushes standings changes to Server-Sent Events subscribers.
+
+    One thread per worker checks `version()` every `poll_interval` seconds (or
+    right away after notify()), recomputes the snapshot with `compute()` only
+    when the version moved, and puts the delta on every subscriber's queue, so
+    the cost of a change doesn't grow with the number of open screens.
+    """
+
+    def __init__(self, compute, version, poll_interval=1.0, queue_size=100):
+        self.compute = compute
+        self.version = version
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.computations = 0
+        self.events = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._subscribers = set()
+        self._snapshot = None
+        self._version = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._subscribers = set()
+            self._thread = threading.Thread(target=self._run, name='standings-feed', daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+        self._refresh()
+        return self._snapshot
+
+    def subscribe(self):
+        self._ensure_started()
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber):
+        with self._lock:
+            return subscriber in self._subscribers
+
+    def notify(self):
+        self._wake.set()
+
+    def _refresh(self):
+        version = self.version()
+        with self._lock:
+            if self._snapshot is not None and version == self._version:
+                return None
+        snapshot = self.compute()
+        with self._lock:
+            self.computations += 1
+            before = self._snapshot
+            self._snapshot, self._version = snapshot, version
+        return standings_delta(before, snapshot) if before is not None else None
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    continue
+            try:
+                delta = self._refresh()
+            except Exception as e:
+                print(f"Standings feed refresh failed: {e}")
+                continue
+            if delta:
+                self._publish(format_event('delta', delta))
+
+    def _publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.events += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # A client that stopped reading; it gets a fresh snapshot when it reconnects
+                self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self._subscribers), 'computations': self.computations, 'events': self.events}
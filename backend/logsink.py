@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import column, insert, table
+from sentry_sdk import capture_exception
+
+
+logs_table = table(
+    'logs',
+    column('timestamp'), column('log_level'), column('message'), column('module'),
+    column('user_id'), column('username'), column('method'), column('url'),
+    column('status_code'), column('stack_trace'), column('ip_address'), column('device'),
+)
+
+_STOP = object()
+
+
+class LogSink:
+    """Buffers log rows in memory and writes them in batches from a background thread.
+
+    Rows are written with a single multi-row INSERT once `batch_size` rows are
+    waiting or `flush_interval` seconds have passed, whichever comes first.
+    When the queue is full new rows are dropped and counted instead of blocking
+    the request.
+    """
+
+    def __init__(self, engine, max_queue=10000, batch_size=200, flush_interval=2.0):
+        self.engine = engine
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self.flushes = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def enqueue(self, record):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        # gunicorn forks workers after importing the app, so the flusher thread
+        # has to be started in the process that actually logs.
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            self._pid = os.getpid()
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name='log-sink', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            batch, stop = self._take_batch()
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _take_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                record = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if record is _STOP:
+                return batch, True
+            batch.append(record)
+        return batch, False
+
+    def _write(self, batch):
+        with self._write_lock:
+            try:
+                with self.engine.begin() as connection:
+                    connection.execute(insert(logs_table).values(batch))
+                with self._lock:
+                    self.written += len(batch)
+                    self.flushes += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(batch)
+                capture_exception(e)
+                print(f"Logging error: {e}")
+
+    def flush(self):
+        """Write everything that is currently queued from the calling thread."""
+        batch = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is _STOP:
+                continue
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def close(self, timeout=5.0):
+        if self._closed or self._pid != os.getpid():
+            return
+        self._closed = True
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+        if self.dropped or self.failed:
+            print(f"Log sink closed: {self.dropped} records dropped, {self.failed} failed to write")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self.written,
+                'flushes': self.flushes,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
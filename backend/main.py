@@ -1,109 +1,210 @@
 import json
-from flask import Flask, request, jsonify
-from time import sleep
+from flask import Flask, Response, request, jsonify, has_request_context, g, stream_with_context
+from functools import wraps
 import flask_cors
 from flask_cors import CORS
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import OperationalError
+from sqlalchemy import bindparam, text
 import uuid
+from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import date, datetime
 import sentry_sdk
-from sentry_sdk.integrations.flask import FlaskIntegration
-from sentry_sdk import capture_exception
 import os
+import atexit
+import queue
+import time
+from logsink import LogSink
+from database import RETRYABLE_ERRORS, build_engine, connect, db_connection, pool_metrics
+from authcache import AuthUser, TokenCache
+from schema import init_db
+import migrations
+import totals
+import archives
+import history
+import roster
+import exports
+from search import SearchIndex
+from latency import install_latency_simulation, parse_latency_config
+from respcache import ResponseCache
+from livefeed import StandingsFeed, format_event
+from partitions import period_start
+from leaderboards import RANKINGS, STUDENT_SCOPES, WINDOWS, Leaderboards
+from metrics import Metrics, install_query_instrumentation
+from tracing import sentry_options, start_profiler_if_continuous
+from jobs import JobConflict, JobRunner
+from maintenance import JOB_TYPES
 
 
 
 
-sentry_sdk.init(
-    #NOTE TO SELF do not push the sentry dsn to github AGAIN! PS if you do do it its under settings>sdk setup>client keys (DSN) disable leaked dsn and create a new one!
-    #FFS if you push the .env file to github i will loose all my trust in myself
-    dsn=os.getenv('SENTRY_DSN'),
-    # Set traces_sample_rate to 1.0 to capture 100%
-    # of transactions for tracing.
-    integrations=[FlaskIntegration()],
-    traces_sample_rate=1.0,
-    _experiments={
-        # Set continuous_profiling_auto_start to True
-        # to automatically start the profiler on when
-        # possible.
-        "continuous_profiling_auto_start": True,
-    },
-)
-
-
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 
+#NOTE TO SELF do not push the sentry dsn to github AGAIN! PS if you do do it its under settings>sdk setup>client keys (DSN) disable leaked dsn and create a new one!
+#FFS if you push the .env file to github i will loose all my trust in myself
+# Errors are always reported; traces are sampled per route and the profiler is off unless SENTRY_PROFILING is set, see tracing.py
+ADMIN_MUTATIONS = {'clear_housepoints', 'delete_all_students', 'add_teacher', 'delete_teacher', 'editTeacher', 'archive', 'jobs', 'cancel_job'}
+UNTRACED_ENDPOINTS = {'prometheus_metrics', 'worker_stats', 'stream_standings'}
+sentry_sdk.init(**sentry_options(app, always=ADMIN_MUTATIONS, never=UNTRACED_ENDPOINTS))
+start_profiler_if_continuous()
+
+# Dev only, e.g. SIMULATE_LATENCY="search_teachers=300" - see latency.py
+install_latency_simulation(app, parse_latency_config(os.getenv('SIMULATE_LATENCY')))
 
 
-# Database connection
-engine = create_engine('mysql+pymysql://app:app123@db:3306/hs-counter')
+
+# Database connection, configured through DATABASE_URL and the DB_POOL_* variables
+engine = build_engine()
 
 def get_db_connection():
     try:
-        connection = engine.connect()
-        return connection
-    except OperationalError as err:
+        return connect(engine)
+    except RETRYABLE_ERRORS as err:
         print(f"OperationalError: {err}")
         return None
 
+log_sink = LogSink(
+    engine,
+    max_queue=int(os.getenv('LOG_QUEUE_SIZE', 10000)),
+    batch_size=int(os.getenv('LOG_BATCH_SIZE', 200)),
+    flush_interval=float(os.getenv('LOG_FLUSH_INTERVAL', 2.0)),
+)
+atexit.register(log_sink.close)
+
 def log_action(log_level, message, user_id=None, username=None, method=None, url=None, status_code=None, stack_trace=None, ip_address=None, device=None):
-    connection = get_db_connection()
-    if connection:
-        try:
-            connection.execute(text("""
-                INSERT INTO logs (timestamp, log_level, message, module, user_id, username, method, url, status_code, stack_trace, ip_address, device)
-                VALUES (:timestamp, :log_level, :message, :module, :user_id, :username, :method, :url, :status_code, :stack_trace, :ip_address, :device)
-            """), {
-                'timestamp': datetime.utcnow(),
-                'log_level': log_level,
-                'message': message,
-                'module': 'main.py',
-                'user_id': user_id,
-                'username': username,
-                'method': method,
-                'url': url,
-                'status_code': status_code,
-                'stack_trace': stack_trace,
-                'ip_address': request.remote_addr,
-                'device': request.user_agent.platform
-            })
-            connection.commit()
-        except Exception as e:
-            capture_exception(e)
-            print(f"Logging error: {e}")
-        finally:
-            connection.close()
+    # The request is gone by the time the sink flushes, so grab its details now
+    if has_request_context():
+        ip_address = ip_address or request.remote_addr
+        device = device or request.user_agent.platform
+    log_sink.enqueue({
+        'timestamp': datetime.utcnow(),
+        'log_level': log_level,
+        'message': message,
+        'module': 'main.py',
+        'user_id': user_id,
+        'username': username,
+        'method': method,
+        'url': url,
+        'status_code': status_code,
+        'stack_trace': stack_trace,
+        'ip_address': ip_address,
+        'device': device
+    })
+
+
+# Query counts and timings per request (Server-Timing header, /metrics), see metrics.py
+metrics = Metrics(directory=os.getenv('METRICS_DIR') or None)
+
+def log_slow_query(seconds, statement):
+    log_action('WARNING', f'Slow query ({seconds * 1000:.0f} ms): {statement[:2000]}', user_id=g.user[0] if 'user' in g else None, method=request.method, url=request.url)
+
+install_query_instrumentation(app, engine, metrics, slow_query_seconds=float(os.getenv('SLOW_QUERY_MS', 500)) / 1000, on_slow_query=log_slow_query)
+
+
+response_cache = ResponseCache(
+    engine,
+    poll_interval=float(os.getenv('RESPONSE_CACHE_POLL', 1.0)),
+    maxsize=int(os.getenv('RESPONSE_CACHE_SIZE', 256)),
+)
+
+# Writes that don't change anything the cached endpoints return
+UNVERSIONED_ENDPOINTS = {'auth'}
+# Writes that only add transaction_log rows (and points); the leaderboards follow these without a rebuild
+AWARD_ENDPOINTS = {'award_points', 'award_points_bulk'}
+
+def _data_changed(roster=True):
+    # Roster version first: a worker that sees the new data version must also see the roster change
+    leaderboards.changed(roster=roster)
+    response_cache.bump()
+    standings_feed.notify()
+
+@app.after_request
+def bump_data_version(response):
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400 and request.endpoint not in UNVERSIONED_ENDPOINTS:
+        _data_changed(roster=request.endpoint not in AWARD_ENDPOINTS)
+    return response
+
+
+# Chunked background jobs (clearing points, deleting all students, ...), see jobs.py / maintenance.py
+def _job_step_committed(kind):
+    _data_changed()
+    if kind == 'purge_students':
+        student_index.invalidate()
+
+job_runner = JobRunner(
+    engine,
+    JOB_TYPES,
+    chunk_size=int(os.getenv('JOB_CHUNK_SIZE', 1000)),
+    pause=float(os.getenv('JOB_CHUNK_PAUSE', 0.05)),
+    stale_after=float(os.getenv('JOB_STALE_SECONDS', 60)),
+    threads=int(os.getenv('JOB_THREADS', 2)),
+    on_change=_job_step_committed,
+    metrics=metrics,
+)
+atexit.register(job_runner.close)
+
+@app.before_request
+def start_job_runner():
+    # JOB_THREADS runner threads per worker, also picking up jobs an earlier worker left unfinished
+    job_runner.ensure_started()
+
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 
+@app.route('/api/workerstats', methods=['OPTIONS', 'GET'])
+def worker_stats():
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    return jsonify({"pid": os.getpid(), "log_sink": log_sink.stats(), "db_pool": pool_metrics.snapshot(engine), "auth_cache": token_cache.stats(),
+                    "search": {"students": student_index.stats(), "teachers": teacher_index.stats()},
+                    "response_cache": response_cache.stats(), "standings_feed": standings_feed.stats(), "leaderboards": leaderboards.stats()})
+
 
 
+
+
+def _load_students_for_search():
+    with db_connection(engine) as connection:
+        for row in connection.execute(text("SELECT id, first_name, last_name FROM students")):
+            yield row[0], _student_search_record(row[0], row[1], row[2])
+
+def _student_search_record(student_id, first_name, last_name):
+    return {'id': student_id, 'name': f"{first_name or ''} {last_name or ''}".strip(), 'first_name': first_name, 'last_name': last_name}
+
+def _load_teachers_for_search():
+    with db_connection(engine) as connection:
+        for row in connection.execute(text("SELECT id, name, email FROM users")):
+            yield row[0], {'id': row[0], 'name': row[1], 'email': row[2]}
+
+# Per-worker search indexes, see search.py
+SEARCH_INDEX_TTL = float(os.getenv('SEARCH_INDEX_TTL', 60))
+SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', 100))
+student_index = SearchIndex(_load_students_for_search, ['name'], ttl=SEARCH_INDEX_TTL)
+teacher_index = SearchIndex(_load_teachers_for_search, ['name', 'email'], ttl=SEARCH_INDEX_TTL)
+
+def _search_limit():
+    try:
+        return max(1, min(int(request.args.get('limit', 20)), SEARCH_MAX_LIMIT))
+    except ValueError:
+        return 20
+
 @app.route('/api/search_users', methods=['OPTIONS', 'GET'])
 def search_users():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
-    query = request.args.get('query', '').lower()
+    query = request.args.get('query', '')
     user_type = request.args.get('userType', 'student').lower()
-    connection = get_db_connection()
-    if not connection:
+    index = teacher_index if user_type == 'teacher' else student_index
+
+    try:
+        filtered_users = index.search(query, _search_limit())
+    except RETRYABLE_ERRORS:
         log_action('ERROR', 'Database connection failed for search_users')
         return jsonify([]), 500
 
-
-    if user_type == 'teacher':
-        # Query the users table for teachers
-        result = connection.execute(text("SELECT id, name, email FROM users WHERE LOWER(name) LIKE :query OR LOWER(email) LIKE :query"), {'query': f'%{query}%'})
-    else:
-        # Query the students table
-        result = connection.execute(text("SELECT id, first_name as name FROM students WHERE LOWER(first_name) LIKE :query OR LOWER(last_name) LIKE :query"), {'query': f'%{query}%'})
-
-    
-    filtered_users = [dict(row._mapping) for row in result]
-    connection.close()
-
     log_action('INFO', 'search_users executed successfully', method=request.method, url=request.url, status_code=200)
     response = jsonify(filtered_users)
     response.headers.add("Access-Control-Allow-Origin", os.getenv("FRONTEND_URL"))
@@ -114,20 +215,14 @@ def search_users():
 def search_teachers():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
-    query = request.args.get('query', '').lower()
-    connection = get_db_connection()
-    if not connection:
+    query = request.args.get('query', '')
+
+    try:
+        filtered_teachers = teacher_index.search(query, _search_limit())
+    except RETRYABLE_ERRORS:
         log_action('ERROR', 'Database connection failed for search_teachers')
         return jsonify([]), 500
 
-    # Simulate API call delay
-    sleep(0.3)  # 300ms delay
-
-    # Query the users table for teachers
-    result = connection.execute(text("SELECT id, name, email FROM users WHERE LOWER(name) LIKE :query OR LOWER(email) LIKE :query"), {'query': f'%{query}%'})
-    filtered_teachers = [dict(row._mapping) for row in result]
-    connection.close()
-
     log_action('INFO', 'search_teachers executed successfully', method=request.method, url=request.url, status_code=200)
     response = jsonify(filtered_teachers)
     response.headers.add("Access-Control-Allow-Origin", os.getenv("FRONTEND_URL"))
@@ -143,6 +238,59 @@ def _build_cors_preflight_response():
     return response
 
 
+token_cache = TokenCache(
+    maxsize=int(os.getenv('AUTH_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('AUTH_CACHE_TTL', 60)),
+    engine=engine,
+    poll_interval=float(os.getenv('AUTH_CACHE_POLL', 1.0)),
+)
+
+def _token_from_header(auth_header):
+    return auth_header.split(" ")[-1] if " " in auth_header else auth_header
+
+def lookup_user(token):
+    # Raises RETRYABLE_ERRORS when the database can't be reached
+    user = token_cache.get(token)
+    if user is None:
+        version = token_cache.version()
+        with db_connection(engine) as connection:
+            row = connection.execute(text("SELECT id, name, email, admin FROM users WHERE token = :token"), {'token': token}).fetchone()
+        if not row:
+            return None
+        user = AuthUser(row[0], row[1], row[2], row[3] == 1)
+        token_cache.set(token, user, version)
+    return user
+
+def require_auth(admin=False):
+    """Resolve the bearer token to a user (stored in g.user) before the view runs."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS':
+                return _build_cors_preflight_response()
+            auth_header = request.headers.get('Authorization')
+            if not auth_header:
+                log_action('ERROR', f'Token is missing for {f.__name__}', method=request.method, url=request.url, status_code=401)
+                return jsonify({"error": "Token is missing"}), 401
+
+            try:
+                user = lookup_user(_token_from_header(auth_header))
+            except RETRYABLE_ERRORS:
+                log_action('ERROR', f'Database connection failed for {f.__name__}')
+                return jsonify({"error": "Database connection failed"}), 500
+
+            if not user:
+                log_action('ERROR', f'Invalid token for {f.__name__}', method=request.method, url=request.url, status_code=401)
+                return jsonify({"error": "Invalid token"}), 401
+            if admin and not user.admin:
+                log_action('ERROR', f'Unauthorized access to {f.__name__}', user_id=user.id, method=request.method, url=request.url, status_code=403)
+                return jsonify({"error": "Unauthorized"}), 403
+            g.user = user
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 @app.route("/login", methods=["OPTIONS", "POST"])
 def auth():
     if request.method == 'OPTIONS':
@@ -167,6 +315,7 @@ def auth():
                 token = str(uuid.uuid4())
                 connection.execute(text("UPDATE users SET token = :token WHERE id = :id"), {'token': token, 'id': user[0]})
                 connection.commit()  # Ensure the token is committed to the database
+                token_cache.invalidate_user(user[0])
             connection.close()
             log_action('INFO', 'User logged in successfully', user_id=user[0], username=username, method=request.method, url=request.url, status_code=200)
             return jsonify(token=token)
@@ -188,88 +337,132 @@ def auth():
             else:
                 return jsonify({"error": "Invalid credentials"}), 401
             
+STUDENT_FIELDS = {
+    'id': 'students.id',
+    'first_name': 'students.first_name',
+    'last_name': 'students.last_name',
+    'points': 'students.points',
+    'grad_year': 'students.grad_year',
+    'house': 'students.house',
+    'teacher': 'students.teacher',
+    'teacher_name': 'users.name',
+}
+DEFAULT_STUDENT_FIELDS = ['id', 'first_name', 'last_name', 'points', 'grad_year', 'house', 'teacher_name']
+MAX_STUDENT_PAGE = int(os.getenv('MAX_STUDENT_PAGE', 1000))
+
+def _int_arg(name):
+    value = request.args.get(name)
+    return int(value) if value not in (None, '') else None
+
 @app.route('/api/getstudents', methods=['OPTIONS', 'GET'])
 def get_students():
+    """Students ordered by id, streamed straight from the database cursor.
+
+    Optional query parameters: house, grad_year, teacher (filters), fields
+    (comma separated projection) and limit/cursor for keyset pagination. Without
+    limit the response is a plain JSON array of every matching student; with it
+    the response is {"students": [...], "next_cursor": <id or null>} and the
+    next page is requested with cursor=<next_cursor>.
+    """
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
+
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or DEFAULT_STUDENT_FIELDS
+    unknown = [field for field in fields if field not in STUDENT_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    try:
+        limit = _int_arg('limit')
+        cursor = _int_arg('cursor')
+        filters = {name: _int_arg(name) for name in ('house', 'grad_year', 'teacher')}
+    except ValueError:
+        return jsonify({"error": "limit, cursor, house, grad_year and teacher must be integers"}), 400
+    if limit is not None and not 1 <= limit <= MAX_STUDENT_PAGE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_STUDENT_PAGE}"}), 400
+
+    conditions, params = [], {}
+    if cursor is not None:
+        conditions.append("students.id > :cursor")
+        params['cursor'] = cursor
+    for name, value in filters.items():
+        if value is not None:
+            conditions.append(f"students.{name} = :{name}")
+            params[name] = value
+    # The id is always selected (as _id) because the cursor is built from it
+    query = "SELECT students.id as _id, " + ", ".join(f"{STUDENT_FIELDS[field]} as {field}" for field in fields) + " FROM students"
+    if 'teacher_name' in fields:
+        query += " LEFT JOIN users ON students.teacher = users.id"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY students.id"
+    if limit is not None:
+        query += " LIMIT :limit"
+        params['limit'] = limit + 1  # one extra row tells us whether there is a next page
+
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for get_students')
         return jsonify([]), 500
 
-    # Query the students table and join with the users table to get the teacher's name
-    result = connection.execute(text("""
-        SELECT students.id, students.first_name, students.last_name, students.points, students.grad_year, students.house, users.name as teacher_name
-        FROM students
-        LEFT JOIN users ON students.teacher = users.id
-    """))
-    students = [dict(row._mapping) for row in result]
-    connection.close()
+    try:
+        result = connection.execution_options(stream_results=True).execute(text(query), params)
+    except Exception as e:
+        connection.close()
+        log_action('ERROR', f'Error fetching students: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        try:
+            yield '{"students": [' if limit is not None else '['
+            count, last_id, more, chunk = 0, None, False, []
+            for row in result:
+                if limit is not None and count == limit:
+                    more = True
+                    break
+                student = dict(row._mapping)
+                last_id = student.pop('_id')
+                chunk.append(app.json.dumps(student))
+                count += 1
+                if len(chunk) == 100:
+                    yield ("," if count > 100 else "") + ",".join(chunk)
+                    chunk = []
+            if chunk:
+                yield ("," if count > len(chunk) else "") + ",".join(chunk)
+            yield ']' if limit is None else '], "next_cursor": ' + app.json.dumps(last_id if more else None) + '}'
+        finally:
+            result.close()
+            connection.close()
 
     log_action('INFO', 'get_students executed successfully', method=request.method, url=request.url, status_code=200)
-    return jsonify(students)
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/api/currentuser', methods=['OPTIONS', 'GET'])
+@require_auth()
 def get_current_user():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    print(auth_header)
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for get_current_user', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-    print(token)
-
-    connection = get_db_connection()
-    if not connection:
-        log_action('ERROR', 'Database connection failed for get_current_user')
-        return jsonify({"error": "Database connection failed"}), 500
-
-    result = connection.execute(text("SELECT id, name, email FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    connection.close()
-
-    if user:
-        user_dict = dict(user._mapping)
-        log_action('INFO', 'get_current_user executed successfully', user_id=user[0], username=user[1], method=request.method, url=request.url, status_code=200)
-        return jsonify(user_dict)
-    else:
-        log_action('ERROR', 'User not found for get_current_user', method=request.method, url=request.url, status_code=404)
-        return jsonify({"error": "User not found"}), 404
+    user = g.user
+    log_action('INFO', 'get_current_user executed successfully', user_id=user.id, username=user.name, method=request.method, url=request.url, status_code=200)
+    return jsonify({"id": user.id, "name": user.name, "email": user.email})
 
 @app.route('/api/addstudent', methods=['OPTIONS', 'POST'])
+@require_auth()
 def add_student():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for add_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else token
+    user = g.user
 
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for add_student')
         return jsonify({"error": "Database connection failed"}), 500
 
-    result = connection.execute(text("SELECT id FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
-        connection.close()
-        log_action('ERROR', 'Invalid token for add_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
-
     data = request.get_json()
     try:
-        connection.execute(text("""
+        result = connection.execute(text("""
             INSERT INTO students (first_name, last_name, grad_year, points, teacher, house)
             VALUES (:first_name, :last_name, :grad_year, :points, :teacher_id, :house)
         """), data)
+        totals.student_added(connection, data.get('house'), data.get('teacher_id'), data.get('points'))
         connection.commit()  # Ensure the transaction is committed
         connection.close()
+        student_index.upsert(result.lastrowid, _student_search_record(result.lastrowid, data.get('first_name'), data.get('last_name')))
         log_action('INFO', 'Student added successfully', user_id=user[0], method=request.method, url=request.url, status_code=201)
         return jsonify({"status": "success"}), 201
     except Exception as e:
@@ -279,7 +472,84 @@ def add_student():
         print(f"Error: {e}")  # Log the error
         return jsonify({"error": str(e)}), 500
 
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+IMPORT_MAX_ERRORS = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+IMPORT_MAX_BYTES = int(os.getenv('IMPORT_MAX_BYTES', 50 * 1024 * 1024))
+
+def _import_format(upload):
+    # ?format= wins, then the file name, then the content type; CSV otherwise
+    fmt = (request.args.get('format') or '').lower()
+    if not fmt:
+        name = (upload.filename if upload else '') or ''
+        content_type = (upload.mimetype if upload else request.mimetype) or ''
+        fmt = 'jsonl' if name.endswith(('.jsonl', '.ndjson')) or content_type in ('application/x-ndjson', 'application/jsonl', 'application/json') else 'csv'
+    return {'ndjson': 'jsonl', 'json': 'jsonl'}.get(fmt, fmt)
+
+@app.route('/api/students/import', methods=['OPTIONS', 'POST'])
+@require_auth()
+def import_students():
+    """Add students from a CSV (with header) or JSON-lines upload.
+
+    Send the file as multipart field `file` or as the raw request body. With
+    ?dry_run=1 every row is validated but nothing is written.
+    """
+    user = g.user
+    request.max_content_length = IMPORT_MAX_BYTES
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    if request.mimetype == 'multipart/form-data' and upload is None:
+        return jsonify({"error": "Upload the file in the 'file' field"}), 400
+    fmt = _import_format(upload)
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"error": "format must be csv or jsonl"}), 400
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    try:
+        batch_size = max(1, min(int(request.args.get('batch_size', IMPORT_BATCH_SIZE)), 10000))
+    except ValueError:
+        return jsonify({"error": "batch_size must be an integer"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for import_students')
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        rows = roster.read_rows(upload.stream if upload else request.stream, fmt)
+        report = roster.import_students(connection, rows, default_teacher=user[0], batch_size=batch_size,
+                                        dry_run=dry_run, max_errors=IMPORT_MAX_ERRORS)
+    except roster.ImportFailed as e:
+        connection.rollback()
+        connection.close()
+        if e.report['inserted']:
+            # The batches before the failure stay committed; the error response doesn't bump the data version
+            student_index.invalidate()
+            _data_changed()
+        if isinstance(e.error, HTTPException):
+            raise e.error
+        if isinstance(e.error, UnicodeDecodeError):
+            return jsonify(dict(e.report, error="The file must be UTF-8 text")), 400
+        log_action('ERROR', f"Error importing students after {e.report['inserted']} rows: {e}", user_id=user[0], method=request.method,
+                   url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify(dict(e.report, error=str(e))), 500
+    except HTTPException:
+        # e.g. RequestEntityTooLarge (413) for uploads over IMPORT_MAX_BYTES
+        connection.rollback()
+        connection.close()
+        raise
+    except Exception as e:
+        connection.rollback()
+        connection.close()
+        log_action('ERROR', f'Error importing students: {e}', user_id=user[0], method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify({"error": str(e)}), 500
+    connection.close()
+    if report['inserted']:
+        student_index.invalidate()
+    status_code = 201 if report['inserted'] else 200
+    log_action('INFO', f"Imported {report['inserted']} of {report['rows']} students ({report['invalid']} invalid, dry run: {dry_run})",
+               user_id=user[0], method=request.method, url=request.url, status_code=status_code)
+    return jsonify(report), status_code
+
 @app.route('/api/gethouses', methods=['OPTIONS', 'GET'])
+@response_cache.cached
 def get_houses():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
@@ -296,6 +566,7 @@ def get_houses():
     return jsonify(houses)
 
 @app.route('/api/gethousepoints', methods=['OPTIONS', 'GET'])
+@response_cache.cached
 def get_house_points():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
@@ -305,79 +576,254 @@ def get_house_points():
         log_action('ERROR', 'Database connection failed for get_house_points')
         return jsonify({"points": 0}), 500
 
-    result = connection.execute(text("SELECT SUM(points) as points FROM students WHERE house = :house_id"), {'house_id': house_id})
-    points = result.fetchone()[0] or 0  # Access the first element of the tuple
+    result = connection.execute(text("SELECT points FROM house_totals WHERE house_id = :house_id"), {'house_id': house_id})
+    row = result.fetchone()
+    points = row[0] if row else 0
     connection.close()
 
     log_action('INFO', 'get_house_points executed successfully', method=request.method, url=request.url, status_code=200)
     return jsonify({"points": points})
 
-@app.route('/api/topteachers', methods=['OPTIONS', 'GET'])
-def top_teachers():
+# Per-worker in-memory leaderboards, see leaderboards.py
+LEADERBOARD_MAX_LIMIT = int(os.getenv('LEADERBOARD_MAX_LIMIT', 100))
+leaderboards = Leaderboards(
+    engine,
+    version=response_cache.version,
+    term_start=datetime.strptime(os.environ['TERM_START'], '%Y-%m-%d').date() if os.getenv('TERM_START') else None,
+    poll_interval=float(os.getenv('LEADERBOARD_POLL', 1.0)),
+    rebuild_seconds=float(os.getenv('LEADERBOARD_REBUILD_SECONDS', 300)),
+)
+
+def _legacy_board(entries):
+    return [{"rank": entry['rank'], "name": entry['name'], "value": entry['value']} for entry in entries]
+
+def top_teachers_list():
+    return _legacy_board(leaderboards.top('teachers', limit=10))
+
+def top_students_list():
+    return _legacy_board(leaderboards.top('students', limit=10))
+
+def _compute_standings_snapshot():
+    with db_connection(engine) as connection:
+        return {
+            'houses': totals.house_standings(connection),
+            'top_students': top_students_list(),
+            'top_teachers': top_teachers_list(),
+        }
+
+standings_feed = StandingsFeed(_compute_standings_snapshot, response_cache.version, poll_interval=float(os.getenv('STREAM_POLL_INTERVAL', 1.0)))
+STREAM_KEEPALIVE = float(os.getenv('STREAM_KEEPALIVE', 15))
+STREAM_MAX_SECONDS = float(os.getenv('STREAM_MAX_SECONDS', 300))
+
+@app.route('/api/stream/standings', methods=['OPTIONS', 'GET'])
+def stream_standings():
+    """Server-Sent Events: a 'snapshot' event on connect, then 'delta' events when standings change.
+
+    Streams end after STREAM_MAX_SECONDS and EventSource reconnects by itself,
+    which keeps a sync worker from being held forever. Run gunicorn with the
+    gevent worker class so idle streams don't each occupy a worker.
+    """
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    # Subscribe first so no change can slip in between the snapshot and the first delta
+    subscriber = standings_feed.subscribe()
+    try:
+        snapshot = standings_feed.snapshot()
+    except RETRYABLE_ERRORS:
+        standings_feed.unsubscribe(subscriber)
+        log_action('ERROR', 'Database connection failed for stream_standings')
+        return jsonify({"error": "Database connection failed"}), 500
+
+    def generate():
+        try:
+            yield "retry: 3000\n" + format_event('snapshot', snapshot)
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            while time.monotonic() < deadline and standings_feed.is_subscribed(subscriber):
+                try:
+                    yield subscriber.get(timeout=min(STREAM_KEEPALIVE, max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            standings_feed.unsubscribe(subscriber)
+
+    log_action('INFO', 'stream_standings subscribed', method=request.method, url=request.url, status_code=200)
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/housestandings', methods=['OPTIONS', 'GET'])
+@response_cache.cached
+def get_house_standings():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
     connection = get_db_connection()
     if not connection:
-        log_action('ERROR', 'Database connection failed for top_teachers')
+        log_action('ERROR', 'Database connection failed for get_house_standings')
         return jsonify([]), 500
 
-    result = connection.execute(text("""
-        SELECT users.name, SUM(students.points) as total_points
-        FROM students
-        JOIN users ON students.teacher = users.id
-        GROUP BY users.name
-        ORDER BY total_points DESC
-        LIMIT 10
-    """))
-    top_teachers = [{"rank": idx + 1, "name": row[0], "value": row[1]} for idx, row in enumerate(result)]
+    standings = totals.house_standings(connection)
     connection.close()
 
+    log_action('INFO', 'get_house_standings executed successfully', method=request.method, url=request.url, status_code=200)
+    return jsonify(standings)
+
+@app.route('/api/topteachers', methods=['OPTIONS', 'GET'])
+@response_cache.cached
+def top_teachers():
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    try:
+        top_teachers = top_teachers_list()
+    except RETRYABLE_ERRORS:
+        log_action('ERROR', 'Database connection failed for top_teachers')
+        return jsonify([]), 500
+
     log_action('INFO', 'top_teachers executed successfully', method=request.method, url=request.url, status_code=200)
     return jsonify(top_teachers)
 
 @app.route('/api/topstudents', methods=['OPTIONS', 'GET'])
+@response_cache.cached
 def top_students():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
-    connection = get_db_connection()
-    if not connection:
+    try:
+        top_students = top_students_list()
+    except RETRYABLE_ERRORS:
         log_action('ERROR', 'Database connection failed for top_students')
         return jsonify([]), 500
 
-    result = connection.execute(text("""
-        SELECT first_name, last_name, points
-        FROM students
-        ORDER BY points DESC
-        LIMIT 10
-    """))
-    top_students = [{"rank": idx + 1, "name": f"{row[0]} {row[1]}", "value": row[2]} for idx, row in enumerate(result)]
-    connection.close()
-
     log_action('INFO', 'top_students executed successfully', method=request.method, url=request.url, status_code=200)
     return jsonify(top_students)
 
-@app.route('/api/editself', methods=['OPTIONS', 'PUT'])
-def edit_self():
+@app.route('/api/leaderboard', methods=['OPTIONS', 'GET'])
+def leaderboard():
+    """Top students or teachers from the in-memory leaderboards.
+
+    board: students (default) or teachers. scope (students only): overall,
+    house, grad_year or teacher, with id=<house/grad year/teacher id>. window:
+    all (default), week or term. ranking: competition (default, 1,1,3), dense
+    (1,1,2) or ordinal.
+    """
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for edit_self', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-    
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-    
+    board = request.args.get('board', 'students')
+    scope = request.args.get('scope', 'overall')
+    window = request.args.get('window', 'all')
+    ranking = request.args.get('ranking', 'competition')
+    if board not in ('students', 'teachers') or scope not in STUDENT_SCOPES or window not in WINDOWS or ranking not in RANKINGS:
+        return jsonify({"error": f"board: students|teachers, scope: {'|'.join(STUDENT_SCOPES)}, window: {'|'.join(WINDOWS)}, ranking: {'|'.join(RANKINGS)}"}), 400
+    try:
+        scope_id = _int_arg('id')
+        limit = _int_arg('limit') or 10
+    except ValueError:
+        return jsonify({"error": "id and limit must be integers"}), 400
+    if board == 'teachers' and (scope != 'overall' or scope_id is not None):
+        return jsonify({"error": "the teachers board has no scopes; use scope=overall without an id"}), 400
+    if scope != 'overall' and scope_id is None:
+        return jsonify({"error": f"scope {scope} needs an id"}), 400
+    if not 1 <= limit <= LEADERBOARD_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {LEADERBOARD_MAX_LIMIT}"}), 400
+    try:
+        entries = leaderboards.top(board, scope, scope_id, window, limit, ranking)
+    except RETRYABLE_ERRORS:
+        log_action('ERROR', 'Database connection failed for leaderboard')
+        return jsonify({"error": "Database connection failed"}), 500
+    return jsonify({"board": board, "scope": scope, "id": scope_id, "window": window, "ranking": ranking, "entries": entries})
+
+HISTORY_MAX_DAYS = int(os.getenv('HISTORY_MAX_DAYS', 3660))
+MAX_HISTORY_RECENT = 100
+
+def _history_range():
+    """bucket, from and to of a history request; the current school year by default."""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in history.BUCKETS:
+        raise ValueError(f"bucket must be {'|'.join(history.BUCKETS)}")
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else datetime.utcnow().date()
+        start = date.fromisoformat(request.args['from']) if request.args.get('from') else period_start(end, 'academic_year')
+    except ValueError:
+        raise ValueError("from and to must be ISO dates, e.g. 2024-09-01")
+    if start > end or (end - start).days >= HISTORY_MAX_DAYS:
+        raise ValueError(f"from must be before to and at most {HISTORY_MAX_DAYS} days earlier")
+    return bucket, start, end
+
+def _history_response(key, bucket, start, end, before, periods, **extra):
+    return {"id": key, "bucket": bucket, "from": start.isoformat(), "to": end.isoformat(), "starting_points": before,
+            "total": sum(period['points'] for period in periods), "periods": periods, **extra}
+
+@app.route('/api/students/<int:student_id>/history', methods=['OPTIONS', 'GET'])
+@require_auth()
+def student_history(student_id):
+    """Points of a student per day, week or month, from the daily rollups.
+
+    Query parameters: bucket (day, week or month), from/to (ISO dates, default
+    the current school year) and recent=N for the student's latest N awards.
+    """
+    user = g.user
+    try:
+        bucket, start, end = _history_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        recent = _int_arg('recent') or 0
+    except ValueError:
+        recent = -1
+    if not 0 <= recent <= MAX_HISTORY_RECENT:
+        return jsonify({"error": f"recent must be between 0 and {MAX_HISTORY_RECENT}"}), 400
+
     connection = get_db_connection()
     if not connection:
-        log_action('ERROR', 'Database connection failed for edit_self')
+        log_action('ERROR', 'Database connection failed for student_history')
         return jsonify({"error": "Database connection failed"}), 500
-    
-    result = connection.execute(text("SELECT id, name, email, password FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
+    student = connection.execute(text("SELECT first_name, last_name, points FROM students WHERE id = :student_id"), {'student_id': student_id}).fetchone()
+    if not student:
+        connection.close()
+        return jsonify({"error": "Student not found"}), 404
+    before, periods = history.timeline(connection, 'student_daily_points', 'student_id', student_id, start, end, bucket)
+    extra = {"name": f"{student[0]} {student[1]}", "points": student[2]}
+    if recent:
+        extra['recent'] = [
+            {"id": row[0], "points": row[1], "timestamp": str(row[2]), "teacher_id": row[3]}
+            for row in connection.execute(text("""
+                SELECT id, ammount, timestamp, teacher_id FROM transaction_log WHERE student_id = :student_id ORDER BY id DESC LIMIT :limit
+            """), {'student_id': student_id, 'limit': recent})
+        ]
+    connection.close()
+
+    log_action('INFO', f'student_history executed for student {student_id}', user_id=user.id, username=user.name, method=request.method, url=request.url, status_code=200)
+    return jsonify(_history_response(student_id, bucket, start, end, before, periods, **extra))
+
+@app.route('/api/houses/<int:house_id>/timeline', methods=['OPTIONS', 'GET'])
+def house_timeline(house_id):
+    """Points of a house per day, week or month; same parameters as student_history (without recent)."""
+    if request.method == 'OPTIONS':
+        return _build_cors_preflight_response()
+    try:
+        bucket, start, end = _history_range()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for house_timeline')
+        return jsonify({"error": "Database connection failed"}), 500
+    house = connection.execute(text("SELECT name FROM houses WHERE id = :house_id"), {'house_id': house_id}).fetchone()
+    if not house:
         connection.close()
-        log_action('ERROR', 'Invalid token for edit_self', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
+        return jsonify({"error": "House not found"}), 404
+    before, periods = history.timeline(connection, 'house_daily_points', 'house_id', house_id, start, end, bucket)
+    connection.close()
+
+    log_action('INFO', 'house_timeline executed successfully', method=request.method, url=request.url, status_code=200)
+    return jsonify(_history_response(house_id, bucket, start, end, before, periods, name=house[0]))
+
+@app.route('/api/editself', methods=['OPTIONS', 'PUT'])
+@require_auth()
+def edit_self():
+    user = g.user
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for edit_self')
+        return jsonify({"error": "Database connection failed"}), 500
     
     data = request.get_json()
     updates = {}
@@ -386,7 +832,8 @@ def edit_self():
     if 'email' in data:
         updates['email'] = data['email']
     if 'currentPassword' in data and 'newPassword' in data:
-        if check_password_hash(user[3], data['currentPassword']):  # Access password by index
+        password_hash = connection.execute(text("SELECT password FROM users WHERE id = :id"), {'id': user[0]}).fetchone()[0]
+        if check_password_hash(password_hash, data['currentPassword']):
             updates['password'] = generate_password_hash(data['newPassword'])
         else:
             connection.close()
@@ -398,6 +845,8 @@ def edit_self():
             connection.execute(text("UPDATE users SET " + ", ".join(f"{key} = :{key}" for key in updates.keys()) + " WHERE id = :id"), {**updates, 'id': user[0]})
             connection.commit()
             connection.close()
+            token_cache.invalidate_user(user[0])
+            teacher_index.update(user[0], **{key: value for key, value in updates.items() if key in ('name', 'email')})
             log_action('INFO', 'User edited successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
             return jsonify({"status": "success"}), 200
         except Exception as e:
@@ -411,91 +860,47 @@ def edit_self():
         return jsonify({"status": "no changes made"}), 200
 
 @app.route('/api/isadmin', methods=['OPTIONS', 'GET'])
+@require_auth()
 def is_admin():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for is_admin', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-
-    connection = get_db_connection()
-    if not connection:
-        log_action('ERROR', 'Database connection failed for is_admin')
-        return jsonify({"error": "Database connection failed"}), 500
-
-    result = connection.execute(text("SELECT admin FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    connection.close()
-
-    if user and user[0] == 1:
-        log_action('INFO', 'is_admin executed successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
-        return jsonify({"is_admin": True})
-    else:
-        log_action('INFO', 'is_admin executed successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
-        return jsonify({"is_admin": False})
+    user = g.user
+    log_action('INFO', 'is_admin executed successfully', user_id=user.id, method=request.method, url=request.url, status_code=200)
+    return jsonify({"is_admin": user.admin})
 
 @app.route('/admin', methods=['OPTIONS', 'GET'])
+@require_auth()
 def admin_page():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for admin_page', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-
-    connection = get_db_connection()
-    if not connection:
-        log_action('ERROR', 'Database connection failed for admin_page')
-        return jsonify({"error": "Database connection failed"}), 500
-
-    result = connection.execute(text("SELECT admin FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    connection.close()
-
-    if user and user[0] == 1:
-        log_action('INFO', 'Admin accessed admin_page', user_id=user[0], method=request.method, url=request.url, status_code=200)
+    user = g.user
+    if user.admin:
+        log_action('INFO', 'Admin accessed admin_page', user_id=user.id, method=request.method, url=request.url, status_code=200)
         return jsonify({"message": "Welcome to the admin page"})
     else:
-        log_action('ERROR', 'Access denied for admin_page', user_id=user[0], method=request.method, url=request.url, status_code=403)
+        log_action('ERROR', 'Access denied for admin_page', user_id=user.id, method=request.method, url=request.url, status_code=403)
         return jsonify({"error": "Access denied"}), 403
 
 @app.route('/api/awardpoints', methods=['OPTIONS', 'POST'])
+@require_auth()
 def award_points():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for award_points', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
+    user = g.user
 
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for award_points')
         return jsonify({"error": "Database connection failed"}), 500
 
-    result = connection.execute(text("SELECT id FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
-        connection.close()
-        log_action('ERROR', 'Invalid token for award_points', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
-
     data = request.get_json()
+    # UTC, like every other timestamp the backend writes; history.py buckets awards by the day of it
+    awarded_at = datetime.utcnow().replace(microsecond=0)
     try:
         connection.execute(text("""
-            INSERT INTO transaction_log (student_id, ammount, reason, teacher_id)
-            VALUES (:student_id, :points, :reason, :teacher_id)
-        """), {'student_id': data['studentId'], 'points': data['points'], 'reason': data['reason'], 'teacher_id': user[0]})
+            INSERT INTO transaction_log (student_id, ammount, reason, teacher_id, timestamp)
+            VALUES (:student_id, :points, :reason, :teacher_id, :timestamp)
+        """), {'student_id': data['studentId'], 'points': data['points'], 'reason': data['reason'], 'teacher_id': user[0], 'timestamp': awarded_at})
         connection.execute(text("""
             UPDATE students SET points = points + :points WHERE id = :student_id
         """), {'points': data['points'], 'student_id': data['studentId']})
+        student = totals.points_awarded(connection, data['studentId'], data['points'])
+        if student:
+            history.points_awarded(connection, [(data['studentId'], student[0], data['points'])], awarded_at)
         connection.commit()
         connection.close()
         log_action('INFO', 'Points awarded successfully', user_id=user[0], method=request.method, url=request.url, status_code=201)
@@ -506,7 +911,114 @@ def award_points():
         log_action('ERROR', f'Error awarding points: {e}', user_id=user[0], method=request.method, url=request.url, status_code=500, stack_trace=str(e))
         return jsonify({"error": str(e)}), 500
 
+BULK_AWARD_LIMIT = int(os.getenv('BULK_AWARD_LIMIT', 1000))
+
+def _parse_bulk_entries(entries):
+    # Returns (awards, results): awards are the entries that parsed, results hold the rejects
+    awards, results = [], []
+    for index, entry in enumerate(entries):
+        try:
+            awards.append({'index': index, 'student_id': int(entry['studentId']), 'points': int(entry['points']), 'reason': entry['reason']})
+        except (KeyError, TypeError, ValueError) as e:
+            results.append({'index': index, 'studentId': entry.get('studentId') if isinstance(entry, dict) else None, 'status': 'invalid', 'error': f'Invalid entry: {e}'})
+    return awards, results
+
+def _select_students(connection, student_ids=None, house=None, grad_year=None):
+    conditions, params = [], {}
+    if student_ids is not None:
+        conditions.append("id IN :ids")
+        params['ids'] = list(student_ids)
+    if house is not None:
+        conditions.append("house = :house")
+        params['house'] = house
+    if grad_year is not None:
+        conditions.append("grad_year = :grad_year")
+        params['grad_year'] = grad_year
+    query = text("SELECT id, house, teacher FROM students WHERE " + " AND ".join(conditions))
+    if student_ids is not None:
+        query = query.bindparams(bindparam('ids', expanding=True))
+    return {row[0]: row for row in connection.execute(query, params)}
+
+@app.route('/api/awardpoints/bulk', methods=['OPTIONS', 'POST'])
+@require_auth()
+def award_points_bulk():
+    user = g.user
+    data = request.get_json() or {}
+
+    if 'entries' in data:
+        if not isinstance(data['entries'], list) or not data['entries']:
+            return jsonify({"error": "entries must be a non-empty list"}), 400
+        awards, results = _parse_bulk_entries(data['entries'])
+    elif 'selector' in data:
+        selector = data['selector'] or {}
+        if selector.get('house') is None and selector.get('grad_year') is None:
+            return jsonify({"error": "selector needs a house and/or grad_year"}), 400
+        try:
+            points = int(data['points'])
+            reason = data['reason']
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "points and reason are required with a selector"}), 400
+        awards, results = None, []
+    else:
+        return jsonify({"error": "Send either entries or selector"}), 400
+
+    if awards is not None and len(awards) > BULK_AWARD_LIMIT:
+        return jsonify({"error": f"At most {BULK_AWARD_LIMIT} entries per request"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for award_points_bulk')
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        if awards is None:
+            students = _select_students(connection, house=selector.get('house'), grad_year=selector.get('grad_year'))
+            awards = [{'index': index, 'student_id': student_id, 'points': points, 'reason': reason} for index, student_id in enumerate(students)]
+        else:
+            students = _select_students(connection, student_ids={award['student_id'] for award in awards}) if awards else {}
+            for award in awards:
+                if award['student_id'] not in students:
+                    results.append({'index': award['index'], 'studentId': award['student_id'], 'status': 'not_found', 'error': 'Student not found'})
+            awards = [award for award in awards if award['student_id'] in students]
+
+        if awards:
+            awarded_at = datetime.utcnow().replace(microsecond=0)
+            connection.execute(text("""
+                INSERT INTO transaction_log (student_id, ammount, reason, teacher_id, timestamp)
+                VALUES (:student_id, :points, :reason, :teacher_id, :timestamp)
+            """), [{**award, 'teacher_id': user[0], 'timestamp': awarded_at} for award in awards])
+
+            # One UPDATE for every student, adding up entries for the same student
+            deltas = {}
+            for award in awards:
+                deltas[award['student_id']] = deltas.get(award['student_id'], 0) + award['points']
+            params = {'ids': list(deltas)}
+            cases = []
+            for i, (student_id, points) in enumerate(deltas.items()):
+                cases.append(f"WHEN :id{i} THEN :points{i}")
+                params[f'id{i}'] = student_id
+                params[f'points{i}'] = points
+            connection.execute(text(
+                "UPDATE students SET points = points + CASE id " + " ".join(cases) + " END WHERE id IN :ids"
+            ).bindparams(bindparam('ids', expanding=True)), params)
+            totals.points_awarded_bulk(connection, [(students[student_id][1], students[student_id][2], points) for student_id, points in deltas.items()])
+            history.points_awarded(connection, [(award['student_id'], students[award['student_id']][1], award['points']) for award in awards], awarded_at)
+        connection.commit()
+        connection.close()
+    except Exception as e:
+        connection.rollback()
+        connection.close()
+        log_action('ERROR', f'Error awarding points in bulk: {e}', user_id=user[0], method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify({"error": str(e)}), 500
+
+    results.extend({'index': award['index'], 'studentId': award['student_id'], 'status': 'awarded', 'points': award['points']} for award in awards)
+    results.sort(key=lambda result: result['index'])
+    status_code = 201 if awards else 400
+    log_action('INFO', f'Bulk award: {len(awards)} awarded, {len(results) - len(awards)} rejected', user_id=user[0], method=request.method, url=request.url, status_code=status_code)
+    return jsonify({"status": "success" if awards else "failed", "awarded": len(awards), "results": results}), status_code
+
 @app.route('/api/getteachers', methods=['OPTIONS', 'GET'])
+@response_cache.cached
 def get_teachers():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
@@ -523,28 +1035,15 @@ def get_teachers():
     return jsonify(teachers)
 
 @app.route('/api/deleteteacher', methods=['OPTIONS', 'DELETE'])
+@require_auth()
 def delete_teacher():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for delete_teacher', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
+    user = g.user
 
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for delete_teacher')
         return jsonify({"error": "Database connection failed"}), 500
 
-    result = connection.execute(text("SELECT id FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
-        connection.close()
-        log_action('ERROR', 'Invalid token for delete_teacher', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
-
     data = request.get_json()
     user_id = data.get('userId')
     if not user_id:
@@ -554,9 +1053,12 @@ def delete_teacher():
 
     try:
         connection.execute(text("UPDATE students SET teacher = 1 WHERE teacher = :user_id"), {'user_id': user_id})
+        totals.teacher_reassigned(connection, user_id, 1)
         connection.execute(text("DELETE FROM users WHERE id = :user_id"), {'user_id': user_id})
         connection.commit()
         connection.close()
+        token_cache.invalidate_user(user_id)
+        teacher_index.remove(int(user_id))
         log_action('INFO', 'Teacher deleted successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
         return jsonify({"status": "success"}), 200
     except Exception as e:
@@ -566,28 +1068,15 @@ def delete_teacher():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/deletestudent', methods=['OPTIONS', 'DELETE'])
+@require_auth()
 def delete_student():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for delete_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
+    user = g.user
 
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for delete_student')
         return jsonify({"error": "Database connection failed"}), 500
 
-    result = connection.execute(text("SELECT id FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
-        connection.close()
-        log_action('ERROR', 'Invalid token for delete_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
-
     data = request.get_json()
     student_id = data.get('userId')
     if not student_id:
@@ -596,11 +1085,14 @@ def delete_student():
         return jsonify({"error": "Student ID is missing"}), 400
 
     try:
+        totals.student_removed(connection, totals.get_student(connection, student_id))
         # Delete related entries in transaction_log first
         connection.execute(text("DELETE FROM transaction_log WHERE student_id = :student_id"), {'student_id': student_id})
+        connection.execute(text("DELETE FROM student_daily_points WHERE student_id = :student_id"), {'student_id': student_id})
         connection.execute(text("DELETE FROM students WHERE id = :student_id"), {'student_id': student_id})
         connection.commit()
         connection.close()
+        student_index.remove(int(student_id))
         log_action('INFO', 'Student deleted successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
         return jsonify({"status": "success"}), 200
     except Exception as e:
@@ -609,96 +1101,93 @@ def delete_student():
         log_action('ERROR', f'Error deleting student: {e}', user_id=user[0], method=request.method, url=request.url, status_code=500, stack_trace=str(e))
         return jsonify({"error": str(e)}), 500
 
-def is_admin_user(token):
-    connection = get_db_connection()
-    if not connection:
-        return False
-    result = connection.execute(text("SELECT admin FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    connection.close()
-    return user and user[0] == 1
+def _submit_job(kind, action, params=None):
+    # Queue a job from maintenance.JOB_TYPES; the caller polls /api/jobs/<id> for progress
+    try:
+        job_id = job_runner.submit(kind, params, user_id=g.user.id)
+    except JobConflict as e:
+        log_action('WARNING', f'{action} not started: {e}', user_id=g.user.id, method=request.method, url=request.url, status_code=409)
+        return jsonify({"error": str(e), "job_id": e.job_id, "status_url": f"/api/jobs/{e.job_id}"}), 409
+    except RETRYABLE_ERRORS:
+        log_action('ERROR', f'Database connection failed for {action}')
+        return jsonify({"error": "Database connection failed"}), 500
+    log_action('INFO', f'{action} started as job {job_id}', user_id=g.user.id, method=request.method, url=request.url, status_code=202)
+    return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
 
 @app.route('/api/clearhousepoints', methods=['OPTIONS', 'POST'])
+@require_auth(admin=True)
 def clear_housepoints():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for clear_housepoints', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
+    return _submit_job('reset_points', 'Clearing house points')
 
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
+@app.route('/api/deleteallstudents', methods=['OPTIONS', 'DELETE'])
+@require_auth(admin=True)
+def delete_all_students():
+    return _submit_job('purge_students', 'Deleting all students')
 
-    if not is_admin_user(token):
-        log_action('ERROR', 'Unauthorized access to clear_housepoints', method=request.method, url=request.url, status_code=403)
-        return jsonify({"error": "Unauthorized"}), 403
+@app.route('/api/jobs', methods=['OPTIONS', 'GET', 'POST'])
+@require_auth(admin=True)
+def jobs():
+    """POST {"kind": ..., "params": {...}} starts a job, GET lists the latest ones (?kind=, ?status=, ?limit=)."""
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        if data.get('kind') not in JOB_TYPES:
+            return jsonify({"error": f"kind must be one of {', '.join(sorted(JOB_TYPES))}"}), 400
+        return _submit_job(data['kind'], f"Job {data['kind']}", data.get('params'))
 
     connection = get_db_connection()
     if not connection:
-        log_action('ERROR', 'Database connection failed for clear_housepoints')
+        log_action('ERROR', 'Database connection failed for jobs')
         return jsonify({"error": "Database connection failed"}), 500
-
     try:
-        connection.execute(text("UPDATE students SET points = 0"))
-        connection.commit()
+        limit = max(1, min(_int_arg('limit') or 50, 200))
+    except ValueError:
         connection.close()
-        log_action('INFO', 'House points cleared successfully', method=request.method, url=request.url, status_code=200)
-        return jsonify({"status": "success"}), 200
-    except Exception as e:
-        connection.rollback()
+        return jsonify({"error": "limit must be an integer"}), 400
+    try:
+        return jsonify(job_runner.list(connection, limit, request.args.get('kind'), request.args.get('status')))
+    finally:
         connection.close()
-        log_action('ERROR', f'Error clearing house points: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
-        return jsonify({"error": str(e)}), 500
-
-@app.route('/api/deleteallstudents', methods=['OPTIONS', 'DELETE'])
-def delete_all_students():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for delete_all_students', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-
-    if not is_admin_user(token):
-        log_action('ERROR', 'Unauthorized access to delete_all_students', method=request.method, url=request.url, status_code=403)
-        return jsonify({"error": "Unauthorized"}), 403
 
+@app.route('/api/jobs/<int:job_id>', methods=['OPTIONS', 'GET'])
+@require_auth(admin=True)
+def job_status(job_id):
     connection = get_db_connection()
     if not connection:
-        log_action('ERROR', 'Database connection failed for delete_all_students')
+        log_action('ERROR', 'Database connection failed for job_status')
         return jsonify({"error": "Database connection failed"}), 500
+    try:
+        job = job_runner.get(connection, job_id)
+    finally:
+        connection.close()
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
 
+@app.route('/api/jobs/<int:job_id>/cancel', methods=['OPTIONS', 'POST'])
+@require_auth(admin=True)
+def cancel_job(job_id):
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for cancel_job')
+        return jsonify({"error": "Database connection failed"}), 500
     try:
-        # Delete related entries in transaction_log first
-        connection.execute(text("DELETE FROM transaction_log WHERE student_id IN (SELECT id FROM students)"))
-        connection.execute(text("DELETE FROM students"))
+        job_runner.cancel(connection, job_id)
         connection.commit()
-        connection.close()
-        log_action('INFO', 'All students deleted successfully', method=request.method, url=request.url, status_code=200)
-        return jsonify({"status": "success"}), 200
+        job = job_runner.get(connection, job_id)
     except Exception as e:
         connection.rollback()
-        connection.close()
-        log_action('ERROR', f'Error deleting all students: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        log_action('ERROR', f'Error cancelling job {job_id}: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
         return jsonify({"error": str(e)}), 500
+    finally:
+        connection.close()
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    log_action('INFO', f'Cancel requested for job {job_id}', user_id=g.user.id, method=request.method, url=request.url, status_code=200)
+    return jsonify(job)
 
 @app.route('/api/addteacher', methods=['OPTIONS', 'POST'])
+@require_auth(admin=True)
 def add_teacher():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for add_teacher', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-
-    if not is_admin_user(token):
-        log_action('ERROR', 'Unauthorized access to add_teacher', method=request.method, url=request.url, status_code=403)
-        return jsonify({"error": "Unauthorized"}), 403
-
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for add_teacher')
@@ -711,12 +1200,13 @@ def add_teacher():
     hashed_password = generate_password_hash(password)
 
     try:
-        connection.execute(text("""
+        result = connection.execute(text("""
             INSERT INTO users (name, email, password, admin, token)
             VALUES (:name, :email, :password, 0, :token)
         """), {'name': name, 'email': email, 'password': hashed_password, 'token': str(uuid.uuid4())})
         connection.commit()
         connection.close()
+        teacher_index.upsert(result.lastrowid, {'id': result.lastrowid, 'name': name, 'email': email})
         log_action('INFO', 'Teacher added successfully', method=request.method, url=request.url, status_code=201)
         return jsonify({"status": "success"}), 201
     except Exception as e:
@@ -725,26 +1215,178 @@ def add_teacher():
         log_action('ERROR', f'Error adding teacher: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
         return jsonify({"error": str(e)}), 500
 
+MAX_LOG_PAGE = int(os.getenv('MAX_LOG_PAGE', 500))
+
+def _log_cursor(row):
+    # "<timestamp>,<id>" of the last row of a page; the timestamp is kept as the database stores it
+    timestamp = row['timestamp']
+    return f"{timestamp.isoformat(sep=' ') if isinstance(timestamp, datetime) else timestamp},{row['id']}"
+
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
+    """Logs newest first, ordered by (timestamp, id) so pages never skip or repeat rows.
+
+    Filters: level (comma separated), user_id, status_code and url (substring).
+    Without limit the newest MAX_LOG_PAGE matching rows come back as a plain
+    array; with limit the response is {"logs": [...], "next_cursor": ...} and
+    the next page is requested with cursor=<next_cursor>.
+    """
+    try:
+        limit = _int_arg('limit')
+        user_id = _int_arg('user_id')
+        status_code = _int_arg('status_code')
+    except ValueError:
+        return jsonify({"error": "limit, user_id and status_code must be integers"}), 400
+    if limit is not None and not 1 <= limit <= MAX_LOG_PAGE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_LOG_PAGE}"}), 400
+
+    conditions, params = [], {}
+    cursor = request.args.get('cursor')
+    if cursor:
+        timestamp, _, cursor_id = cursor.rpartition(',')
+        try:
+            params['cursor_id'] = int(cursor_id)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        params['cursor_ts'] = timestamp
+        conditions.append("(timestamp < :cursor_ts OR (timestamp = :cursor_ts AND id < :cursor_id))")
+    levels = [level.strip().upper() for level in request.args.get('level', '').split(',') if level.strip()]
+    if levels:
+        conditions.append("log_level IN :levels")
+        params['levels'] = levels
+    if user_id is not None:
+        conditions.append("user_id = :user_id")
+        params['user_id'] = user_id
+    if status_code is not None:
+        conditions.append("status_code = :status_code")
+        params['status_code'] = status_code
+    if request.args.get('url'):
+        conditions.append("url LIKE :url ESCAPE '!'")
+        params['url'] = '%' + request.args['url'].replace('!', '!!').replace('%', '!%').replace('_', '!_') + '%'
+    query = """
+        SELECT id, timestamp, log_level as level, message, module, user_id, username, method, url, status_code, stack_trace, ip_address, device
+        FROM logs
+    """
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY timestamp DESC, id DESC LIMIT :limit"
+    params['limit'] = (limit + 1) if limit is not None else MAX_LOG_PAGE
+    query = text(query)
+    if levels:
+        query = query.bindparams(bindparam('levels', expanding=True))
+
     connection = get_db_connection()
     if not connection:
         log_action('ERROR', 'Database connection failed for get_logs')
         return jsonify([]), 500
 
-    result = connection.execute(text("""
-        SELECT id, timestamp, log_level as level, message, module, user_id, username, method, url, status_code, stack_trace, ip_address, device
-        FROM logs
-        ORDER BY timestamp DESC
-        LIMIT 500
-    """))
-    logs = [dict(row._mapping) for row in result]
+    logs = [dict(row._mapping) for row in connection.execute(query, params)]
     connection.close()
 
     log_action('INFO', 'get_logs executed successfully', method=request.method, url=request.url, status_code=200)
-    return jsonify(logs)
+    if limit is None:
+        return jsonify(logs)
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = _log_cursor(logs[-1])
+    return jsonify({"logs": logs, "next_cursor": next_cursor})
+
+@app.route('/api/logs/hourly', methods=['GET'])
+def get_log_rollups():
+    """Hourly request counts per route of compacted INFO logs, see maintenance.CompactLogs."""
+    try:
+        start = exports.parse_date_bound(request.args.get('from'))
+        end = exports.parse_date_bound(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO dates, e.g. 2024-09-01"}), 400
+    conditions, params = [], {}
+    if start is not None:
+        conditions.append("hour >= :start")
+        params['start'] = start
+    if end is not None:
+        conditions.append("hour < :end")
+        params['end'] = end
+    if request.args.get('route'):
+        conditions.append("route = :route")
+        params['route'] = request.args['route']
+    query = "SELECT hour, route, method, status_code, requests FROM log_rollups"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY hour DESC, route, method, status_code LIMIT 10000"
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for get_log_rollups')
+        return jsonify([]), 500
+    rollups = [dict(row._mapping) for row in connection.execute(text(query), params)]
+    connection.close()
+    return jsonify(rollups)
+
+EXPORT_YIELD_PER = int(os.getenv('EXPORT_YIELD_PER', 1000))
+
+@app.route('/api/export/<dataset>', methods=['OPTIONS', 'GET'])
+@require_auth(admin=True)
+def export_data(dataset):
+    """Stream a whole table as CSV or NDJSON, see exports.py.
+
+    Query parameters: format (csv or ndjson), from/to (ISO dates or datetimes,
+    `to` inclusive for a plain date) and gzip=1 for a .gz download. Clients
+    sending Accept-Encoding: gzip get the stream compressed either way.
+    """
+    user = g.user
+    if dataset not in exports.DATASETS:
+        return jsonify({"error": f"Unknown export {dataset}, choose from {', '.join(exports.DATASETS)}"}), 404
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in exports.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    try:
+        start = exports.parse_date_bound(request.args.get('from'))
+        end = exports.parse_date_bound(request.args.get('to'), end=True)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO dates, e.g. 2024-09-01"}), 400
+    if (start or end) and not exports.DATASETS[dataset]['date_column']:
+        return jsonify({"error": f"{dataset} can't be filtered by date"}), 400
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for export_data')
+        return jsonify({"error": "Database connection failed"}), 500
+
+    query, params = exports.build_query(dataset, start, end)
+    try:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_YIELD_PER).execute(query, params)
+    except Exception as e:
+        connection.close()
+        log_action('ERROR', f'Error exporting {dataset}: {e}', user_id=user[0], method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify({"error": str(e)}), 500
+
+    def generate():
+        try:
+            yield from exports.encode_rows(result, fmt)
+        finally:
+            result.close()
+            connection.close()
+
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d-%H%M%S}.{fmt}"
+    headers = {}
+    body = generate()
+    if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+        body, mimetype, filename = exports.gzip_chunks(body), 'application/gzip', filename + '.gz'
+    else:
+        mimetype = exports.FORMATS[fmt]
+        if 'gzip' in request.accept_encodings:
+            body = exports.gzip_chunks(body)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Vary'] = 'Accept-Encoding'
+    headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    log_action('INFO', f'Export of {dataset} started', user_id=user[0], method=request.method, url=request.url, status_code=200)
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+MAX_ARCHIVE_PAGE = 100
 
 @app.route('/api/archive', methods=['OPTIONS', 'POST', "GET"])
+@response_cache.cached
 def archive():
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
@@ -764,112 +1406,96 @@ def archive():
         data = request.get_json()
         should_reset = data.get('resetstats', False) if data else False
 
-        datajson = []
         try:
-            # Get total number of students
-            student_count = connection.execute(text("SELECT COUNT(*) FROM students")).fetchone()[0]
-
-            # Get house data
-            houses = connection.execute(text("SELECT id, name FROM houses"))
-            for house in houses:
-                points = connection.execute(text("""
-                    SELECT SUM(points) as total_points FROM students WHERE house = :house_id
-                """), {'house_id': house[0]})
-                house_points = float(points.fetchone()[0] or 0)
-                datajson.append({
-                    'house_id': house[0],
-                    'house_name': house[1],
-                    'total_points': house_points
-                })
-            
-            # Store archive with timestamp
-            connection.execute(text("""
-                INSERT INTO archive (data, studentammount, timestamp) 
-                VALUES (:data, :student_count, NOW())
-            """), {
-                'data': json.dumps(datajson),
-                'student_count': student_count
-            })
+            archive_id, datajson = archives.create_snapshot(connection)
             connection.commit()
-            
-            # Only reset points if requested and user is admin
-            if should_reset and is_admin_user(token):
-                connection.execute(text("UPDATE students SET points = 0"))
-                connection.commit()
-            
             connection.close()
+
+            # Only reset points if requested and user is admin; that runs as a reset_points job
+            reset_job = None
+            try:
+                user = lookup_user(token) if should_reset else None
+            except RETRYABLE_ERRORS:
+                user = None
+            if user and user.admin:
+                try:
+                    reset_job = job_runner.submit('reset_points', user_id=user.id)
+                except JobConflict as e:
+                    reset_job = e.job_id
             log_action('INFO', 'Data archived successfully', method=request.method, url=request.url, status_code=201)
-            return jsonify({"status": "success", "archived_data": datajson}), 201
-            
+            return jsonify({"status": "success", "archive_id": archive_id, "archived_data": datajson, "reset_job_id": reset_job}), 201
+
         except Exception as e:
             connection.rollback()
             connection.close()
             log_action('ERROR', f'Error archiving: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
             return jsonify({"error": str(e)}), 500
-    
+
     if request.method == 'GET':
+        # Newest first. Without limit a plain array of every archive, with it
+        # {"archives": [...], "next_cursor": <id or null>}, continued with cursor=<next_cursor>
         try:
-            result = connection.execute(text("""
-                SELECT id, timestamp, data, studentammount 
-                FROM archive 
-                ORDER BY timestamp DESC
-            """))
-            archives = []
-            for row in result:
-                try:
-                    timestamp_str = row[1]
-                    formatted_timestamp = None
-                    if timestamp_str:
-                        try:
-                            if isinstance(timestamp_str, str):
-                                
-                                timestamp_str = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-                            
-                            formatted_timestamp = timestamp_str.strftime("%Y-%m-%d %H:%M:%S")
-                        except (ValueError, TypeError):
-                            # If timestamp parsing fails, use None
-                            formatted_timestamp = None
-                            
-                    archives.append({
-                        'id': row[0],
-                        'timestamp': formatted_timestamp,
-                        'houses': json.loads(row[2]) if row[2] else [],
-                        'student_count': row[3]
-                    })
-                except (json.JSONDecodeError, TypeError, IndexError) as e:
-                    log_action('WARNING', f'Error parsing archive row: {e}', method=request.method, url=request.url)
-                    continue
-                    
+            limit = _int_arg('limit')
+            cursor = _int_arg('cursor')
+        except ValueError:
+            connection.close()
+            return jsonify({"error": "limit and cursor must be integers"}), 400
+        if limit is not None and not 1 <= limit <= MAX_ARCHIVE_PAGE:
+            connection.close()
+            return jsonify({"error": f"limit must be between 1 and {MAX_ARCHIVE_PAGE}"}), 400
+        try:
+            page, next_cursor = archives.archive_page(connection, limit, cursor)
             connection.close()
-            return jsonify(archives)
+            if limit is not None:
+                page = '{"archives": ' + page + ', "next_cursor": ' + json.dumps(next_cursor) + '}'
+            return Response(page, mimetype='application/json')
         except Exception as e:
             connection.close()
             log_action('ERROR', f'Error retrieving archives: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
             return jsonify({"error": str(e)}), 500
 
-@app.route('/api/editstudent', methods=['OPTIONS', 'PUT'])
-def editStudent():
+@app.route('/api/archive/diff', methods=['OPTIONS', 'GET'])
+@response_cache.cached
+def archive_diff():
+    """Per house change between two archives: ?from=<id>&to=<id or "current">."""
     if request.method == 'OPTIONS':
         return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for edit_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-    
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-    
+    from_arg, to_arg = request.args.get('from'), request.args.get('to', 'current')
+    if not from_arg or not from_arg.isdigit() or not (to_arg == 'current' or to_arg.isdigit()):
+        return jsonify({"error": "from must be an archive id and to an archive id or 'current'"}), 400
+
     connection = get_db_connection()
-    
     if not connection:
-        log_action('ERROR', 'Database connection failed for edit_student')
+        log_action('ERROR', 'Database connection failed for archive_diff')
         return jsonify({"error": "Database connection failed"}), 500
-    
-    result = connection.execute(text("SELECT id, name, email, password FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
+    try:
+        before_info = archives.archive_info(connection, int(from_arg))
+        if to_arg == 'current':
+            after_info = {'id': None, 'timestamp': None, 'student_count': connection.execute(text("SELECT COUNT(*) FROM students")).scalar()}
+            after = totals.house_standings(connection)
+        else:
+            after_info = archives.archive_info(connection, int(to_arg))
+            after = archives.snapshot_houses(connection, int(to_arg))
+        if before_info is None or after_info is None:
+            connection.close()
+            return jsonify({"error": "Archive not found"}), 404
+        before = archives.snapshot_houses(connection, int(from_arg))
+        connection.close()
+        return jsonify({"from": before_info, "to": after_info, "houses": archives.diff_houses(before, after)})
+    except Exception as e:
         connection.close()
-        log_action('ERROR', 'Invalid token for edit_student', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
+        log_action('ERROR', f'Error diffing archives: {e}', method=request.method, url=request.url, status_code=500, stack_trace=str(e))
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/editstudent', methods=['OPTIONS', 'PUT'])
+@require_auth()
+def editStudent():
+    user = g.user
+
+    connection = get_db_connection()
+    if not connection:
+        log_action('ERROR', 'Database connection failed for editStudent')
+        return jsonify({"error": "Database connection failed"}), 500
     
     data = request.get_json()
     
@@ -890,9 +1516,16 @@ def editStudent():
         
     if updates:
         try:
+            before = totals.get_student(connection, data['id'])
             connection.execute(text("UPDATE students SET " + ", ".join(f"{key} = :{key}" for key in updates.keys()) + " WHERE id = :id"), {**updates, 'id': data['id']})
+            totals.student_changed(connection, before, totals.get_student(connection, data['id']))
+            names = None
+            if 'first_name' in updates or 'last_name' in updates:
+                names = connection.execute(text("SELECT first_name, last_name FROM students WHERE id = :id"), {'id': data['id']}).fetchone()
             connection.commit()
             connection.close()
+            if names:
+                student_index.upsert(int(data['id']), _student_search_record(int(data['id']), names[0], names[1]))
             log_action('INFO', 'Student edited successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
             return jsonify({"status": "success"}), 200
         except Exception as e:
@@ -903,29 +1536,15 @@ def editStudent():
         
         
 @app.route('/api/editteacher', methods=['OPTIONS', 'PUT'])
+@require_auth()
 def editTeacher():
-    if request.method == 'OPTIONS':
-        return _build_cors_preflight_response()
-    auth_header = request.headers.get('Authorization')
-    if not auth_header:
-        log_action('ERROR', 'Token is missing for edit_teacher', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Token is missing"}), 401
-    
-    token = auth_header.split(" ")[-1] if " " in auth_header else auth_header
-    
+    user = g.user
+
     connection = get_db_connection()
-    
     if not connection:
-        log_action('ERROR', 'Database connection failed for edit_teacher')
+        log_action('ERROR', 'Database connection failed for editTeacher')
         return jsonify({"error": "Database connection failed"}), 500
     
-    result = connection.execute(text("SELECT id, name, email, password FROM users WHERE token = :token"), {'token': token})
-    user = result.fetchone()
-    if not user:
-        connection.close()
-        log_action('ERROR', 'Invalid token for edit_teacher', method=request.method, url=request.url, status_code=401)
-        return jsonify({"error": "Invalid token"}), 401
-    
     data = request.get_json()
     
     updates = {}
@@ -944,6 +1563,8 @@ def editTeacher():
             connection.execute(text("UPDATE users SET " + ", ".join(f"{key} = :{key}" for key in updates.keys()) + " WHERE id = :id"), {**updates, 'id': data['id']})
             connection.commit()
             connection.close()
+            token_cache.invalidate_user(data['id'])
+            teacher_index.update(int(data['id']), **{key: value for key, value in updates.items() if key in ('name', 'email')})
             log_action('INFO', 'Teacher edited successfully', user_id=user[0], method=request.method, url=request.url, status_code=200)
             return jsonify({"status": "success"}), 200
         except Exception as e:
@@ -955,5 +1576,38 @@ def editTeacher():
                 
                 
                 
+@app.cli.command('init-db')
+def init_db_command():
+    """Apply pending schema migrations (see migrations.py)."""
+    created = init_db(engine)
+    print(f"Created tables: {', '.join(created) or 'none'}")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """Show applied and pending schema migrations."""
+    with engine.connect() as connection:
+        applied = migrations.applied_versions(connection)
+    for version, description, _ in migrations.MIGRATIONS:
+        print(f"{version:>4}  {'applied ' + str(applied[version]) if version in applied else 'pending':<34} {description}")
+
+@app.cli.command('check-schema')
+def check_schema_command():
+    """Report missing indexes and hot queries that would scan whole tables."""
+    with engine.connect() as connection:
+        warnings = migrations.check_schema(connection)
+    for warning in warnings:
+        print(warning)
+    print(f"{len(warnings)} problems found")
+
+@app.cli.command('rebuild-totals')
+def rebuild_totals_command():
+    """Recompute house/teacher point totals from students and report drift."""
+    with engine.begin() as connection:
+        drift = totals.rebuild_totals(connection)
+    for table, key, stored, actual in drift:
+        print(f"{table} {key}: stored (points, students) {stored}, actual {actual}")
+    print(f"{len(drift)} drifted rows corrected")
+
+
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=8080, debug=True)
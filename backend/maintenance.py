@@ -0,0 +1,158 @@
+import os
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from sqlalchemy import text
+
+import totals
+
+
+# Long admin operations as chunked jobs for jobs.JobRunner. Each step works
+# on one primary key range (at most chunk_size rows) so that no transaction
+# holds locks for long and award_points keeps going while a job runs. Rows
+# added after a job started (ids above the maximum it recorded) are left alone.
+
+def _max_id(connection, table):
+    return connection.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+
+
+def _next_boundary(connection, table, cursor, last, chunk_size):
+    # Largest id of the next chunk_size rows after cursor, so sparse ids don't mean empty steps
+    boundary = connection.execute(text(f"""
+        SELECT MAX(id) FROM (SELECT id FROM {table} WHERE id > :cursor AND id <= :last ORDER BY id LIMIT :chunk_size) batch
+    """), {'cursor': cursor, 'last': last, 'chunk_size': chunk_size}).scalar()
+    return boundary if boundary is not None else last
+
+
+class ResetPoints:
+    """Set every student's points to 0, adjusting house/teacher totals chunk by chunk."""
+
+    def start(self, connection, params):
+        last = _max_id(connection, 'students')
+        total = connection.execute(text("SELECT COUNT(*) FROM students WHERE id <= :last"), {'last': last}).scalar()
+        return {'cursor': 0, 'last': last}, total
+
+    def step(self, connection, state, chunk_size):
+        low = state['cursor']
+        high = _next_boundary(connection, 'students', low, state['last'], chunk_size)
+        totals.points_reset_range(connection, low, high)
+        updated = connection.execute(text("UPDATE students SET points = 0 WHERE id > :low AND id <= :high"), {'low': low, 'high': high}).rowcount
+        state = dict(state, cursor=high)
+        return state, updated, high >= state['last']
+
+
+class PurgeStudents:
+    """Delete every student and their transaction_log rows.
+
+    Phases: the transaction_log rows of existing students by transaction id
+    range, then the students by id range (taking them out of the totals, with
+    their daily history rows), then a final sweep for rows written for those
+    students while the job ran. The houses' daily history stays.
+    """
+
+    def start(self, connection, params):
+        state = {'phase': 'transactions', 'cursor': 0,
+                 'last_transaction': _max_id(connection, 'transaction_log'), 'last_student': _max_id(connection, 'students')}
+        total = connection.execute(text("SELECT COUNT(*) FROM students WHERE id <= :last"), {'last': state['last_student']}).scalar()
+        total += connection.execute(text("SELECT COUNT(*) FROM transaction_log WHERE id <= :last"), {'last': state['last_transaction']}).scalar()
+        return state, total
+
+    def step(self, connection, state, chunk_size):
+        low = state['cursor']
+        if state['phase'] == 'transactions':
+            high = _next_boundary(connection, 'transaction_log', low, state['last_transaction'], chunk_size)
+            deleted = connection.execute(text("""
+                DELETE FROM transaction_log WHERE id > :low AND id <= :high
+                AND student_id IN (SELECT id FROM students WHERE id <= :last_student)
+            """), {'low': low, 'high': high, 'last_student': state['last_student']}).rowcount
+            if high >= state['last_transaction']:
+                return dict(state, phase='students', cursor=0), deleted, False
+            return dict(state, cursor=high), deleted, False
+
+        if state['phase'] == 'students':
+            high = _next_boundary(connection, 'students', low, state['last_student'], chunk_size)
+            totals.students_removed_range(connection, low, high)
+            connection.execute(text("DELETE FROM student_daily_points WHERE student_id > :low AND student_id <= :high"), {'low': low, 'high': high})
+            deleted = connection.execute(text("DELETE FROM students WHERE id > :low AND id <= :high"), {'low': low, 'high': high}).rowcount
+            if high >= state['last_student']:
+                return dict(state, phase='cleanup', cursor=0), deleted, False
+            return dict(state, cursor=high), deleted, False
+
+        deleted = connection.execute(text("""
+            DELETE FROM transaction_log WHERE id > :last_transaction AND student_id <= :last_student
+            AND student_id NOT IN (SELECT id FROM students)
+        """), {'last_transaction': state['last_transaction'], 'last_student': state['last_student']}).rowcount
+        connection.execute(text("""
+            DELETE FROM student_daily_points WHERE student_id <= :last_student AND student_id NOT IN (SELECT id FROM students)
+        """), {'last_student': state['last_student']})
+        return dict(state, phase='done'), deleted, True
+
+
+def _hour(timestamp):
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def count_log_rows(rows):
+    """Hourly counts {(hour, route, method, status_code): requests} of (timestamp, url, method, status_code) log rows."""
+    counts = {}
+    for timestamp, url, method, status_code in rows:
+        key = (_hour(timestamp), (urlsplit(url).path if url else '')[:255], (method or '')[:10], status_code or 0)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def write_log_rollups(connection, counts):
+    """Add counts from count_log_rows() to log_rollups."""
+    if not counts:
+        return
+    # compact_logs jobs and `partitions retire` can add to the same hour at once, so let the database merge them
+    statement = "INSERT INTO log_rollups (hour, route, method, status_code, requests) VALUES (:hour, :route, :method, :status_code, :requests)"
+    if connection.dialect.name == 'mysql':
+        statement += " ON DUPLICATE KEY UPDATE requests = requests + VALUES(requests)"
+    else:
+        statement += " ON CONFLICT (hour, route, method, status_code) DO UPDATE SET requests = log_rollups.requests + excluded.requests"
+    connection.execute(text(statement), [
+        {'hour': hour, 'route': route, 'method': method, 'status_code': status_code, 'requests': requests}
+        for (hour, route, method, status_code), requests in counts.items()
+    ])
+
+
+def add_log_rollups(connection, rows):
+    """Add (timestamp, url, method, status_code) log rows to the hourly counts in log_rollups."""
+    write_log_rollups(connection, count_log_rows(rows))
+
+
+class CompactLogs:
+    """Replace INFO log rows older than `days` (default retention_days) by hourly counts in log_rollups.
+
+    Warnings and errors are kept. Every step rolls up and deletes the INFO rows
+    of one id range, adding its counts to the existing log_rollups rows.
+    """
+
+    def __init__(self, retention_days=30):
+        self.retention_days = retention_days
+
+    def start(self, connection, params):
+        cutoff = datetime.utcnow() - timedelta(days=int(params.get('days', self.retention_days)))
+        last = connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM logs WHERE timestamp < :cutoff"), {'cutoff': cutoff}).scalar()
+        total = connection.execute(text("SELECT COUNT(*) FROM logs WHERE log_level = 'INFO' AND timestamp < :cutoff"), {'cutoff': cutoff}).scalar()
+        return {'cursor': 0, 'last': last, 'cutoff': cutoff.isoformat(sep=' ')}, total
+
+    def step(self, connection, state, chunk_size):
+        low = state['cursor']
+        high = _next_boundary(connection, 'logs', low, state['last'], chunk_size)
+        params = {'low': low, 'high': high, 'cutoff': datetime.fromisoformat(state['cutoff'])}
+        condition = "id > :low AND id <= :high AND log_level = 'INFO' AND timestamp < :cutoff"
+        add_log_rollups(connection, connection.execute(text(f"SELECT timestamp, url, method, status_code FROM logs WHERE {condition}"), params))
+        deleted = connection.execute(text(f"DELETE FROM logs WHERE {condition}"), params).rowcount
+        state = dict(state, cursor=high)
+        return state, deleted, high >= state['last']
+
+
+JOB_TYPES = {
+    'reset_points': ResetPoints(),
+    'purge_students': PurgeStudents(),
+    'compact_logs': CompactLogs(int(os.getenv('LOG_RETENTION_DAYS', 30))),
+}
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+    'housepoints_http_requests_total': ('counter', 'Requests handled, by route, method and status'),
+    'housepoints_http_request_duration_seconds': ('histogram', 'Time spent handling a request, by route'),
+    'housepoints_db_queries_per_request': ('histogram', 'SQL statements executed while handling a request, by route'),
+    'housepoints_db_time_per_request_seconds': ('histogram', 'Time spent in SQL statements while handling a request, by route'),
+    'housepoints_db_slow_queries_total': ('counter', 'Statements slower than SLOW_QUERY_MS'),
+    'housepoints_jobs_total': ('counter', 'Background jobs finished, by kind and final status'),
+    'housepoints_job_duration_seconds': ('histogram', 'Wall time from start to end of a background job, by kind'),
+    'housepoints_job_step_seconds': ('histogram', 'Time per committed step (chunk) of a background job, by kind'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+class Metrics:
+    """Request counters and histograms in the Prometheus text format.
+
+    Every gunicorn worker keeps its own numbers. When `directory` is set each
+    worker also writes them to <directory>/<pid>.json (at most every
+    `dump_interval` seconds and when it exits) and render() adds up the files of
+    all workers, including ones that have exited, so a scrape that lands on any
+    worker sees the totals of the whole deployment.
+    """
+
+    def __init__(self, directory=None, dump_interval=1.0):
+        self.directory = directory
+        self.dump_interval = dump_interval
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._dumped_at = 0.0
+        self._pid = os.getpid()
+
+    def _fresh(self):
+        # Numbers inherited through fork belong to the parent process
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._counters, self._histograms = {}, {}
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            self._fresh()
+            key = (name, tuple(labels))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=(), buckets=DURATION_BUCKETS):
+        with self._lock:
+            self._fresh()
+            key = (name, tuple(labels))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def _state(self):
+        with self._lock:
+            self._fresh()
+            return {
+                'counters': [[name, list(map(list, labels)), value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, list(map(list, labels)), dict(h, counts=list(h['counts']))] for (name, labels), h in self._histograms.items()],
+            }
+
+    def dump(self, force=False):
+        if not self.directory or (not force and time.monotonic() - self._dumped_at < self.dump_interval):
+            return
+        self._dumped_at = time.monotonic()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self._state(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+
+    def _states(self):
+        if not self.directory:
+            return [self._state()]
+        self.dump(force=True)
+        states = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directory, filename)) as f:
+                        states.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return states
+
+    def render(self):
+        counters, histograms = {}, {}
+        for state in self._states():
+            for name, labels, value in state['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, h in state['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.setdefault(key, {'buckets': h['buckets'], 'counts': [0] * len(h['buckets']), 'sum': 0.0, 'count': 0})
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], h['counts'])]
+                merged['sum'] += h['sum']
+                merged['count'] += h['count']
+
+        lines = []
+        for metric, (kind, description) in HELP.items():
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {kind}']
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f'{name}{{{_label_text(labels)}}} {value}' if labels else f'{name} {value}')
+            for (name, labels), h in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                prefix = _label_text(labels) + ',' if labels else ''
+                for bound, count in zip(h['buckets'], h['counts']):
+                    lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {h["count"]}')
+                lines.append(f'{name}_sum{{{_label_text(labels)}}} {h["sum"]}')
+                lines.append(f'{name}_count{{{_label_text(labels)}}} {h["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+# String and number literals and the placeholders of the DB-API drivers (%(name)s, %s, ?, :name)
+_STATEMENT_VALUES = re.compile(r"'(?:[^']|'')*'|%\(\w+\)s|%s|(?<![\w:]):\w+|\b\d+(?:\.\d+)?\b")
+SERVER_TIMING_STATEMENT_CHARS = 100
+
+
+def describe_statement(statement, limit=SERVER_TIMING_STATEMENT_CHARS):
+    """A statement for the Server-Timing header: one line, every value replaced by ?, at most `limit` characters."""
+    statement = _STATEMENT_VALUES.sub('?', ' '.join(statement.split()))
+    # desc is a quoted string of plain ASCII
+    statement = statement.replace('"', '').replace('\\', '').encode('ascii', 'replace').decode('ascii')
+    return statement if len(statement) <= limit else statement[:limit - 3] + '...'
+
+
+def install_query_instrumentation(app, engine, metrics, slow_query_seconds=0.5, on_slow_query=None):
+    """Count and time the SQL statements of every request.
+
+    Adds a Server-Timing header (db time and query count, duration and text of
+    the slowest statement - see describe_statement() - and total) to each response, feeds the per-route histograms of `metrics`, and calls
+    on_slow_query(seconds, statement) for statements slower than
+    slow_query_seconds that run inside a request. Slow statements of background
+    threads (log writes, feed refreshes) are printed instead. For streamed
+    responses only the statements that ran before the body started are counted.
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_started
+        in_request = has_request_context() and 'db_queries' in g
+        if in_request:
+            g.db_queries += 1
+            g.db_time += elapsed
+            if elapsed > g.db_slowest:
+                g.db_slowest = elapsed
+                g.db_slowest_statement = statement
+        if elapsed >= slow_query_seconds:
+            metrics.inc('housepoints_db_slow_queries_total')
+            statement = ' '.join(statement.split())
+            if in_request and on_slow_query is not None:
+                on_slow_query(elapsed, statement)
+            else:
+                print(f"Slow query ({elapsed * 1000:.0f} ms): {statement}")
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+        g.db_slowest = 0.0
+        g.db_slowest_statement = None
+
+    @app.after_request
+    def _record_request(response):
+        if 'request_started' not in g:
+            return response
+        total = time.perf_counter() - g.request_started
+        route = request.endpoint or 'unmatched'
+        response.headers.add('Server-Timing', f'db;dur={g.db_time * 1000:.1f};desc="{g.db_queries} queries"')
+        slowest = f'db-slowest;dur={g.db_slowest * 1000:.1f}'
+        if g.db_slowest_statement:
+            slowest += f';desc="{describe_statement(g.db_slowest_statement)}"'
+        response.headers.add('Server-Timing', slowest)
+        response.headers.add('Server-Timing', f'total;dur={total * 1000:.1f}')
+        metrics.inc('housepoints_http_requests_total', (('route', route), ('method', request.method), ('status', response.status_code)))
+        metrics.observe('housepoints_http_request_duration_seconds', total, (('route', route),))
+        metrics.observe('housepoints_db_queries_per_request', g.db_queries, (('route', route),), QUERY_COUNT_BUCKETS)
+        metrics.observe('housepoints_db_time_per_request_seconds', g.db_time, (('route', route),))
+        metrics.dump()
+        return response
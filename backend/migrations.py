@@ -0,0 +1,200 @@
+"""Versioned schema changes.
+
+schema.py describes the full schema; MIGRATIONS are the steps that bring an
+existing database to it. Each step runs once, in order, and is recorded in
+schema_migrations. A step names exactly the tables (with the columns they
+had then), columns and indexes it adds, so what it does never changes when
+schema.py does. Steps must be safe to run on a database that already has
+some of their changes (databases made by hand before versioning), so they
+check before they create. Add a new step at the end for every schema change;
+never edit an applied one.
+
+flask --app main init-db        apply pending steps (gunicorn does this at startup)
+flask --app main db-status      applied and pending steps
+flask --app main check-schema   missing tables, columns and indexes, and hot queries that scan whole tables
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+import archives
+import history
+import schema
+import totals
+
+
+def _create_table(connection, table, columns):
+    """Create `table` with just the named columns and no indexes, unless it exists; returns whether it did."""
+    if inspect(connection).has_table(table.name):
+        return False
+    ddl = CreateTable(table)
+    ddl.columns = [column for column in ddl.columns if column.element.name in columns]
+    connection.execute(ddl)
+    return True
+
+
+def _create_tables(connection, tables):
+    return [table.name for table, columns in tables if _create_table(connection, table, columns)]
+
+
+def _create_indexes(connection, table, names):
+    inspector = inspect(connection)
+    for index in sorted(table.indexes, key=lambda index: index.name):
+        if index.name in names and not schema.has_index(inspector, index):
+            index.create(connection)
+
+
+def _add_column(connection, table, column, ddl):
+    if column not in {existing['name'] for existing in inspect(connection).get_columns(table)}:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _core_and_backend_tables(connection):
+    created = _create_tables(connection, [
+        (schema.users, ('id', 'name', 'password', 'email', 'admin', 'token', 'google_sub')),
+        (schema.houses, ('id', 'name')),
+        (schema.students, ('id', 'first_name', 'last_name', 'grad_year', 'points', 'teacher', 'house')),
+        (schema.transaction_log, ('id', 'student_id', 'ammount', 'reason', 'teacher_id', 'timestamp')),
+        (schema.logs, ('id', 'timestamp', 'log_level', 'message', 'module', 'user_id', 'username', 'method', 'url',
+                       'status_code', 'stack_trace', 'ip_address', 'device')),
+        (schema.archive, ('id', 'data', 'studentammount', 'timestamp')),
+        (schema.house_totals, ('house_id', 'points', 'student_count')),
+        (schema.teacher_totals, ('teacher_id', 'points', 'student_count')),
+        (schema.data_version, ('id', 'version', 'updated_at')),
+        (schema.archive_houses, ('archive_id', 'house_id', 'house_name', 'total_points', 'student_count', 'house_rank')),
+        (schema.jobs, ('id', 'kind', 'active_kind', 'status', 'params', 'state', 'processed', 'total', 'steps', 'run_seconds',
+                       'cancel_requested', 'error', 'owner', 'created_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')),
+        (schema.log_rollups, ('hour', 'route', 'method', 'status_code', 'requests')),
+    ])
+    _create_indexes(connection, schema.jobs, {'ix_jobs_status'})
+    # Derived tables are filled from the data when they are new
+    if 'house_totals' in created or 'teacher_totals' in created:
+        totals.rebuild_totals(connection)
+    if 'data_version' in created:
+        connection.execute(text("INSERT INTO data_version (id, version, updated_at) VALUES (1, 0, CURRENT_TIMESTAMP)"))
+    if 'archive_houses' in created:
+        archives.backfill_archive_houses(connection)
+    return created
+
+
+def _hot_query_indexes(connection):
+    _create_indexes(connection, schema.users, {'ix_users_token', 'ix_users_email'})
+    _create_indexes(connection, schema.students, {'ix_students_house', 'ix_students_teacher', 'ix_students_points'})
+    _create_indexes(connection, schema.transaction_log, {'ix_transaction_log_student'})
+    _create_indexes(connection, schema.logs, {'ix_logs_timestamp_id', 'ix_logs_level_timestamp', 'ix_logs_user_timestamp', 'ix_logs_status_timestamp'})
+    return []
+
+
+def _leaderboards(connection):
+    _add_column(connection, 'data_version', 'roster_version', "BIGINT NOT NULL DEFAULT 0")
+    _create_indexes(connection, schema.transaction_log, {'ix_transaction_log_timestamp'})
+    return []
+
+
+def _daily_rollups(connection):
+    created = _create_tables(connection, [
+        (schema.student_daily_points, ('student_id', 'day', 'points', 'awards')),
+        (schema.house_daily_points, ('house_id', 'day', 'points', 'awards')),
+    ])
+    if 'student_daily_points' in created:
+        history.backfill(connection)
+    return created
+
+
+def _auth_version(connection):
+    _add_column(connection, 'data_version', 'auth_version', "BIGINT NOT NULL DEFAULT 0")
+    return []
+
+
+def _archive_data(connection):
+    repaired = archives.repair_archive_data(connection)
+    if repaired:
+        print(f"Replaced the malformed data of archives {', '.join(map(str, repaired))} with their archive_houses rows")
+    return []
+
+
+# (version, description, step); a step returns the names of the tables it created.
+# Version 6 partitioned logs and transaction_log; that rebuilds both tables, so
+# it is no longer a step but `python -m partitions setup`, run by hand.
+MIGRATIONS = [
+    (1, 'core and backend tables', _core_and_backend_tables),
+    (2, 'indexes for the hot queries', _hot_query_indexes),
+    (3, 'data_version.roster_version and transaction_log timestamp index', _leaderboards),
+    (4, 'daily point rollups for student history and house timelines', _daily_rollups),
+    (5, 'data_version.auth_version for the token caches of all workers', _auth_version),
+    (7, 'archive data that is not a JSON list replaced from archive_houses', _archive_data),
+]
+
+
+def applied_versions(connection):
+    if 'schema_migrations' not in inspect(connection).get_table_names():
+        return {}
+    return {row[0]: row[1] for row in connection.execute(text("SELECT version, applied_at FROM schema_migrations"))}
+
+
+def pending(connection):
+    applied = applied_versions(connection)
+    return [migration for migration in MIGRATIONS if migration[0] not in applied]
+
+
+def migrate(engine):
+    """Apply the pending steps, each in its own transaction; returns the names of the created tables."""
+    with engine.begin() as connection:
+        schema.schema_migrations.create(connection, checkfirst=True)
+        steps = pending(connection)
+    created = []
+    for version, description, step in steps:
+        with engine.begin() as connection:
+            created += step(connection)
+            connection.execute(text("""
+                INSERT INTO schema_migrations (version, description, applied_at) VALUES (:version, :description, :now)
+            """), {'version': version, 'description': description, 'now': datetime.utcnow()})
+    return created
+
+
+# The statements behind the busiest endpoints and the per-worker leaderboards, with sample parameters, for check_schema()
+HOT_QUERIES = {
+    'lookup_user': ("SELECT id, name, email, admin FROM users WHERE token = :token", {'token': ''}),
+    'login': ("SELECT * FROM users WHERE email = :email", {'email': ''}),
+    'students_by_house': ("SELECT id, house, teacher FROM students WHERE house = :house", {'house': 0}),
+    'students_by_teacher': ("SELECT id FROM students WHERE teacher = :teacher", {'teacher': 0}),
+    'students_page': ("SELECT students.id, students.first_name FROM students WHERE students.id > :cursor ORDER BY students.id LIMIT :limit",
+                      {'cursor': 0, 'limit': 101}),
+    'leaderboard_poll': ("SELECT id, student_id, ammount, timestamp FROM transaction_log WHERE id > :since ORDER BY id", {'since': 0}),
+    'leaderboard_window': ("SELECT student_id, SUM(ammount) FROM transaction_log WHERE timestamp >= :start AND id <= :last GROUP BY student_id",
+                           {'start': datetime.utcnow() - timedelta(days=7), 'last': 0}),
+    'student_transactions': ("SELECT id FROM transaction_log WHERE student_id = :student_id", {'student_id': 0}),
+    'recent_logs': ("SELECT id FROM logs ORDER BY timestamp DESC, id DESC LIMIT 100", {}),
+}
+# MariaDB picks full scans for small tables on purpose; only report them from this many rows
+FULL_SCAN_MIN_ROWS = 1000
+
+
+def full_scans(connection, statement, params):
+    """Tables the database would read completely for a statement, according to EXPLAIN."""
+    if connection.dialect.name == 'mysql':
+        plan = connection.execute(text("EXPLAIN " + statement), params).mappings().fetchall()
+        return [row['table'] for row in plan if row['type'] == 'ALL' and (row['rows'] or 0) >= FULL_SCAN_MIN_ROWS]
+    if connection.dialect.name == 'sqlite':
+        plan = connection.execute(text("EXPLAIN QUERY PLAN " + statement), params).fetchall()
+        # "SCAN students" (or "SCAN TABLE students" before SQLite 3.36) without "USING ... INDEX"
+        return [row[3].replace('SCAN TABLE ', 'SCAN ').split()[1] for row in plan if row[3].startswith('SCAN ') and 'USING' not in row[3]]
+    return []
+
+
+def check_schema(connection):
+    """Warnings about missing tables, columns and indexes and hot queries that would scan whole tables."""
+    warnings = [f"Missing table {table}" if column is None else f"Missing column {table}.{column}"
+                for table, column in schema.missing_columns(connection)]
+    warnings += [f"Missing index {index.name} on {table} ({', '.join(column.name for column in index.columns)})"
+                for table, index in schema.missing_indexes(connection)]
+    for name, (statement, params) in HOT_QUERIES.items():
+        try:
+            scans = full_scans(connection, statement, params)
+        except Exception as e:
+            warnings.append(f"Could not explain {name}: {e}")
+            continue
+        for table in scans:
+            warnings.append(f"{name} would scan the whole {table} table: {statement}")
+    return warnings
@@ -0,0 +1,228 @@
+"""Time-partitioned logs and transaction_log on MariaDB/MySQL.
+
+Both tables are append-only and only ever queried by recent time, so they are
+split into RANGE COLUMNS partitions on their timestamp: one per month or one
+per academic year. New rows always land in the newest (small) partition, and
+old data is removed by dropping a whole partition - or exchanging it into a
+table of its own first, to keep it - instead of deleting rows one by one.
+
+`setup` rebuilds both tables, so it never runs by itself (not from init-db nor
+at gunicorn startup): run it once by hand in a quiet moment. Maintenance
+command, run from backend/ (`extend` e.g. from cron once a month):
+
+    python -m partitions status
+    python -m partitions setup [--scheme month|academic_year]    # partition tables that aren't yet (once, by hand)
+    python -m partitions extend [--ahead 3]                        # pre-create upcoming partitions
+    python -m partitions retire --table logs --before 2025-09-01 [--archive]
+
+On other databases (SQLite in development) every command is a no-op.
+"""
+import argparse
+import os
+import re
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from maintenance import count_log_rows, write_log_rollups
+
+
+# table -> partition column
+PARTITIONED_TABLES = {'logs': 'timestamp', 'transaction_log': 'timestamp'}
+SCHEMES = ('month', 'academic_year')
+DEFAULT_SCHEME = os.getenv('PARTITION_SCHEME', 'month')
+PARTITIONS_AHEAD = int(os.getenv('PARTITIONS_AHEAD', 3))
+# First month of the school year, for the academic_year scheme
+ACADEMIC_YEAR_START_MONTH = int(os.getenv('ACADEMIC_YEAR_START_MONTH', 8))
+CATCH_ALL = 'pfuture'
+
+
+def supported(connection):
+    return connection.dialect.name == 'mysql'
+
+
+def period_start(day, scheme):
+    """First day of the partition period that contains `day`."""
+    if scheme == 'month':
+        return date(day.year, day.month, 1)
+    year = day.year if day.month >= ACADEMIC_YEAR_START_MONTH else day.year - 1
+    return date(year, ACADEMIC_YEAR_START_MONTH, 1)
+
+
+def next_period(start, scheme):
+    if scheme == 'month':
+        return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    return date(start.year + 1, start.month, 1)
+
+
+def partition_name(start, scheme):
+    # p202409 holds September 2024 (month) or the school year starting then (academic_year)
+    return f"p{start:%Y%m}" if scheme == 'month' else f"y{start:%Y%m}"
+
+
+def boundaries(first_day, last_day, scheme):
+    """(name, start, end) of every period from the one holding first_day up to the one holding last_day."""
+    periods = []
+    start = period_start(first_day, scheme)
+    while start <= last_day:
+        end = next_period(start, scheme)
+        periods.append((partition_name(start, scheme), start, end))
+        start = end
+    return periods
+
+
+def list_partitions(connection, table):
+    """[(name, upper bound as a date or None for MAXVALUE, approximate rows)] oldest first; empty when not partitioned."""
+    rows = connection.execute(text("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """), {'table': table}).fetchall()
+    partitions = []
+    for name, description, table_rows in rows:
+        match = re.search(r"(\d{4}-\d{2}-\d{2})", description or '')
+        partitions.append((name, date.fromisoformat(match.group(1)) if match else None, table_rows))
+    return partitions
+
+
+def _scheme_of(partitions):
+    names = [name for name, _, _ in partitions if name != CATCH_ALL]
+    return 'academic_year' if names and names[-1].startswith('y') else 'month'
+
+
+def _definitions(periods):
+    return ", ".join(f"PARTITION {name} VALUES LESS THAN ('{end.isoformat()}')" for name, _, end in periods)
+
+
+def setup(connection, table, scheme=DEFAULT_SCHEME, ahead=PARTITIONS_AHEAD):
+    """Partition an existing table by its timestamp, from its oldest row up to `ahead` periods from now.
+
+    MariaDB needs the partition column in every unique key, so the primary key
+    becomes (id, timestamp); timestamps that are NULL are set to the oldest one
+    first. Rebuilds the whole table, so run it in a quiet moment.
+    """
+    if list_partitions(connection, table):
+        return False
+    foreign_keys = connection.execute(text("""
+        SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+        WHERE CONSTRAINT_SCHEMA = DATABASE() AND (TABLE_NAME = :table OR REFERENCED_TABLE_NAME = :table)
+    """), {'table': table}).fetchall()
+    if foreign_keys:
+        raise RuntimeError(f"{table} has foreign keys ({', '.join(row[0] for row in foreign_keys)}), which partitioned tables can't have")
+    column = PARTITIONED_TABLES[table]
+    oldest = connection.execute(text(f"SELECT MIN(`{column}`) FROM {table}")).scalar() or datetime.utcnow()
+    connection.execute(text(f"UPDATE {table} SET `{column}` = :oldest WHERE `{column}` IS NULL"), {'oldest': oldest})
+    today = datetime.utcnow().date()
+    periods = boundaries(oldest.date() if isinstance(oldest, datetime) else oldest, today, scheme)
+    for _ in range(ahead):
+        periods += boundaries(periods[-1][2], periods[-1][2], scheme)
+    connection.execute(text(f"""
+        ALTER TABLE {table}
+            MODIFY `{column}` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            DROP PRIMARY KEY, ADD PRIMARY KEY (id, `{column}`)
+        PARTITION BY RANGE COLUMNS(`{column}`) ({_definitions(periods)}, PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE))
+    """))
+    return True
+
+
+def extend(connection, table, ahead=PARTITIONS_AHEAD):
+    """Split the catch-all partition so the next `ahead` periods have partitions of their own; returns the new names."""
+    partitions = list_partitions(connection, table)
+    if not partitions:
+        return []
+    scheme = _scheme_of(partitions)
+    last_end = max((end for name, end, _ in partitions if end is not None), default=None)
+    if last_end is None:
+        return []
+    target = datetime.utcnow().date()
+    for _ in range(ahead):
+        target = next_period(period_start(target, scheme), scheme)
+    periods = boundaries(last_end, target, scheme) if last_end <= target else []
+    if not periods:
+        return []
+    connection.execute(text(f"""
+        ALTER TABLE {table} REORGANIZE PARTITION {CATCH_ALL}
+        INTO ({_definitions(periods)}, PARTITION {CATCH_ALL} VALUES LESS THAN (MAXVALUE))
+    """))
+    return [name for name, _, _ in periods]
+
+
+def retire(connection, table, before, archive=False):
+    """Remove the partitions holding only rows older than `before`; returns their names.
+
+    With archive=True each partition is first exchanged into a table of its own
+    (e.g. logs_p202409) that stays in the database. The INFO rows of retired
+    logs partitions are counted into log_rollups, like the compact_logs job
+    does, but only once the partition is gone: DDL commits on its own, so
+    counting first would count a partition twice when dropping it failed and
+    the command is run again.
+    """
+    retired = []
+    for name, end, _ in list_partitions(connection, table):
+        if end is None or end > before:
+            continue
+        counts = {}
+        if table == 'logs':
+            counts = count_log_rows(connection.execute(text(
+                f"SELECT timestamp, url, method, status_code FROM logs PARTITION ({name}) WHERE log_level = 'INFO'"
+            )))
+        if archive:
+            archive_table = f"{table}_{name}"
+            connection.execute(text(f"CREATE TABLE {archive_table} LIKE {table}"))
+            connection.execute(text(f"ALTER TABLE {archive_table} REMOVE PARTITIONING"))
+            connection.execute(text(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive_table}"))
+        connection.execute(text(f"ALTER TABLE {table} DROP PARTITION {name}"))
+        write_log_rollups(connection, counts)
+        connection.commit()
+        retired.append(name)
+    return retired
+
+
+def extend_all(engine, ahead=PARTITIONS_AHEAD):
+    """Pre-create upcoming partitions of every partitioned table (called at startup too)."""
+    created = {}
+    with engine.connect() as connection:
+        if not supported(connection):
+            return created
+        for table in PARTITIONED_TABLES:
+            names = extend(connection, table, ahead)
+            if names:
+                created[table] = names
+    return created
+
+
+def main():
+    from database import build_engine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('status', 'setup', 'extend', 'retire'))
+    parser.add_argument('--table', choices=tuple(PARTITIONED_TABLES), help='default: both tables (except for retire)')
+    parser.add_argument('--scheme', choices=SCHEMES, default=DEFAULT_SCHEME)
+    parser.add_argument('--ahead', type=int, default=PARTITIONS_AHEAD)
+    parser.add_argument('--before', type=date.fromisoformat, help='retire: partitions ending on or before this date')
+    parser.add_argument('--archive', action='store_true', help='retire: keep each partition as a table of its own')
+    args = parser.parse_args()
+    if args.command == 'retire' and not (args.table and args.before):
+        parser.error('retire needs --table and --before')
+
+    engine = build_engine()
+    tables = [args.table] if args.table else list(PARTITIONED_TABLES)
+    with engine.connect() as connection:
+        if not supported(connection):
+            print(f"Partitioning needs MariaDB/MySQL, not {connection.dialect.name}; nothing to do")
+            return
+        for table in tables:
+            if args.command == 'setup':
+                print(f"{table}: {'partitioned' if setup(connection, table, args.scheme, args.ahead) else 'already partitioned'}")
+            elif args.command == 'extend':
+                print(f"{table}: added {', '.join(extend(connection, table, args.ahead)) or 'nothing'}")
+            elif args.command == 'retire':
+                print(f"{table}: retired {', '.join(retire(connection, table, args.before, args.archive)) or 'nothing'}")
+            for name, end, rows in list_partitions(connection, table):
+                print(f"  {name:>10}  < {end or 'MAXVALUE'}  ~{rows} rows")
+        connection.commit()
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
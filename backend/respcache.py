@@ -0,0 +1,137 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, current_app, request
+from sqlalchemy import text
+
+
+class ResponseCache:
+    """Caches GET responses per route and query string, validated by a data version.
+
+    The version lives in the data_version table so that every gunicorn worker
+    sees writes made by the others. Each worker re-reads it at most every
+    `poll_interval` seconds; a worker that makes a write bumps it and sees the
+    new version immediately. Between polls a request that is answered from the
+    cache (or with a 304) doesn't touch the database at all.
+    """
+
+    def __init__(self, engine, poll_interval=1.0, maxsize=256):
+        self.engine = engine
+        self.poll_interval = poll_interval
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._version = 0
+        self._updated_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self._polled_at = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _adopt(self, version, updated_at):
+        if isinstance(updated_at, str):
+            updated_at = datetime.fromisoformat(updated_at)
+        with self._lock:
+            if version is not None and version >= self._version:
+                if version > self._version:
+                    self._entries.clear()
+                self._version = version
+                if updated_at is not None:
+                    self._updated_at = updated_at.replace(tzinfo=timezone.utc, microsecond=0)
+            self._polled_at = time.monotonic()
+
+    def version(self):
+        if self._polled_at is None or time.monotonic() - self._polled_at > self.poll_interval:
+            try:
+                with self.engine.connect() as connection:
+                    row = connection.execute(text("SELECT version, updated_at FROM data_version WHERE id = 1")).fetchone()
+                if row:
+                    self._adopt(row[0], row[1])
+                else:
+                    self._polled_at = time.monotonic()
+            except Exception as e:
+                # Without the table (init-db not run) only this worker's own bumps are seen
+                print(f"Response cache version poll failed: {e}")
+                self._polled_at = time.monotonic()
+        return self._version
+
+    def bump(self):
+        """Record that data changed; called after every successful write."""
+        try:
+            with self.engine.begin() as connection:
+                connection.execute(text("UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1"))
+                row = connection.execute(text("SELECT version, updated_at FROM data_version WHERE id = 1")).fetchone()
+            if row:
+                self._adopt(row[0], row[1])
+                return
+        except Exception as e:
+            print(f"Response cache version bump failed: {e}")
+        self._adopt(self._version + 1, datetime.now(timezone.utc))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['version'] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            # A write may have happened while the view ran; don't cache under a newer version
+            if entry['version'] != self._version:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _response(self, entry):
+        response = Response(entry['body'], status=200, mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached(self, f):
+        """Serve a GET view from the cache, answering If-None-Match / If-Modified-Since with 304."""
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(request.args.items(multi=True))))
+            version = self.version()
+            entry = self._get(key, version)
+            if entry is None:
+                self.misses += 1
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                body = response.get_data()
+                entry = {
+                    'version': version,
+                    'body': body,
+                    'mimetype': response.mimetype,
+                    'etag': f"v{version}-{hashlib.sha1(body).hexdigest()[:16]}",
+                    'last_modified': self._updated_at,
+                }
+                self._put(key, entry)
+            else:
+                self.hits += 1
+            response = self._response(entry).make_conditional(request)
+            if response.status_code == 304:
+                self.not_modified += 1
+            return response
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {'version': self._version, 'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+
+from sqlalchemy import text
+
+import totals
+
+
+# Student roster import (/api/students/import). Rows are read one at a time from
+# the upload stream, checked against house and teacher maps loaded once per
+# import, and inserted in batches with executemany.
+
+FIELD_ALIASES = {
+    'firstname': 'first_name', 'first': 'first_name',
+    'lastname': 'last_name', 'last': 'last_name',
+    'gradyear': 'grad_year', 'year': 'grad_year',
+    'house_id': 'house', 'house_name': 'house',
+    'teacher_id': 'teacher', 'teacher_email': 'teacher',
+}
+
+INSERT_STUDENT = text("""
+    INSERT INTO students (first_name, last_name, grad_year, points, teacher, house)
+    VALUES (:first_name, :last_name, :grad_year, :points, :teacher, :house)
+""")
+
+
+class ImportFailed(Exception):
+    """Reading or writing stopped an import part way.
+
+    `error` is what went wrong and `report` the import_students() report up to
+    that point: the batches it counts as inserted are committed. When writing
+    a batch failed, report['failed_batch'] holds the row numbers of that batch.
+    """
+
+    def __init__(self, error, report):
+        super().__init__(str(error))
+        self.error = error
+        self.report = report
+
+
+def _field_name(name):
+    name = str(name or '').strip().lower().replace(' ', '_').replace('-', '_')
+    return FIELD_ALIASES.get(name, name)
+
+
+def read_rows(stream, fmt):
+    """Yield (row number, dict of fields or None, parse error or None) from a binary stream.
+
+    fmt is 'csv' (with a header line) or 'jsonl' (one JSON object per line).
+    """
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return
+        fields = [_field_name(name) for name in header]
+        for row in reader:
+            if not any(value.strip() for value in row):
+                continue
+            if len(row) > len(fields):
+                yield reader.line_num, None, f'{len(row)} values for {len(fields)} columns'
+                continue
+            yield reader.line_num, dict(zip(fields, row)), None
+    else:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, f'invalid JSON: {e}'
+                continue
+            if not isinstance(record, dict):
+                yield number, None, 'each line must be a JSON object'
+                continue
+            yield number, {_field_name(key): value for key, value in record.items()}, None
+
+
+def load_lookups(connection):
+    """House and teacher maps: id -> id, plus lower-cased house names and teacher emails."""
+    houses, teachers = {}, {}
+    for house_id, name in connection.execute(text("SELECT id, name FROM houses")):
+        houses[str(house_id)] = house_id
+        if name:
+            houses.setdefault(name.strip().lower(), house_id)
+    for teacher_id, email in connection.execute(text("SELECT id, email FROM users")):
+        teachers[str(teacher_id)] = teacher_id
+        if email:
+            teachers.setdefault(email.strip().lower(), teacher_id)
+    return houses, teachers
+
+
+def _optional_int(value, name, errors):
+    if value is None or str(value).strip() == '':
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        errors.append(f'{name} must be a whole number')
+        return None
+
+
+def validate(record, houses, teachers, default_teacher):
+    """The students row for a record, and the list of problems with it."""
+    errors = []
+    first_name = str(record.get('first_name') or '').strip()
+    last_name = str(record.get('last_name') or '').strip()
+    if not first_name:
+        errors.append('first_name is required')
+    if not last_name:
+        errors.append('last_name is required')
+    grad_year = _optional_int(record.get('grad_year'), 'grad_year', errors)
+    points = _optional_int(record.get('points'), 'points', errors) or 0
+
+    house = None
+    house_ref = str(record.get('house') or '').strip()
+    if house_ref:
+        house = houses.get(house_ref.lower())
+        if house is None:
+            errors.append(f'unknown house {house_ref!r}')
+
+    teacher = default_teacher
+    teacher_ref = str(record.get('teacher') or '').strip()
+    if teacher_ref:
+        teacher = teachers.get(teacher_ref.lower())
+        if teacher is None:
+            errors.append(f'unknown teacher {teacher_ref!r}')
+
+    row = {'first_name': first_name, 'last_name': last_name, 'grad_year': grad_year, 'points': points, 'teacher': teacher, 'house': house}
+    return row, errors
+
+
+def _insert_batch(connection, batch):
+    connection.execute(INSERT_STUDENT, batch)
+    totals.students_added_bulk(connection, [(row['house'], row['teacher'], row['points']) for row in batch])
+    connection.commit()
+
+
+def import_students(connection, rows, default_teacher, batch_size=500, dry_run=False, max_errors=1000):
+    """Validate and insert the rows from read_rows(); returns the report sent back to the client.
+
+    Each batch is committed on its own, so rows before a failing batch stay
+    imported; any error after the lookups are loaded is raised as ImportFailed
+    with the report so far. Invalid rows are skipped and listed (up to
+    max_errors of them).
+    """
+    houses, teachers = load_lookups(connection)
+    report = {'dry_run': dry_run, 'rows': 0, 'valid': 0, 'inserted': 0, 'invalid': 0, 'errors': [], 'errors_truncated': False}
+    batch, numbers = [], []
+
+    def reject(number, problems):
+        report['invalid'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'row': number, 'errors': problems})
+        else:
+            report['errors_truncated'] = True
+
+    def flush():
+        try:
+            _insert_batch(connection, batch)
+        except Exception:
+            report['failed_batch'] = {'first_row': numbers[0], 'last_row': numbers[-1], 'rows': len(batch)}
+            raise
+        report['inserted'] += len(batch)
+
+    try:
+        for number, record, parse_error in rows:
+            report['rows'] += 1
+            if parse_error:
+                reject(number, [parse_error])
+                continue
+            row, problems = validate(record, houses, teachers, default_teacher)
+            if problems:
+                reject(number, problems)
+                continue
+            report['valid'] += 1
+            if dry_run:
+                continue
+            batch.append(row)
+            numbers.append(number)
+            if len(batch) >= batch_size:
+                flush()
+                batch, numbers = [], []
+        if batch:
+            flush()
+    except Exception as e:
+        raise ImportFailed(e, report) from e
+    return report
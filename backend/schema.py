@@ -0,0 +1,229 @@
+from sqlalchemy import Boolean, BigInteger, Column, Date, DateTime, Float, Index, Integer, MetaData, String, Table, Text, func, inspect, text
+
+
+# The full schema. It is what the database should look like, not how it gets
+# there: every change here needs a step in migrations.py that makes it
+# (check_schema() reports tables, columns and indexes that no step created).
+metadata = MetaData()
+
+# Core tables. Databases set up before migrations.py existed have these already,
+# made by hand; the migrations only add what is missing.
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(255)),
+    Column('password', String(255)),
+    Column('email', String(255)),
+    Column('admin', Boolean, nullable=False, default=False),
+    Column('token', String(36)),
+    Column('google_sub', String(255)),
+    # lookup_user() on every authenticated request, and the login by email
+    Index('ix_users_token', 'token'),
+    Index('ix_users_email', 'email'),
+)
+
+houses = Table(
+    'houses', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(255)),
+)
+
+students = Table(
+    'students', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('first_name', String(255)),
+    Column('last_name', String(255)),
+    Column('grad_year', Integer),
+    Column('points', Integer, nullable=False, default=0),
+    Column('teacher', Integer),
+    Column('house', Integer),
+    # getstudents/bulk award filters, deleting a teacher, and the top students
+    Index('ix_students_house', 'house'),
+    Index('ix_students_teacher', 'teacher'),
+    Index('ix_students_points', 'points'),
+)
+
+transaction_log = Table(
+    'transaction_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('student_id', Integer),
+    Column('ammount', Integer),
+    Column('reason', String(255)),
+    Column('teacher_id', Integer),
+    Column('timestamp', DateTime, server_default=func.current_timestamp()),
+    # Deleting a student deletes its transactions
+    Index('ix_transaction_log_student', 'student_id'),
+    # This week's / term's points for the leaderboards
+    Index('ix_transaction_log_timestamp', 'timestamp', 'student_id'),
+)
+
+logs = Table(
+    'logs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('timestamp', DateTime),
+    Column('log_level', String(20)),
+    Column('message', Text),
+    Column('module', String(255)),
+    Column('user_id', Integer),
+    Column('username', String(255)),
+    Column('method', String(10)),
+    Column('url', Text),
+    Column('status_code', Integer),
+    Column('stack_trace', Text),
+    Column('ip_address', String(45)),
+    Column('device', String(255)),
+    # /api/logs pages newest first by (timestamp, id), optionally filtered
+    Index('ix_logs_timestamp_id', 'timestamp', 'id'),
+    Index('ix_logs_level_timestamp', 'log_level', 'timestamp', 'id'),
+    Index('ix_logs_user_timestamp', 'user_id', 'timestamp', 'id'),
+    Index('ix_logs_status_timestamp', 'status_code', 'timestamp', 'id'),
+)
+
+archive = Table(
+    'archive', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('data', Text),
+    Column('studentammount', Integer),
+    Column('timestamp', DateTime),
+)
+
+# Tables the backend fills itself
+house_totals = Table(
+    'house_totals', metadata,
+    Column('house_id', Integer, primary_key=True, autoincrement=False),
+    Column('points', BigInteger, nullable=False, default=0),
+    Column('student_count', Integer, nullable=False, default=0),
+)
+
+teacher_totals = Table(
+    'teacher_totals', metadata,
+    Column('teacher_id', Integer, primary_key=True, autoincrement=False),
+    Column('points', BigInteger, nullable=False, default=0),
+    Column('student_count', Integer, nullable=False, default=0),
+)
+
+# Single row (id = 1) that every write bumps, used to validate cached responses
+data_version = Table(
+    'data_version', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('version', BigInteger, nullable=False, default=0),
+    Column('updated_at', DateTime, nullable=False),
+    # Bumped by every write other than awards; the leaderboards rebuild when it moves
+    Column('roster_version', BigInteger, nullable=False, server_default=text('0')),
+    # Bumped whenever a user's token, name, email or admin flag changes; every worker's token cache is dropped when it moves
+    Column('auth_version', BigInteger, nullable=False, server_default=text('0')),
+)
+
+# One row per house of every archive snapshot, next to the JSON in archive.data
+archive_houses = Table(
+    'archive_houses', metadata,
+    Column('archive_id', Integer, primary_key=True, autoincrement=False),
+    Column('house_id', Integer, primary_key=True, autoincrement=False),
+    Column('house_name', String(255)),
+    Column('total_points', BigInteger, nullable=False, default=0),
+    # NULL for archives made before this table existed, which didn't record it
+    Column('student_count', Integer),
+    Column('house_rank', Integer, nullable=False),
+)
+
+# Chunked background jobs (resets, purges), see jobs.py
+jobs = Table(
+    'jobs', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String(50), nullable=False),
+    # The kind while the job is queued or running, NULL afterwards: one active job per kind
+    Column('active_kind', String(50), unique=True),
+    Column('status', String(20), nullable=False, index=True),
+    Column('params', Text),
+    Column('state', Text),
+    Column('processed', BigInteger, nullable=False, default=0),
+    Column('total', BigInteger),
+    Column('steps', Integer, nullable=False, default=0),
+    Column('run_seconds', Float, nullable=False, default=0),
+    Column('cancel_requested', Integer, nullable=False, default=0),
+    Column('error', Text),
+    Column('owner', String(64)),
+    Column('created_by', Integer),
+    Column('created_at', DateTime, nullable=False),
+    Column('started_at', DateTime),
+    Column('heartbeat_at', DateTime),
+    Column('finished_at', DateTime),
+)
+
+
+# Hourly request counts per route of INFO logs removed by the compact_logs job, see maintenance.py
+log_rollups = Table(
+    'log_rollups', metadata,
+    Column('hour', DateTime, primary_key=True),
+    Column('route', String(255), primary_key=True),
+    Column('method', String(10), primary_key=True),
+    Column('status_code', Integer, primary_key=True, autoincrement=False),
+    Column('requests', BigInteger, nullable=False, default=0),
+)
+
+# Points awarded per student / house and day, kept current by the award endpoints (see history.py)
+student_daily_points = Table(
+    'student_daily_points', metadata,
+    Column('student_id', Integer, primary_key=True, autoincrement=False),
+    Column('day', Date, primary_key=True),
+    Column('points', BigInteger, nullable=False, default=0),
+    Column('awards', Integer, nullable=False, default=0),
+)
+
+house_daily_points = Table(
+    'house_daily_points', metadata,
+    Column('house_id', Integer, primary_key=True, autoincrement=False),
+    Column('day', Date, primary_key=True),
+    Column('points', BigInteger, nullable=False, default=0),
+    Column('awards', Integer, nullable=False, default=0),
+)
+
+# Applied steps of migrations.py
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('description', String(255), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _indexed_columns(inspector, table):
+    # Column lists of the table's indexes, primary key included
+    columns = [tuple(index['column_names']) for index in inspector.get_indexes(table)]
+    columns.append(tuple(inspector.get_pk_constraint(table)['constrained_columns']))
+    return columns
+
+
+def has_index(inspector, index):
+    """Whether some index of the table (whatever its name) starts with the columns of `index`."""
+    wanted = tuple(column.name for column in index.columns)
+    return any(columns[:len(wanted)] == wanted for columns in _indexed_columns(inspector, index.table.name))
+
+
+def missing_indexes(connection):
+    """Indexes of the schema missing from the database: [(table, index)]."""
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    return [(table.name, index) for table in metadata.sorted_tables if table.name in tables
+            for index in sorted(table.indexes, key=lambda index: index.name) if not has_index(inspector, index)]
+
+
+def missing_columns(connection):
+    """Tables and columns of the schema missing from the database: [(table, column or None)]."""
+    inspector = inspect(connection)
+    tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            missing.append((table.name, None))
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing += [(table.name, column.name) for column in table.columns if column.name not in existing]
+    return missing
+
+
+def init_db(engine):
+    """Bring the database up to date (see migrations.py) and return the names of the tables that were created."""
+    from migrations import migrate
+
+    return migrate(engine)
@@ -0,0 +1,179 @@
+import heapq
+import re
+import threading
+import time
+
+
+def normalize(value):
+    return str(value or '').strip().lower()
+
+
+def words(value):
+    return [word for word in re.split(r'[\s@.\-]+', value) if word]
+
+
+def ngrams(value, max_n=3):
+    """Every 1- to max_n-character substring of value."""
+    grams = set()
+    for n in range(1, max_n + 1):
+        for i in range(len(value) - n + 1):
+            grams.add(value[i:i + n])
+    return grams
+
+
+class SearchIndex:
+    """In-memory n-gram index for substring search over a few text fields.
+
+    Two posting maps are kept: every 1- to max_n-gram of the fields (for
+    substring matches) and the first 1 to max_n characters of every word (for
+    the prefix matches that rank first). Short queries are answered from the
+    prefix map alone when it already has enough results.
+
+    `load` returns an iterable of (id, record) pairs, where record is the dict
+    that search() hands back. `fields` are the record keys that are searched.
+    The index is loaded on first use, kept current through upsert()/update()/
+    remove() by the worker that makes a change, and reloaded after `ttl`
+    seconds (or after invalidate()) so changes made by other workers show up.
+    """
+
+    def __init__(self, load, fields, ttl=60.0, max_n=3):
+        self.load = load
+        self.fields = fields
+        self.ttl = ttl
+        self.max_n = max_n
+        self._lock = threading.RLock()
+        self._records = {}
+        self._texts = {}
+        self._grams = {}
+        self._prefixes = {}
+        self._loaded_at = None
+
+    def _texts_for(self, record):
+        return [normalize(record.get(field)) for field in self.fields]
+
+    def _keys(self, texts):
+        grams, prefixes = set(), set()
+        for value in texts:
+            grams |= ngrams(value, self.max_n)
+            for word in words(value):
+                prefixes.update(word[:n] for n in range(1, min(len(word), self.max_n) + 1))
+        return grams, prefixes
+
+    def _add(self, records, texts, grams, prefixes, record_id, record):
+        records[record_id] = record
+        texts[record_id] = self._texts_for(record)
+        record_grams, record_prefixes = self._keys(texts[record_id])
+        for gram in record_grams:
+            grams.setdefault(gram, set()).add(record_id)
+        for prefix in record_prefixes:
+            prefixes.setdefault(prefix, set()).add(record_id)
+
+    def _discard(self, record_id):
+        record_grams, record_prefixes = self._keys(self._texts.pop(record_id, []))
+        for postings, keys in ((self._grams, record_grams), (self._prefixes, record_prefixes)):
+            for key in keys:
+                ids = postings.get(key)
+                if ids is not None:
+                    ids.discard(record_id)
+                    if not ids:
+                        del postings[key]
+        self._records.pop(record_id, None)
+
+    def reload(self):
+        records, texts, grams, prefixes = {}, {}, {}, {}
+        for record_id, record in self.load():
+            self._add(records, texts, grams, prefixes, record_id, record)
+        with self._lock:
+            self._records, self._texts, self._grams, self._prefixes = records, texts, grams, prefixes
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.reload()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def upsert(self, record_id, record):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._discard(record_id)
+            self._add(self._records, self._texts, self._grams, self._prefixes, record_id, record)
+
+    def update(self, record_id, **changes):
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            if record_id not in self._records:
+                # Not something this worker has seen yet, load it with everything else
+                self._loaded_at = None
+                return
+            self.upsert(record_id, {**self._records[record_id], **changes})
+
+    def remove(self, record_id):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._discard(record_id)
+
+    def clear(self):
+        with self._lock:
+            self._records, self._texts, self._grams, self._prefixes = {}, {}, {}, {}
+            self._loaded_at = time.monotonic()
+
+    def _candidates(self, query):
+        if len(query) <= self.max_n:
+            return set(self._grams.get(query, ()))
+        grams = [query[i:i + self.max_n] for i in range(len(query) - self.max_n + 1)]
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                break
+        return candidates
+
+    def _rank(self, query, texts):
+        # 0: whole field matches, 1: field starts with it, 2: a word starts with it, 3: anywhere
+        best = None
+        for value in texts:
+            if query not in value:
+                continue
+            if value == query:
+                return 0
+            if value.startswith(query):
+                rank = 1
+            elif any(word.startswith(query) for word in words(value)):
+                rank = 2
+            else:
+                rank = 3
+            best = rank if best is None else min(best, rank)
+        return best
+
+    def _ranked(self, query, candidates):
+        matches = []
+        for record_id in candidates:
+            rank = self._rank(query, self._texts[record_id])
+            if rank is not None:
+                matches.append((rank, self._texts[record_id], record_id))
+        return matches
+
+    def search(self, query, limit=20):
+        query = normalize(query)
+        self._ensure_fresh()
+        with self._lock:
+            if not query:
+                matches = [(0, self._texts[record_id], record_id) for record_id in self._records]
+            else:
+                prefix_hits = self._prefixes.get(query, set()) if len(query) <= self.max_n else set()
+                if len(prefix_hits) >= limit:
+                    # Substring-only matches rank below these anyway
+                    matches = self._ranked(query, prefix_hits)
+                else:
+                    matches = self._ranked(query, self._candidates(query))
+            return [self._records[match[2]] for match in heapq.nsmallest(limit, matches)]
+
+    def stats(self):
+        with self._lock:
+            return {'records': len(self._records), 'grams': len(self._grams), 'prefixes': len(self._prefixes), 'loaded': self._loaded_at is not None}
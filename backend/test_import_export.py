@@ -0,0 +1,94 @@
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+import exports
+import roster
+import totals
+from benchmarks.seed import create_database
+from migrations import migrate
+
+
+def export(connection, dataset, fmt, start=None, end=None):
+    query, params = exports.build_query(dataset, start, end)
+    return ''.join(exports.encode_rows(connection.execute(query, params), fmt))
+
+
+def without_ids(rows):
+    return [{key: value for key, value in row.items() if key != 'id'} for row in rows]
+
+
+class ImportExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        # Same seed, so both databases have the same houses and teachers
+        self.source = create_engine(create_database(os.path.join(self.directory, 'source.sqlite3'), students=1200, transactions=300))
+        self.target = create_engine(create_database(os.path.join(self.directory, 'target.sqlite3'), students=1))
+        with self.target.begin() as connection:
+            connection.execute(text("DELETE FROM students"))
+        migrate(self.source)
+        migrate(self.target)
+
+    def tearDown(self):
+        self.source.dispose()
+        self.target.dispose()
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, export_format, import_format):
+        with self.source.connect() as connection:
+            exported = export(connection, 'students', export_format)
+        with self.target.connect() as connection:
+            report = roster.import_students(connection, roster.read_rows(io.BytesIO(exported.encode('utf-8')), import_format),
+                                            default_teacher=1, batch_size=500)
+            reimported = export(connection, 'students', export_format)
+            drift = totals.rebuild_totals(connection)
+        return exported, reimported, report, drift
+
+    def test_csv_round_trip(self):
+        exported, reimported, report, drift = self.round_trip('csv', 'csv')
+        self.assertEqual((report['rows'], report['inserted'], report['invalid']), (1200, 1200, 0))
+        self.assertEqual(without_ids(csv.DictReader(io.StringIO(reimported))), without_ids(csv.DictReader(io.StringIO(exported))))
+        self.assertEqual(drift, [])
+
+    def test_ndjson_round_trip(self):
+        exported, reimported, report, drift = self.round_trip('ndjson', 'jsonl')
+        self.assertEqual(report['inserted'], 1200)
+        parse = lambda body: [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(without_ids(parse(reimported)), without_ids(parse(exported)))
+        self.assertEqual(drift, [])
+
+    def test_bad_rows_are_reported_and_skipped(self):
+        body = ("first_name,last_name,grad_year,house,teacher\n"
+                "Ada,Lovelace,2027,House 1,teacher2@school.test\n"
+                ",Nameless,2027,,\n"
+                "Alan,Turing,soon,House 9,nobody@school.test\n"
+                "Grace,Hopper,2028,2,\n")
+        with self.target.connect() as connection:
+            dry = roster.import_students(connection, roster.read_rows(io.BytesIO(body.encode()), 'csv'), default_teacher=1, dry_run=True)
+            self.assertEqual(connection.execute(text("SELECT COUNT(*) FROM students")).scalar(), 0)
+            report = roster.import_students(connection, roster.read_rows(io.BytesIO(body.encode()), 'csv'), default_teacher=1)
+            students = connection.execute(text("SELECT first_name, house, teacher FROM students ORDER BY id")).fetchall()
+        self.assertEqual((dry['valid'], dry['inserted'], dry['invalid']), (2, 0, 2))
+        self.assertEqual((report['valid'], report['inserted']), (2, 2))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4])
+        self.assertEqual(report['errors'][1]['errors'], ['grad_year must be a whole number', "unknown house 'House 9'", "unknown teacher 'nobody@school.test'"])
+        self.assertEqual([tuple(row) for row in students], [('Ada', 1, 2), ('Grace', 2, 1)])
+
+    def test_date_bounds(self):
+        with self.source.begin() as connection:
+            connection.execute(text("UPDATE transaction_log SET timestamp = :day WHERE id <= 10"), {'day': datetime(2025, 3, 4, 23, 59, 59)})
+            connection.execute(text("UPDATE transaction_log SET timestamp = :day WHERE id > 10 AND id <= 15"), {'day': datetime(2025, 3, 5)})
+        with self.source.connect() as connection:
+            body = export(connection, 'transactions', 'csv', exports.parse_date_bound('2025-03-04'), exports.parse_date_bound('2025-03-04', end=True))
+        self.assertEqual([int(row['id']) for row in csv.DictReader(io.StringIO(body))], list(range(1, 11)))
+
+
+if __name__ == '__main__':
+    unittest.main()
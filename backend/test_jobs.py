@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from jobs import JobConflict, JobRunner
+from migrations import migrate
+
+
+class CountTo:
+    """Job type that counts to params['total'], chunk_size at a time."""
+
+    def start(self, connection, params):
+        return {'count': 0, 'total': params.get('total', 10)}, params.get('total', 10)
+
+    def step(self, connection, state, chunk_size):
+        processed = min(chunk_size, state['total'] - state['count'])
+        state = dict(state, count=state['count'] + processed)
+        return state, processed, state['count'] >= state['total']
+
+
+class JobRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'jobs.sqlite3')}")
+        migrate(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def runner(self, owner, **options):
+        # No runner threads: the tests drive _claim/_execute themselves
+        runner = JobRunner(self.engine, {'count': CountTo(), 'other': CountTo()}, threads=0, chunk_size=3, pause=0, **options)
+        runner.ensure_started()
+        runner.owner = owner
+        return runner
+
+    def job(self, job_id):
+        with self.engine.connect() as connection:
+            return self.runner('reader').get(connection, job_id)
+
+    def test_one_active_job_per_kind(self):
+        runner = self.runner('a')
+        first = runner.submit('count', {'total': 5})
+        with self.assertRaises(JobConflict) as conflict:
+            runner.submit('count')
+        self.assertEqual(conflict.exception.job_id, first)
+        # Other kinds are independent
+        runner.submit('other')
+
+    def test_finished_job_frees_its_kind(self):
+        runner = self.runner('a')
+        first = runner.submit('count', {'total': 7})
+        job_id, kind, params, state = runner._claim()
+        self.assertEqual(job_id, first)
+        runner._execute(job_id, kind, params, state)
+        job = self.job(first)
+        self.assertEqual((job['status'], job['processed'], job['total'], job['steps']), ('done', 7, 7, 4))
+        self.assertEqual(job['progress'], 1.0)
+        self.assertNotEqual(runner.submit('count'), first)
+
+    def test_unknown_kind(self):
+        with self.assertRaises(KeyError):
+            self.runner('a').submit('nope')
+
+    def test_claimed_job_is_not_claimed_twice(self):
+        a, b = self.runner('a'), self.runner('b')
+        job_id = a.submit('count')
+        self.assertEqual(a._claim()[0], job_id)
+        self.assertIsNone(b._claim())
+
+    def test_stale_job_is_taken_over(self):
+        a, b = self.runner('a'), self.runner('b', stale_after=60)
+        job_id = a.submit('count', {'total': 9})
+        claimed = a._claim()
+        with self.engine.begin() as connection:
+            a._save(connection, job_id, state='{"count": 3, "total": 9}', total=9, processed=3)
+            # a stops heartbeating
+            connection.execute(text("UPDATE jobs SET heartbeat_at = :old WHERE id = :job_id"),
+                               {'old': datetime.utcnow() - timedelta(minutes=5), 'job_id': job_id})
+        taken = b._claim()
+        self.assertEqual(taken[0], job_id)
+        # The new owner continues from the last committed state
+        self.assertEqual(taken[3], '{"count": 3, "total": 9}')
+        with self.assertRaises(RuntimeError):
+            with self.engine.begin() as connection:
+                a._save(connection, claimed[0], processed=3)
+        b._execute(*taken)
+        job = self.job(job_id)
+        self.assertEqual((job['status'], job['processed']), ('done', 9))
+
+    def test_cancel(self):
+        runner = self.runner('a')
+        queued = runner.submit('count')
+        with self.engine.begin() as connection:
+            runner.cancel(connection, queued)
+        self.assertEqual(self.job(queued)['status'], 'cancelled')
+        self.assertIsNone(runner._claim())
+
+        running = runner.submit('count', {'total': 30})
+        claimed = runner._claim()
+        with self.engine.begin() as connection:
+            runner.cancel(connection, running)
+        runner._execute(*claimed)
+        job = self.job(running)
+        self.assertEqual((job['status'], job['processed']), ('cancelled', 0))
+        runner.submit('count')
+
+
+if __name__ == '__main__':
+    unittest.main()
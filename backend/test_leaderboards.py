@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.seed import create_database
+from leaderboards import Leaderboards, assign_ranks
+from migrations import migrate
+
+
+class AssignRanksTest(unittest.TestCase):
+    def test_ties(self):
+        values = [9, 7, 7, 7, 5, 5, 1]
+        self.assertEqual(assign_ranks(values, 'competition'), [1, 2, 2, 2, 5, 5, 7])
+        self.assertEqual(assign_ranks(values, 'dense'), [1, 2, 2, 2, 3, 3, 4])
+        self.assertEqual(assign_ranks(values, 'ordinal'), [1, 2, 3, 4, 5, 6, 7])
+
+    def test_edges(self):
+        self.assertEqual(assign_ranks([]), [])
+        self.assertEqual(assign_ranks([0, 0]), [1, 1])
+        self.assertEqual(assign_ranks([3, -1, -1], 'dense'), [1, 2, 2])
+
+
+class LeaderboardsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine(create_database(os.path.join(self.directory, 'boards.sqlite3'), students=300, transactions=2000))
+        migrate(self.engine)
+        with self.engine.begin() as connection:
+            # Points as the award endpoints keep them, and a few transactions outside this week
+            connection.execute(text("UPDATE students SET points = (SELECT COALESCE(SUM(ammount), 0) FROM transaction_log WHERE student_id = students.id)"))
+            connection.execute(text("UPDATE transaction_log SET timestamp = :old WHERE id % 3 = 0"), {'old': datetime.utcnow() - timedelta(days=30)})
+        self.boards = Leaderboards(self.engine, poll_interval=0)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def expected(self, where='', params=None, limit=15):
+        with self.engine.connect() as connection:
+            return [tuple(row) for row in connection.execute(text(
+                f"SELECT id, points FROM students WHERE 1 = 1 {where} ORDER BY points DESC, id LIMIT :limit"
+            ), {**(params or {}), 'limit': limit})]
+
+    def top(self, **options):
+        return [(entry['id'], entry['value']) for entry in self.boards.top(limit=15, **options)]
+
+    def test_matches_the_database_per_scope(self):
+        self.assertEqual(self.top(), self.expected())
+        self.assertEqual(self.top(scope='house', scope_id=2), self.expected('AND house = :house', {'house': 2}))
+        self.assertEqual(self.top(scope='grad_year', scope_id=2026), self.expected('AND grad_year = :year', {'year': 2026}))
+        self.assertEqual(self.top(scope='teacher', scope_id=3), self.expected('AND teacher = :teacher', {'teacher': 3}))
+
+    def test_week_window(self):
+        start = self.boards.window_starts()['week']
+        with self.engine.connect() as connection:
+            expected = [tuple(row) for row in connection.execute(text("""
+                SELECT student_id, SUM(ammount) FROM transaction_log WHERE timestamp >= :start
+                GROUP BY student_id ORDER BY 2 DESC, 1 LIMIT 15
+            """), {'start': start})]
+        self.assertEqual(self.top(window='week'), expected)
+
+    def test_teachers(self):
+        with self.engine.connect() as connection:
+            expected = [tuple(row) for row in connection.execute(text("""
+                SELECT teacher, SUM(points) FROM students WHERE teacher IS NOT NULL GROUP BY teacher ORDER BY 2 DESC, 1 LIMIT 15
+            """))]
+        self.assertEqual(self.top(board='teachers'), expected)
+
+    def test_tied_entries_share_a_rank(self):
+        with self.engine.begin() as connection:
+            connection.execute(text("UPDATE students SET points = 10000 WHERE id IN (7, 8, 9)"))
+            connection.execute(text("UPDATE students SET points = 9000 WHERE id = 10"))
+        self.boards.changed(roster=True)
+        entries = self.boards.top(limit=4)
+        self.assertEqual([(entry['id'], entry['rank']) for entry in entries], [(7, 1), (8, 1), (9, 1), (10, 4)])
+        self.assertEqual([entry['rank'] for entry in self.boards.top(limit=4, ranking='dense')], [1, 1, 1, 2])
+
+    def test_follows_awards_from_other_workers(self):
+        self.top()
+        with self.engine.begin() as connection:
+            # What another worker's award_points commits
+            connection.execute(text("INSERT INTO transaction_log (student_id, ammount, reason, teacher_id, timestamp) VALUES (42, 5000, 'x', 2, :now)"),
+                               {'now': datetime.utcnow()})
+            connection.execute(text("UPDATE students SET points = points + 5000 WHERE id = 42"))
+        rebuilds = self.boards.rebuilds
+        self.assertEqual(self.top()[0][0], 42)
+        self.assertEqual(self.top(window='week')[0][0], 42)
+        self.assertEqual(self.top(), self.expected())
+        self.assertEqual(self.boards.rebuilds, rebuilds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from benchmarks.seed import create_database
+
+
+main = None
+directory = None
+
+
+def setUpModule():
+    # main builds its engine from DATABASE_URL when it is imported
+    global main, directory
+    directory = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = create_database(os.path.join(directory, 'logs.sqlite3'), students=10)
+    import main as app_module
+    from schema import init_db
+    main = app_module
+    init_db(main.engine)
+
+
+def tearDownModule():
+    main.job_runner.close()
+    main.log_sink.close()
+    main.engine.dispose()
+    shutil.rmtree(directory)
+
+
+class LogPagingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # 300 rows over 30 distinct timestamps, so every page boundary falls inside a run of equal timestamps
+        start = datetime(2025, 1, 6, 8, 0, 0)
+        cls.rows = [{
+            'timestamp': start + timedelta(minutes=i // 10),
+            'log_level': ('INFO', 'WARNING', 'ERROR')[i % 3],
+            'message': f'row {i}',
+            'user_id': i % 4,
+            'url': f'http://test/paging/{"100%" if i % 5 == 0 else "plain"}',
+            'status_code': 500 if i % 3 == 2 else 200,
+        } for i in range(300)]
+        with main.engine.begin() as connection:
+            connection.execute(text("""
+                INSERT INTO logs (timestamp, log_level, message, user_id, url, status_code)
+                VALUES (:timestamp, :log_level, :message, :user_id, :url, :status_code)
+            """), cls.rows)
+            cls.ids = [row[0] for row in connection.execute(text(
+                "SELECT id FROM logs WHERE url LIKE 'http://test/paging/%' ORDER BY timestamp DESC, id DESC"
+            ))]
+
+    def setUp(self):
+        self.client = main.app.test_client()
+
+    def pages(self, limit, **filters):
+        seen, cursor, pages = [], None, 0
+        while True:
+            query = {'limit': limit, 'url': '/paging/', **filters}
+            if cursor:
+                query['cursor'] = cursor
+            response = self.client.get('/api/logs', query_string=query)
+            self.assertEqual(response.status_code, 200)
+            body = response.get_json()
+            self.assertLessEqual(len(body['logs']), limit)
+            seen += [row['id'] for row in body['logs']]
+            pages += 1
+            cursor = body['next_cursor']
+            if not cursor:
+                return seen, pages
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen, pages = self.pages(37)
+        self.assertEqual(seen, self.ids)
+        self.assertEqual(pages, 9)
+
+    def test_exact_multiple_of_the_page_size(self):
+        seen, pages = self.pages(50)
+        self.assertEqual(seen, self.ids)
+        self.assertEqual(pages, 6)
+
+    def test_filters_apply_to_every_page(self):
+        seen, _ = self.pages(11, level='warning,error', user_id=1, status_code=500)
+        with main.engine.connect() as connection:
+            expected = [row[0] for row in connection.execute(text("""
+                SELECT id FROM logs WHERE url LIKE 'http://test/paging/%' AND log_level IN ('WARNING', 'ERROR')
+                AND user_id = 1 AND status_code = 500 ORDER BY timestamp DESC, id DESC
+            """))]
+        self.assertTrue(expected)
+        self.assertEqual(seen, expected)
+
+    def test_url_filter_is_a_literal_substring(self):
+        seen, _ = self.pages(100, url='/paging/100%')
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(self.pages(100, url='/paging/1_0')[0], [])
+
+    def test_without_limit_a_plain_array(self):
+        response = self.client.get('/api/logs', query_string={'url': '/paging/'})
+        self.assertEqual([row['id'] for row in response.get_json()], self.ids)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/logs?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/logs?limit=10&cursor=2025-01-06,x').status_code, 400)
+        self.assertEqual(self.client.get('/api/logs?user_id=me').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
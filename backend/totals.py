@@ -0,0 +1,179 @@
+from sqlalchemy import text
+
+
+# Per-house and per-teacher point totals kept in house_totals / teacher_totals.
+# Every function here runs on the caller's connection so the totals change in the
+# same transaction as the students rows they summarise.
+
+def _for_update(connection):
+    return " FOR UPDATE" if connection.dialect.name == 'mysql' else ""
+
+
+def _add(connection, table, key_column, key, points, students):
+    if key is None or (not points and not students):
+        return
+    # Two first awards to a house or teacher can race to create its row, so let the database merge them
+    statement = f"INSERT INTO {table} ({key_column}, points, student_count) VALUES (:key, :points, :students)"
+    if connection.dialect.name == 'mysql':
+        statement += " ON DUPLICATE KEY UPDATE points = points + VALUES(points), student_count = student_count + VALUES(student_count)"
+    else:
+        statement += (f" ON CONFLICT ({key_column}) DO UPDATE SET points = {table}.points + excluded.points,"
+                      f" student_count = {table}.student_count + excluded.student_count")
+    connection.execute(text(statement), {'points': points, 'students': students, 'key': key})
+
+
+def apply_delta(connection, house_id, teacher_id, points, students=0):
+    _add(connection, 'house_totals', 'house_id', house_id, points, students)
+    _add(connection, 'teacher_totals', 'teacher_id', teacher_id, points, students)
+
+
+def get_student(connection, student_id):
+    """(house, teacher, points) of a student, locking the row on MariaDB."""
+    return connection.execute(text(
+        "SELECT house, teacher, points FROM students WHERE id = :student_id" + _for_update(connection)
+    ), {'student_id': student_id}).fetchone()
+
+
+def house_standings(connection):
+    """Every house with its total, student count and rank (ties share a rank), best first."""
+    result = connection.execute(text("""
+        SELECT houses.id, houses.name, COALESCE(house_totals.points, 0) as total_points, COALESCE(house_totals.student_count, 0) as student_count
+        FROM houses
+        LEFT JOIN house_totals ON house_totals.house_id = houses.id
+        ORDER BY total_points DESC, houses.id
+    """))
+    standings = []
+    for idx, row in enumerate(result):
+        total_points = int(row[2])
+        rank = standings[-1]['rank'] if standings and standings[-1]['total_points'] == total_points else idx + 1
+        standings.append({
+            'house_id': row[0],
+            'house_name': row[1],
+            'total_points': total_points,
+            'student_count': int(row[3]),
+            'rank': rank
+        })
+    return standings
+
+
+def student_added(connection, house_id, teacher_id, points):
+    apply_delta(connection, house_id, teacher_id, int(points or 0), 1)
+
+
+def student_removed(connection, student):
+    if student:
+        apply_delta(connection, student[0], student[1], -int(student[2] or 0), -1)
+
+
+def student_changed(connection, before, after):
+    if not before or not after or tuple(before) == tuple(after):
+        return
+    student_removed(connection, before)
+    student_added(connection, after[0], after[1], after[2])
+
+
+def points_awarded(connection, student_id, points):
+    """Add an award to the totals; returns the student's (house, teacher) or None."""
+    student = connection.execute(text("SELECT house, teacher FROM students WHERE id = :student_id"), {'student_id': student_id}).fetchone()
+    if student:
+        apply_delta(connection, student[0], student[1], int(points))
+    return student
+
+
+def points_awarded_bulk(connection, awards):
+    """Apply many awards at once; `awards` holds (house, teacher, points) per awarded student."""
+    houses, teachers = {}, {}
+    for house_id, teacher_id, points in awards:
+        houses[house_id] = houses.get(house_id, 0) + int(points)
+        teachers[teacher_id] = teachers.get(teacher_id, 0) + int(points)
+    for house_id, points in houses.items():
+        _add(connection, 'house_totals', 'house_id', house_id, points, 0)
+    for teacher_id, points in teachers.items():
+        _add(connection, 'teacher_totals', 'teacher_id', teacher_id, points, 0)
+
+
+def students_added_bulk(connection, students):
+    """Count many new students at once; `students` holds (house, teacher, points) per student."""
+    houses, teachers = {}, {}
+    for house_id, teacher_id, points in students:
+        for sums, key in ((houses, house_id), (teachers, teacher_id)):
+            previous = sums.get(key, (0, 0))
+            sums[key] = (previous[0] + int(points or 0), previous[1] + 1)
+    for house_id, (points, count) in houses.items():
+        _add(connection, 'house_totals', 'house_id', house_id, points, count)
+    for teacher_id, (points, count) in teachers.items():
+        _add(connection, 'teacher_totals', 'teacher_id', teacher_id, points, count)
+
+
+def teacher_reassigned(connection, from_teacher, to_teacher):
+    row = connection.execute(text(
+        "SELECT points, student_count FROM teacher_totals WHERE teacher_id = :teacher_id" + _for_update(connection)
+    ), {'teacher_id': from_teacher}).fetchone()
+    if row:
+        connection.execute(text("DELETE FROM teacher_totals WHERE teacher_id = :teacher_id"), {'teacher_id': from_teacher})
+        _add(connection, 'teacher_totals', 'teacher_id', to_teacher, row[0], row[1])
+
+
+def points_reset(connection):
+    connection.execute(text("UPDATE house_totals SET points = 0"))
+    connection.execute(text("UPDATE teacher_totals SET points = 0"))
+
+
+def _range_totals(connection, low, high):
+    # Points and student counts per house and teacher of the students with low < id <= high, locked on MariaDB
+    houses, teachers = {}, {}
+    for house_id, teacher_id, points, count in connection.execute(text(
+        "SELECT house, teacher, SUM(points), COUNT(*) FROM students WHERE id > :low AND id <= :high GROUP BY house, teacher" + _for_update(connection)
+    ), {'low': low, 'high': high}):
+        for sums, key in ((houses, house_id), (teachers, teacher_id)):
+            previous = sums.get(key, (0, 0))
+            sums[key] = (previous[0] + int(points or 0), previous[1] + int(count))
+    return houses, teachers
+
+
+def students_removed_range(connection, low, high):
+    """Take the students with low < id <= high out of the totals (call before deleting them)."""
+    houses, teachers = _range_totals(connection, low, high)
+    for house_id, (points, count) in houses.items():
+        _add(connection, 'house_totals', 'house_id', house_id, -points, -count)
+    for teacher_id, (points, count) in teachers.items():
+        _add(connection, 'teacher_totals', 'teacher_id', teacher_id, -points, -count)
+
+
+def points_reset_range(connection, low, high):
+    """Take the points of the students with low < id <= high out of the totals (call before zeroing them)."""
+    houses, teachers = _range_totals(connection, low, high)
+    for house_id, (points, _) in houses.items():
+        _add(connection, 'house_totals', 'house_id', house_id, -points, 0)
+    for teacher_id, (points, _) in teachers.items():
+        _add(connection, 'teacher_totals', 'teacher_id', teacher_id, -points, 0)
+
+
+def compute_totals(connection):
+    houses = {row[0]: (int(row[1] or 0), int(row[2])) for row in connection.execute(text("""
+        SELECT house, SUM(points), COUNT(*) FROM students WHERE house IS NOT NULL GROUP BY house
+    """))}
+    teachers = {row[0]: (int(row[1] or 0), int(row[2])) for row in connection.execute(text("""
+        SELECT teacher, SUM(points), COUNT(*) FROM students WHERE teacher IS NOT NULL GROUP BY teacher
+    """))}
+    return houses, teachers
+
+
+def rebuild_totals(connection):
+    """Recompute both tables from students and return the rows that had drifted.
+
+    Each drift entry is (table, key, stored (points, students), actual (points, students)).
+    """
+    houses, teachers = compute_totals(connection)
+    drift = []
+    for table, key_column, actual in (('house_totals', 'house_id', houses), ('teacher_totals', 'teacher_id', teachers)):
+        stored = {row[0]: (int(row[1]), int(row[2])) for row in connection.execute(text(f"SELECT {key_column}, points, student_count FROM {table}"))}
+        for key in sorted(set(stored) | set(actual)):
+            if stored.get(key, (0, 0)) != actual.get(key, (0, 0)):
+                drift.append((table, key, stored.get(key), actual.get(key)))
+        connection.execute(text(f"DELETE FROM {table}"))
+        if actual:
+            connection.execute(text(f"INSERT INTO {table} ({key_column}, points, student_count) VALUES (:key, :points, :students)"), [
+                {'key': key, 'points': points, 'students': students} for key, (points, students) in actual.items()
+            ])
+    return drift
@@ -0,0 +1,94 @@
+import os
+
+from werkzeug.exceptions import HTTPException
+
+
+def parse_sample_rates(value):
+    """Parse 'get_students=0.01,award_points=0.5' into {endpoint: rate}."""
+    rates = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        endpoint, rate = item.split('=', 1)
+        rates[endpoint.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class RouteSampler:
+    """Sentry traces_sampler that picks the sample rate from the Flask endpoint.
+
+    In order: a continued trace keeps the decision of its parent, preflights and
+    `never` endpoints are not traced, `rates` overrides per endpoint, mutations
+    of `always` endpoints (the admin actions) are always traced, other writes
+    use write_rate and reads use read_rate.
+    """
+
+    def __init__(self, app, rates=None, read_rate=0.01, write_rate=0.1, always=(), never=()):
+        self.app = app
+        self.rates = rates or {}
+        self.read_rate = read_rate
+        self.write_rate = write_rate
+        self.always = set(always)
+        self.never = set(never)
+
+    def _endpoint(self, environ):
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+            return endpoint
+        except HTTPException:
+            return None
+
+    def __call__(self, sampling_context):
+        parent_sampled = sampling_context.get('parent_sampled')
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        environ = sampling_context.get('wsgi_environ')
+        if environ is None:
+            return self.write_rate
+        method = environ.get('REQUEST_METHOD', 'GET')
+        if method == 'OPTIONS':
+            return 0.0
+        endpoint = self._endpoint(environ)
+        if endpoint in self.never:
+            return 0.0
+        if endpoint in self.rates:
+            return self.rates[endpoint]
+        if method in ('GET', 'HEAD'):
+            return self.read_rate
+        return 1.0 if endpoint in self.always else self.write_rate
+
+
+def sentry_options(app, always=(), never=()):
+    """Keyword arguments for sentry_sdk.init, read from the environment.
+
+    Works without SENTRY_DSN: the SDK then records nothing and sends nothing.
+    Errors are always reported (sample_rate 1.0); only performance traces are
+    sampled. SENTRY_PROFILING turns the profiler on: "trace" profiles while a
+    sampled transaction runs, "continuous" profiles the whole process.
+    """
+    from sentry_sdk.integrations.flask import FlaskIntegration
+
+    options = {
+        'dsn': os.getenv('SENTRY_DSN'),
+        'integrations': [FlaskIntegration()],
+        'sample_rate': 1.0,
+        'traces_sampler': RouteSampler(
+            app,
+            rates=parse_sample_rates(os.getenv('SENTRY_TRACES_RATES')),
+            read_rate=float(os.getenv('SENTRY_TRACES_READ_RATE', 0.01)),
+            write_rate=float(os.getenv('SENTRY_TRACES_WRITE_RATE', 0.1)),
+            always=always,
+            never=never,
+        ),
+    }
+    profiling = os.getenv('SENTRY_PROFILING', 'off').strip().lower()
+    if profiling in ('trace', 'continuous'):
+        options['profile_session_sample_rate'] = float(os.getenv('SENTRY_PROFILE_SESSION_SAMPLE_RATE', 1.0))
+        options['profile_lifecycle'] = 'trace' if profiling == 'trace' else 'manual'
+    return options
+
+
+def start_profiler_if_continuous():
+    if os.getenv('SENTRY_PROFILING', 'off').strip().lower() == 'continuous':
+        import sentry_sdk
+        sentry_sdk.profiler.start_profiler()
@@ -220,6 +220,44 @@ export async function getHousePoints(houseId: number, token: string): Promise<nu
     });
 }
 
+export interface HouseStanding {
+    house_id: number;
+    house_name: string;
+    total_points: number;
+    student_count: number;
+    rank: number;
+}
+
+export async function getHouseStandings(token: string): Promise<HouseStanding[]> {
+    return new Promise((resolve, reject) => {
+      $.ajax({
+        url: `${apiUrl}/api/housestandings`,
+        headers: { 'Authorization': `Bearer ${token}` },
+        success: function (result) {
+          resolve(result);
+        },
+        error: function () {
+          reject(new Error("Unable to fetch house standings"));
+        },
+      });
+    });
+}
+
+export interface StandingsUpdate {
+    houses?: HouseStanding[];
+    removed_houses?: number[];
+    top_students?: LeaderboardEntry[];
+    top_teachers?: LeaderboardEntry[];
+}
+
+// Live standings: onUpdate gets the full snapshot first, then only the parts that changed
+export function subscribeStandings(onUpdate: (update: StandingsUpdate, snapshot: boolean) => void): EventSource {
+    const source = new EventSource(`${apiUrl}/api/stream/standings`);
+    source.addEventListener('snapshot', (event) => onUpdate(JSON.parse((event as MessageEvent).data), true));
+    source.addEventListener('delta', (event) => onUpdate(JSON.parse((event as MessageEvent).data), false));
+    return source;
+}
+
 export async function addHousePoints(data: { studentId: string, points: string, reason: string }, token: string): Promise<void> {
     return new Promise((resolve, reject) => {
         $.ajax({
@@ -336,14 +374,55 @@ export async function deleteStudent(userId: number, token: string): Promise<void
 }
 
 
+export interface Job {
+    id: number;
+    kind: string;
+    status: 'queued' | 'running' | 'done' | 'failed' | 'cancelled';
+    processed: number;
+    total: number | null;
+    progress: number;
+    error: string | null;
+    cancel_requested: boolean;
+    duration_seconds: number | null;
+    rows_per_second: number | null;
+}
+
+export async function getJob(token: string, jobId: number): Promise<Job> {
+    return new Promise((resolve, reject) => {
+        $.ajax({
+            url: `${apiUrl}/api/jobs/${jobId}`,
+            method: 'GET',
+            headers: { 'Authorization': `Bearer ${token}` },
+            success: function (result) {
+                resolve(result);
+            },
+            error: function () {
+                reject(new Error("Unable to fetch job status"));
+            },
+        });
+    });
+}
+
+// Clearing points and deleting all students run as background jobs; resolves once the job is done
+export async function waitForJob(token: string, jobId: number, onProgress?: (job: Job) => void): Promise<void> {
+    for (;;) {
+        const job = await getJob(token, jobId);
+        onProgress?.(job);
+        if (job.status === 'done') return;
+        if (job.status === 'failed') throw new Error(job.error || "Job failed");
+        if (job.status === 'cancelled') throw new Error("Job was cancelled");
+        await new Promise(resolve => setTimeout(resolve, 1000));
+    }
+}
+
 export async function clearAllHousePoints(token: string): Promise<void> {
     return new Promise((resolve, reject) => {
         $.ajax({
             url: `${apiUrl}/api/clearhousepoints`,
             method: 'POST',
             headers: { 'Authorization': `Bearer ${token}` },
-            success: function () {
-                resolve();
+            success: function (result) {
+                waitForJob(token, result.job_id).then(resolve, reject);
             },
             error: function () {
                 reject(new Error("Unable to clear house points"));
@@ -358,8 +437,8 @@ export async function deleteAllStudents(token: string): Promise<void> {
             url: `${apiUrl}/api/deleteallstudents`,
             method: 'DELETE',
             headers: { 'Authorization': `Bearer ${token}` },
-            success: function () {
-                resolve();
+            success: function (result) {
+                waitForJob(token, result.job_id).then(resolve, reject);
             },
             error: function () {
                 reject(new Error("Unable to delete all students"));
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react'
 import BigNumberCard from "@/components/big-number-card"
 import LeaderboardCard from '@/components/leaderboard-card'
-import { getAllHouses, House as OriginalHouse, getHousePoints, getTopTeachers, getTopStudents, LeaderboardEntry } from '@/lib/api'
+import { getHouseStandings, House as OriginalHouse, getTopTeachers, getTopStudents, LeaderboardEntry, subscribeStandings, StandingsUpdate } from '@/lib/api'
 
 type House = OriginalHouse & { points: number }
 import useToken from '@/components/useToken'
@@ -18,13 +18,9 @@ export default function Home_Page() {
         async function fetchData() {
             if (token) {
                 setLoading(true)
-                const houses = await getAllHouses(token)
-                
-                const housesWithPoints = await Promise.all(houses.map(async (house) => {
-                    const points = await getHousePoints(house.id, token)
-                    return { ...house, points }
-                }))
-                housesWithPoints.sort((a, b) => b.points - a.points) // Sort houses by points
+                // Standings come back already sorted by points
+                const standings = await getHouseStandings(token)
+                const housesWithPoints = standings.map(house => ({ id: house.house_id, name: house.house_name, points: house.total_points }))
                 const [teachers, students] = await Promise.all([
                     getTopTeachers(token),
                     getTopStudents(token)
@@ -38,6 +34,23 @@ export default function Home_Page() {
         fetchData()
     }, [token])
 
+    useEffect(() => {
+        if (!token) return
+        const source = subscribeStandings((update: StandingsUpdate, snapshot: boolean) => {
+            if (update.houses || update.removed_houses) {
+                setHouses(current => {
+                    const byId = new Map(snapshot ? [] : current.map(house => [house.id, house]))
+                    update.houses?.forEach(house => byId.set(house.house_id, { id: house.house_id, name: house.house_name, points: house.total_points }))
+                    update.removed_houses?.forEach(id => byId.delete(id))
+                    return [...byId.values()].sort((a, b) => b.points - a.points)
+                })
+            }
+            if (update.top_students) setTopStudents(update.top_students)
+            if (update.top_teachers) setTopTeachers(update.top_teachers)
+        })
+        return () => source.close()
+    }, [token])
+
     return (
         <div className="p-4 md:p-8 lg:p-12">
             <h1 className="text-2xl font-bold mb-4">Dashboard</h1>